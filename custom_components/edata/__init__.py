@@ -6,7 +6,19 @@ import logging
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 
-from .const import DOMAIN
+from . import utils
+from .const import (
+    CONF_AGGREGATE,
+    CONF_LOOP_WATCHDOG,
+    CONF_QUARTER_HOURLY,
+    CONF_RETENTION,
+    CONF_SCUPS,
+    DATA_COORDINATOR,
+    DEFAULT_LOOP_WATCHDOG_MS,
+    DEFAULT_RETENTION_MONTHS,
+    DOMAIN,
+)
+from .watchdog import WATCHDOG
 
 PLATFORMS: list[str] = ["sensor"]
 _LOGGER = logging.getLogger(__name__)
@@ -19,6 +31,15 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     unsub_options_update_listener = entry.add_update_listener(options_update_listener)
     entry.async_on_unload(unsub_options_update_listener)
 
+    WATCHDOG.configure(
+        entry.entry_id,
+        entry.options.get(CONF_LOOP_WATCHDOG, DEFAULT_LOOP_WATCHDOG_MS),
+    )
+    entry.async_on_unload(lambda: WATCHDOG.configure(entry.entry_id, 0))
+
+    # platforms and services import these where first used, in the event loop
+    await utils.async_import_deferred(hass)
+
     hass.async_create_task(
         hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     )
@@ -41,4 +62,31 @@ async def async_remove_entry(hass, entry) -> None:
 
 async def options_update_listener(hass: HomeAssistant, config_entry: ConfigEntry):
     """Handle options update."""
-    await hass.config_entries.async_reload(config_entry.entry_id)
+    WATCHDOG.configure(
+        config_entry.entry_id,
+        config_entry.options.get(CONF_LOOP_WATCHDOG, DEFAULT_LOOP_WATCHDOG_MS),
+    )
+
+    coordinator = (
+        hass.data.get(DOMAIN, {})
+        .get(config_entry.data.get(CONF_SCUPS, "").upper(), {})
+        .get(DATA_COORDINATOR)
+    )
+    if (
+        coordinator is None
+        or coordinator.quarter_hourly
+        != config_entry.options.get(CONF_QUARTER_HOURLY, False)
+        or coordinator.aggregate != config_entry.options.get(CONF_AGGREGATE, False)
+    ):
+        await hass.config_entries.async_reload(config_entry.entry_id)
+        return
+
+    retention = config_entry.options.get(CONF_RETENTION, DEFAULT_RETENTION_MONTHS)
+    if retention != coordinator.retention_months:
+        coordinator.retention_months = retention
+        await coordinator.async_apply_retention(force=True)
+
+    # pricing changes are applied in place to keep in-memory data and api quota
+    await coordinator.async_set_billing(
+        utils.get_billing_from_options(config_entry.options)
+    )
@@ -0,0 +1,323 @@
+"""Incremental aggregates for e-data"""
+from __future__ import annotations
+
+import logging
+from collections.abc import Iterable, Sequence
+from datetime import datetime, timedelta
+
+from edata.definitions import ATTRIBUTES
+
+from .prices import EdataPriceCache
+
+_LOGGER = logging.getLogger(__name__)
+
+CONSUMPTION_KEYS = ("kWh", "p1_kWh", "p2_kWh", "p3_kWh")
+
+
+def month_start(a_datetime: datetime) -> datetime:
+    """Return the first instant of a datetime's month"""
+    return a_datetime.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def month_key(a_datetime: datetime) -> str:
+    """Return the identifier of a datetime's month, as used by stored data"""
+    return a_datetime.strftime("%Y-%m")
+
+
+def next_month(a_datetime: datetime) -> datetime:
+    """Return the first instant of the month after a datetime's month"""
+    return month_start(month_start(a_datetime) + timedelta(days=32))
+
+
+def bisect_datetime(series: Sequence[dict], a_datetime: datetime, lo: int = 0) -> int:
+    """Return the index of the first item not older than a datetime"""
+
+    hi = len(series)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if series[mid]["datetime"] < a_datetime:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def find_datetime(series: Sequence[dict], a_datetime: datetime) -> dict | None:
+    """Find the item of a sorted series at a given datetime"""
+
+    idx = bisect_datetime(series, a_datetime)
+    if idx < len(series) and series[idx]["datetime"] == a_datetime:
+        return series[idx]
+    return None
+
+
+def splice(
+    series: Sequence[dict], start: datetime, end: datetime, items: list[dict]
+) -> list[dict]:
+    """Replace the items of a sorted series within [start, end) by new ones"""
+
+    lo = bisect_datetime(series, start)
+    hi = bisect_datetime(series, end, lo)
+    return list(series[:lo]) + items + list(series[hi:])
+
+
+def aggregate_consumptions(
+    consumptions: Iterable[dict],
+) -> tuple[list[dict], list[dict]]:
+    """Sum hourly consumptions into daily and monthly totals by tariff period"""
+    # pylint: disable=import-outside-toplevel
+    from edata.processors import utils
+
+    daily = {}
+    monthly = {}
+    for item in consumptions:
+        tariff = utils.get_pvpc_tariff(item["datetime"])
+        day = item["datetime"].replace(hour=0, minute=0, second=0)
+        for aggr, key in ((daily, day), (monthly, day.replace(day=1))):
+            if key not in aggr:
+                aggr[key] = {
+                    "datetime": key,
+                    "delta_h": 0,
+                    "value_kWh": 0,
+                    "value_p1_kWh": 0,
+                    "value_p2_kWh": 0,
+                    "value_p3_kWh": 0,
+                }
+            aggr[key]["delta_h"] += item["delta_h"]
+            aggr[key]["value_kWh"] += item["value_kWh"]
+            aggr[key][f"value_{tariff}_kWh"] += item["value_kWh"]
+
+    def _round(lst):
+        return [
+            {k: round(v, 2) if k != "datetime" else v for k, v in x.items()}
+            for x in lst
+        ]
+
+    return _round(daily.values()), _round(monthly.values())
+
+
+class EdataAggregator:
+    """Keep EdataHelper aggregates and attributes up to date, month by month
+
+    EdataHelper.process_data() rebuilds every aggregate from the whole hourly
+    series; here only the months touched by new consumptions are processed
+    again, and the remaining ones are kept as they are. Touched months stay
+    dirty until they are processed without errors, and are meant to be
+    stored along with the data so that they survive a restart.
+    """
+
+    def __init__(
+        self, edata_helper, prices: EdataPriceCache, dirty: Iterable[datetime] = ()
+    ) -> None:
+        self._edata = edata_helper
+        self._prices = prices
+        self.dirty: set[datetime] = set(dirty)
+
+    def process(
+        self, new_consumptions: Iterable[dict] = (), rebuild_costs: bool = False
+    ) -> None:
+        """Update aggregates of dirty months, including those of new consumptions"""
+
+        edata = self._edata
+        for process_method in (
+            edata.process_supplies,
+            edata.process_contracts,
+            edata.process_maximeter,
+        ):
+            try:
+                process_method()
+            except Exception as ex:  # pylint: disable=broad-except
+                _LOGGER.error("Unhandled exception while updating attributes")
+                _LOGGER.exception(ex)
+
+        self.dirty.update(month_start(x["datetime"]) for x in new_consumptions)
+        try:
+            all_months = self._months(edata.data["consumptions"])
+            months = set(self.dirty)
+            if len(all_months) > 0:
+                # the oldest month may have been trimmed out of the window
+                months.add(all_months[0])
+                # dirty months trimmed out of the window are gone
+                self.dirty.difference_update(
+                    [x for x in self.dirty if x < all_months[0]]
+                )
+            # months lacking aggregates (e.g., stored by older versions)
+            months.update(
+                x
+                for x in all_months
+                if find_datetime(edata.data["consumptions_monthly_sum"], x) is None
+            )
+
+            self._prune(all_months[0] if len(all_months) > 0 else None)
+            for month in sorted(months):
+                try:
+                    self._process_consumptions(month)
+                    done = True
+                    if edata.enable_billing and not rebuild_costs:
+                        done = self._process_costs(month)
+                except Exception as ex:  # pylint: disable=broad-except
+                    _LOGGER.error("Unhandled exception while aggregating %s", month)
+                    _LOGGER.exception(ex)
+                else:
+                    # months lacking prices are billed once these are fetched
+                    if done:
+                        self.dirty.discard(month)
+                    else:
+                        self.dirty.add(month)
+            if edata.enable_billing and rebuild_costs:
+                for month in all_months:
+                    if not self._process_costs(month):
+                        self.dirty.add(month)
+            self._update_attributes()
+        except Exception as ex:  # pylint: disable=broad-except
+            _LOGGER.error("Unhandled exception while updating aggregates")
+            _LOGGER.exception(ex)
+
+        for attribute in edata.attributes:
+            if attribute in ATTRIBUTES and ATTRIBUTES[attribute] is not None:
+                edata.attributes[attribute] = (
+                    round(edata.attributes[attribute], 2)
+                    if edata.attributes[attribute] is not None
+                    else None
+                )
+
+    @staticmethod
+    def _months(series: Sequence[dict]) -> list[datetime]:
+        """List the months of a sorted series, jumping from one to the next"""
+
+        months = []
+        idx = 0
+        while idx < len(series):
+            month = month_start(series[idx]["datetime"])
+            months.append(month)
+            idx = bisect_datetime(series, next_month(month), idx)
+        return months
+
+    def _month_items(self, key: str, month: datetime) -> Sequence[dict]:
+        """Get the items of a sorted series within a month"""
+
+        series = self._edata.data[key]
+        lo = bisect_datetime(series, month)
+        return series[lo : bisect_datetime(series, next_month(month), lo)]
+
+    def _prune(self, oldest: datetime | None) -> None:
+        """Drop aggregates older than the oldest month with consumptions"""
+
+        data = self._edata.data
+        for key in (
+            "consumptions_daily_sum",
+            "consumptions_monthly_sum",
+            "cost_hourly_sum",
+            "cost_daily_sum",
+            "cost_monthly_sum",
+        ):
+            if oldest is None:
+                data[key] = []
+            elif len(data[key]) > 0 and data[key][0]["datetime"] < oldest:
+                data[key] = list(data[key][bisect_datetime(data[key], oldest) :])
+
+    def _process_consumptions(self, month: datetime) -> None:
+        """Recompute daily and monthly consumptions of a month"""
+
+        data = self._edata.data
+        end = next_month(month)
+        daily, monthly = aggregate_consumptions(
+            self._month_items("consumptions", month)
+        )
+        data["consumptions_daily_sum"] = splice(
+            data["consumptions_daily_sum"], month, end, daily
+        )
+        data["consumptions_monthly_sum"] = splice(
+            data["consumptions_monthly_sum"], month, end, monthly
+        )
+
+    def _process_costs(self, month: datetime) -> bool:
+        """Recompute hourly, daily and monthly costs of a month
+
+        Returns False if the month could not be billed for lack of PVPC prices.
+        """
+        # pylint: disable=import-outside-toplevel
+        from edata.processors.billing import BillingInput, BillingProcessor
+
+        edata = self._edata
+        end = next_month(month)
+        consumptions = self._month_items("consumptions", month)
+        prices = None
+        if edata.is_pvpc:
+            prices = self._prices.get(month, end)
+        if len(consumptions) == 0:
+            return True
+        if prices is not None and len(prices) == 0:
+            return False
+
+        # costs are hourly, so billing a month apart yields the same figures
+        output = BillingProcessor(
+            BillingInput(
+                contracts=edata.data["contracts"],
+                consumptions=list(consumptions),
+                prices=prices,
+                rules=edata.pricing_rules,
+            )
+        ).output
+        for key, series in (
+            ("cost_hourly_sum", "hourly"),
+            ("cost_daily_sum", "daily"),
+            ("cost_monthly_sum", "monthly"),
+        ):
+            edata.data[key] = splice(edata.data[key], month, end, output[series])
+        return True
+
+    def _update_attributes(self) -> None:
+        """Derive attributes from aggregates, as EdataHelper does"""
+
+        edata = self._edata
+        data = edata.data
+        attrs = edata.attributes
+        if len(data["consumptions"]) == 0:
+            return
+
+        today = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+        this_month = today.replace(day=1)
+        last_month = month_start(this_month - timedelta(days=1))
+        attrs["last_registered_date"] = data["consumptions"][-1]["datetime"]
+
+        daily = data["consumptions_daily_sum"]
+        for prefix, day in (
+            ("yesterday", today - timedelta(days=1)),
+            (
+                "last_registered_day",
+                attrs["last_registered_date"].replace(hour=0, minute=0, second=0),
+            ),
+        ):
+            item = find_datetime(daily, day)
+            for key in CONSUMPTION_KEYS:
+                attrs[f"{prefix}_{key}"] = (
+                    item.get(f"value_{key}") if item is not None else None
+                )
+            attrs[f"{prefix}_hours"] = item.get("delta_h") if item is not None else None
+
+        monthly = data["consumptions_monthly_sum"]
+        for prefix, month in (("month", this_month), ("last_month", last_month)):
+            item = find_datetime(monthly, month)
+            for key in CONSUMPTION_KEYS:
+                attrs[f"{prefix}_{key}"] = (
+                    item.get(f"value_{key}") if item is not None else None
+                )
+            attrs[f"{prefix}_days"] = (
+                item.get("delta_h", 0) / 24 if item is not None else None
+            )
+            attrs[f"{prefix}_daily_kWh"] = (
+                (
+                    attrs[f"{prefix}_kWh"] / attrs[f"{prefix}_days"]
+                    if attrs[f"{prefix}_days"] > 0
+                    else 0
+                )
+                if item is not None
+                else None
+            )
+
+        if edata.enable_billing:
+            for attr, month in (("month_€", this_month), ("last_month_€", last_month)):
+                item = find_datetime(data["cost_monthly_sum"], month)
+                if item is not None:
+                    attrs[attr] = item.get("value_eur")
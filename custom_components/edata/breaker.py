@@ -0,0 +1,196 @@
+"""Per account circuit breaker for Datadis requests"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+
+from . import const
+from .storage import async_get_store
+
+_LOGGER = logging.getLogger(__name__)
+
+# consecutive failures before the breaker opens (a 429 opens it at once)
+FAILURE_THRESHOLD = 3
+BASE_BACKOFF = timedelta(hours=1)
+# datadis quotas are daily, so waiting longer than a day brings nothing
+MAX_BACKOFF = timedelta(hours=24)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+def backoff(opens: int) -> timedelta:
+    """Return a jittered exponential backoff after a number of consecutive opens"""
+
+    delay = min(BASE_BACKOFF * 2 ** max(opens - 1, 0), MAX_BACKOFF)
+    # equal jitter, so that accounts opened together do not probe together
+    return delay / 2 + delay / 2 * random.random()
+
+
+class DatadisBreaker:
+    """Circuit breaker of a Datadis account
+
+    Closed, requests flow and failures are counted. Open, requests are skipped
+    until the backoff expires. Half open, a single probe request decides
+    whether it closes again or reopens with a longer backoff. Outcomes may be
+    recorded from executor threads.
+    """
+
+    def __init__(self, breakers: DatadisBreakers, key: str) -> None:
+        self._breakers = breakers
+        self.key = key
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opens = 0
+        self.retry_at: datetime | None = None
+        self._probing = False
+
+    async def async_load(self) -> None:
+        """Make sure that the stored state has been restored"""
+        await self._breakers.async_load()
+
+    @property
+    def state(self) -> str:
+        """Return the breaker state"""
+        if self.retry_at is None:
+            return STATE_CLOSED
+        if datetime.now() < self.retry_at:
+            return STATE_OPEN
+        return STATE_HALF_OPEN
+
+    def allow_request(self) -> bool:
+        """Return whether regular requests may be sent"""
+        return self.state == STATE_CLOSED
+
+    def try_probe(self) -> bool:
+        """Claim the single probe request of a half open breaker"""
+
+        with self._lock:
+            if self.state != STATE_HALF_OPEN or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def end_probe(self) -> None:
+        """Release the probe claim, reopening if it recorded no outcome"""
+
+        if self._probing and self.state == STATE_HALF_OPEN:
+            self.record_failure()
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        """Record a successful request"""
+
+        with self._lock:
+            if self.failures == 0 and self.retry_at is None:
+                return
+            if self.retry_at is not None:
+                _LOGGER.info("Datadis is reachable again, resuming requests")
+            self.failures = 0
+            self.opens = 0
+            self.retry_at = None
+            self._probing = False
+        self._breakers.schedule_save()
+
+    def record_failure(self, quota: bool = False) -> None:
+        """Record a failed request, opening the breaker when needed"""
+
+        with self._lock:
+            if self.state == STATE_OPEN:
+                # late replies of requests sent before opening
+                return
+            self.failures += 1
+            if quota or self._probing or self.failures >= FAILURE_THRESHOLD:
+                self.opens += 1
+                self.failures = 0
+                self.retry_at = datetime.now() + backoff(self.opens)
+                self._probing = False
+                _LOGGER.warning(
+                    "Datadis requests paused until %s (%s)",
+                    self.retry_at.isoformat(timespec="minutes"),
+                    "quota exceeded" if quota else "repeated failures",
+                )
+        self._breakers.schedule_save()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return a JSON friendly summary"""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opens": self.opens,
+            "retry_at": self.retry_at.isoformat()
+            if self.retry_at is not None
+            else None,
+        }
+
+    def restore(self, data: dict[str, Any]) -> None:
+        """Restore a summary built by as_dict"""
+        self.failures = data.get("failures", 0)
+        self.opens = data.get("opens", 0)
+        self.retry_at = (
+            datetime.fromisoformat(data["retry_at"])
+            if data.get("retry_at") is not None
+            else None
+        )
+
+
+class DatadisBreakers:
+    """Circuit breakers of every account, persisted in a single Store"""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._breakers: dict[str, DatadisBreaker] = {}
+        self._store = async_get_store(hass, "breakers")
+        self._stored: dict[str, dict] | None = None
+
+    def get(self, username: str) -> DatadisBreaker:
+        """Get the breaker of an account"""
+
+        # usernames are personal ids, so they are not stored as they are
+        key = hashlib.sha256(username.lower().encode()).hexdigest()[:16]
+        if key not in self._breakers:
+            self._breakers[key] = DatadisBreaker(self, key)
+            if self._stored is not None and key in self._stored:
+                self._breakers[key].restore(self._stored[key])
+        return self._breakers[key]
+
+    async def async_load(self) -> None:
+        """Restore stored breaker states, once"""
+
+        if self._stored is not None:
+            return
+        self._stored = await self._store.async_load() or {}
+        for key, breaker in self._breakers.items():
+            if key in self._stored:
+                breaker.restore(self._stored[key])
+
+    def schedule_save(self) -> None:
+        """Schedule a save of every breaker state, from any thread"""
+        self.hass.loop.call_soon_threadsafe(self._async_schedule_save)
+
+    @callback
+    def _async_schedule_save(self) -> None:
+        self._store.async_delay_save(
+            lambda: {
+                **(self._stored or {}),
+                **{x: y.as_dict() for x, y in self._breakers.items()},
+            },
+            const.STORAGE_SAVE_DELAY,
+        )
+
+
+@callback
+def async_get_breaker(hass: HomeAssistant, username: str) -> DatadisBreaker:
+    """Get the breaker of an account, shared by every supply of the account"""
+
+    if const.DATA_BREAKERS not in hass.data:
+        hass.data[const.DATA_BREAKERS] = DatadisBreakers(hass)
+    return hass.data[const.DATA_BREAKERS].get(username)
@@ -5,7 +5,6 @@ import logging
 from typing import Any
 
 import voluptuous as vol
-from edata.connectors.datadis import DatadisConnector
 from homeassistant import config_entries
 from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
 from homeassistant.core import HomeAssistant, callback
@@ -53,7 +52,13 @@ async def validate_input(hass: HomeAssistant, data: dict[str, Any]) -> dict[str,
         if hass.data.get(const.DOMAIN, {}).get(scups) is None:
             break
 
-    api = DatadisConnector(data[CONF_USERNAME], data[CONF_PASSWORD])
+    # deferred so that rendering the form does not load the whole connector
+    await utils.async_import_deferred(hass, ("edata.connectors.datadis",))
+    from .connector import make_connector  # pylint: disable=import-outside-toplevel
+
+    api = make_connector(
+        data[CONF_USERNAME], data[CONF_PASSWORD], utils.get_datadis_url()
+    )
     result = await hass.async_add_executor_job(api.login)
     if not result:
         raise InvalidCredentials
@@ -144,6 +149,32 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                         const.CONF_PVPC,
                         default=self.config_entry.options.get(const.CONF_PVPC, False),
                     ): bool,
+                    vol.Required(
+                        const.CONF_RETENTION,
+                        default=self.config_entry.options.get(
+                            const.CONF_RETENTION, const.DEFAULT_RETENTION_MONTHS
+                        ),
+                    ): vol.All(
+                        vol.Coerce(int), vol.Range(min=const.MIN_RETENTION_MONTHS)
+                    ),
+                    vol.Required(
+                        const.CONF_QUARTER_HOURLY,
+                        default=self.config_entry.options.get(
+                            const.CONF_QUARTER_HOURLY, False
+                        ),
+                    ): bool,
+                    vol.Required(
+                        const.CONF_AGGREGATE,
+                        default=self.config_entry.options.get(
+                            const.CONF_AGGREGATE, False
+                        ),
+                    ): bool,
+                    vol.Required(
+                        const.CONF_LOOP_WATCHDOG,
+                        default=self.config_entry.options.get(
+                            const.CONF_LOOP_WATCHDOG, const.DEFAULT_LOOP_WATCHDOG_MS
+                        ),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=0)),
                 }
             ),
         )
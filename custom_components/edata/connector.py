@@ -0,0 +1,63 @@
+"""Datadis connector pointed to another server (e.g., scripts/fake_datadis.py)
+
+Imported where first used, as the connector module is deferred.
+"""
+from __future__ import annotations
+
+import logging
+
+import requests
+from edata.connectors import datadis
+
+_LOGGER = logging.getLogger(__name__)
+
+DATADIS_ORIGIN = "https://datadis.es"
+
+
+def redirect_url(url: str, base_url: str | None) -> str:
+    """Point a connector URL to another server, if any"""
+
+    if base_url is None or not url.startswith(DATADIS_ORIGIN):
+        return url
+    return base_url.rstrip("/") + url[len(DATADIS_ORIGIN) :]
+
+
+class RedirectedDatadisConnector(datadis.DatadisConnector):
+    """DatadisConnector sending its queries, and logins, to another server"""
+
+    def __init__(self, username: str, password: str, base_url: str, **kwargs) -> None:
+        super().__init__(username, password, **kwargs)
+        self.base_url = base_url
+
+    def _get_token(self):
+        """Fetch a new token from the other server, as the connector does"""
+
+        self._session = requests.Session()
+        response = self._session.post(
+            redirect_url(datadis.URL_TOKEN, self.base_url),
+            data={
+                datadis.TOKEN_USERNAME: self._usr.encode("utf-8"),
+                datadis.TOKEN_PASSWD: self._pwd.encode("utf-8"),
+            },
+        )
+        if response.status_code != 200:
+            _LOGGER.error("Unknown error while retrieving token, got %s", response.text)
+            return False
+        self._token["encoded"] = response.text
+        self._session.headers["Authorization"] = "Bearer " + self._token["encoded"]
+        return True
+
+    def _send_cmd(self, url: str, *args, **kwargs):
+        """Send a query to the other server"""
+        return super()._send_cmd(redirect_url(url, self.base_url), *args, **kwargs)
+
+
+def make_connector(
+    username: str, password: str, base_url: str | None = None
+) -> datadis.DatadisConnector:
+    """Build a Datadis connector, pointed to base_url if given"""
+
+    if base_url is None:
+        return datadis.DatadisConnector(username, password)
+    _LOGGER.warning("Datadis queries of %s go to %s", username, base_url)
+    return RedirectedDatadisConnector(username, password, base_url)
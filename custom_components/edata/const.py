@@ -3,12 +3,22 @@
 DOMAIN = "edata"
 STORAGE_KEY_PREAMBLE = f"{DOMAIN}.storage"
 STORAGE_VERSION = 1
+# seconds to wait before writing, so that close updates share a single write
+STORAGE_SAVE_DELAY = 30
 STORAGE_ELEMENTS = ["supplies", "contracts"]
 
+DEFAULT_BACKFILL_YEARS = 2
+DEFAULT_RETENTION_MONTHS = 24
+MIN_RETENTION_MONTHS = 12
+DEFAULT_LOOP_WATCHDOG_MS = 0
+
 STATE_LOADING = "loading"
 STATE_ERROR = "error"
 STATE_READY = "ready"
 
+# supported feature of the main supply sensor, the target of entity services
+FEATURE_SUPPLY_SERVICES = 1
+
 # Custom configuration entries
 CONF_CUPS = "cups"
 CONF_SCUPS = "scups"
@@ -19,6 +29,10 @@ CONF_BILLING = "billing"
 CONF_PVPC = "pvpc"
 CONF_WIPE = "wipe_data"
 CONF_AUTHORIZEDNIF = "authorized_nif"
+CONF_RETENTION = "hourly_retention_months"
+CONF_LOOP_WATCHDOG = "loop_watchdog_ms"
+CONF_QUARTER_HOURLY = "quarter_hourly"
+CONF_AGGREGATE = "include_in_aggregate"
 
 # pricing settings
 PRICE_P1_KW_YEAR = "p1_kw_year_eur"
@@ -45,12 +59,30 @@ DATA_STATE = "state"
 DATA_ATTRIBUTES = "attributes"
 DATA_SUPPLIES = "supplies"
 DATA_CONTRACTS = "contracts"
+DATA_COORDINATOR = "coordinator"
+# hass.data key of the per account circuit breakers
+DATA_BREAKERS = f"{DOMAIN}_breakers"
+DATA_SEMAPHORES = f"{DOMAIN}_semaphores"
+# hass.data key of the long-lived stores
+DATA_STORES = f"{DOMAIN}_stores"
+DATA_VIRTUAL_SUPPLY = f"{DOMAIN}_virtual_supply"
+DATA_PRICES = f"{DOMAIN}_prices"
+
+# supplies opted in are combined into a virtual one, e.g., edata:aggregate_consumption
+VIRTUAL_SUPPLY_ID = "aggregate"
 
 WS_CONSUMPTIONS_HOUR = "ws_consumptions_hour"
+# quarter-hour consumptions are not kept in memory, this caps what is served
+WS_QUARTERS_MAX_DAYS = 31
 WS_CONSUMPTIONS_DAY = "ws_consumptions_day"
 WS_CONSUMPTIONS_MONTH = "ws_consumptions_month"
 WS_MAXIMETER = "ws_maximeter"
 
+EVENT_UPDATE_PROFILE = f"{DOMAIN}_update_profile"
+
+# points the fetchers to another Datadis server (e.g., scripts/fake_datadis.py)
+ENV_DATADIS_URL = "EDATA_DATADIS_URL"
+
 COORDINATOR_ID = lambda scups: f"{DOMAIN}_{scups}"
 
 STAT_TITLE_KWH = lambda id, scope: f"{id.upper()} {scope} consumption"
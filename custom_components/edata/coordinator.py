@@ -1,25 +1,52 @@
 """Data update coordinator definitions"""
 from __future__ import annotations
 
+import asyncio
+import functools
 import json
 import logging
 import os
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
+from collections.abc import AsyncIterator, Iterable
+from datetime import date, datetime, timedelta
+from typing import Any
 
-from edata.connectors.datadis import RECENT_QUERIES_FILE
 from edata.definitions import ATTRIBUTES, PricingRules
-from edata.helpers import EdataHelper
-from edata.processors import utils
 from homeassistant.core import HomeAssistant
-from homeassistant.helpers.storage import Store
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
 
-from . import const
+from . import const, utils
+from .aggregates import EdataAggregator, bisect_datetime
+from .fetcher import (
+    MAX_CONCURRENT_REQUESTS,
+    OUTCOME_EMPTY,
+    OUTCOME_OK,
+    EdataFetcher,
+    chunks_within,
+    merge_by_datetime,
+)
+from .files import (
+    EXPORT_COLUMNS,
+    EdataFileWriter,
+    iter_datadis_file,
+    missing_module,
+)
+from .history import EdataHistory, month_key
+from .prices import async_get_price_cache
+from .profiling import UpdateProfile, UpdateProfiles
+from .quarters import EdataQuarters
+from .series import compact_data, estimate_nbytes, expand_data
 from .stats import EdataStatistics
+from .storage import async_get_store
+from .virtual_supply import async_get_virtual_supply
+from .watchdog import watched
 
 _LOGGER = logging.getLogger(__name__)
 
+BILLING_ATTRIBUTES = ("month_€", "last_month_€")
+# stored along with the supply data
+DIRTY_MONTHS_KEY = "dirty_months"
+
 
 class EdataCoordinator(DataUpdateCoordinator):
     """Handle Datadis data and statistics."""
@@ -34,38 +61,17 @@ class EdataCoordinator(DataUpdateCoordinator):
         authorized_nif: str,
         billing: dict[str, float] = None,
         prev_data=None,
+        retention_months: int = const.DEFAULT_RETENTION_MONTHS,
+        quarter_hourly: bool = False,
+        aggregate: bool = False,
+        datadis_url: str | None = None,
     ) -> None:
         """Initialize the data handler."""
         self.hass = hass
         self.reset = prev_data is None
 
         self._experimental = False
-        self._billing = None
-        if billing is not None:
-            if billing.get(const.CONF_PVPC, False):
-                self._billing = PricingRules(
-                    p1_kw_year_eur=billing[const.PRICE_P1_KW_YEAR],
-                    p2_kw_year_eur=billing[const.PRICE_P2_KW_YEAR],
-                    meter_month_eur=billing[const.PRICE_METER_MONTH],
-                    market_kw_year_eur=billing[const.PRICE_MARKET_KW_YEAR],
-                    electricity_tax=billing[const.PRICE_ELECTRICITY_TAX],
-                    iva_tax=billing[const.PRICE_IVA],
-                    p1_kwh_eur=None,
-                    p2_kwh_eur=None,
-                    p3_kwh_eur=None,
-                )
-            else:
-                self._billing = PricingRules(
-                    p1_kw_year_eur=billing[const.PRICE_P1_KW_YEAR],
-                    p2_kw_year_eur=billing[const.PRICE_P2_KW_YEAR],
-                    p1_kwh_eur=billing[const.PRICE_P1_KWH],
-                    p2_kwh_eur=billing[const.PRICE_P2_KWH],
-                    p3_kwh_eur=billing[const.PRICE_P3_KWH],
-                    meter_month_eur=billing[const.PRICE_METER_MONTH],
-                    market_kw_year_eur=billing[const.PRICE_MARKET_KW_YEAR],
-                    electricity_tax=billing[const.PRICE_ELECTRICITY_TAX],
-                    iva_tax=billing[const.PRICE_IVA],
-                )
+        self._billing = self._build_pricing_rules(billing)
 
         self.cups = cups.upper()
         self.authorized_nif = authorized_nif
@@ -74,7 +80,11 @@ class EdataCoordinator(DataUpdateCoordinator):
         # init data shared store
         hass.data[const.DOMAIN][self.id.upper()] = {}
 
-        # the api object
+        # the api object (edata.helpers pulls pandas, so it is imported on first use)
+        from edata.helpers import (  # pylint: disable=import-outside-toplevel
+            EdataHelper,
+        )
+
         self._datadis = EdataHelper(
             username,
             password,
@@ -84,6 +94,33 @@ class EdataCoordinator(DataUpdateCoordinator):
             data=prev_data,
         )
 
+        self._prices = async_get_price_cache(hass)
+        self._aggregator = EdataAggregator(
+            self._datadis,
+            self._prices,
+            (
+                datetime.fromisoformat(x)
+                for x in (prev_data or {}).get(DIRTY_MONTHS_KEY, [])
+            ),
+        )
+        self.history = EdataHistory(hass, self.id)
+        self.quarters = EdataQuarters(hass, self.id)
+        self.quarter_hourly = quarter_hourly
+        self._store = async_get_store(hass, self.id.upper())
+        self.retention_months = retention_months
+        self._retention_checked = None
+        self._statistics_lock = asyncio.Lock()
+        self.profiles = UpdateProfiles()
+        self._fetcher = EdataFetcher(
+            hass,
+            self._datadis,
+            username,
+            self.cups,
+            self.authorized_nif,
+            quarters=self.quarters if quarter_hourly else None,
+            base_url=datadis_url,
+        )
+
         # shared storage
         # making self._data to reference hass.data[const.DOMAIN][self.id.upper()] so we can use it like an alias
         self._data = hass.data[const.DOMAIN][self.id.upper()]
@@ -94,12 +131,13 @@ class EdataCoordinator(DataUpdateCoordinator):
             }
         )
 
-        if prev_data is not None:
-            self._load_data(preprocess=True)
-
         self.statistics = EdataStatistics(
             self.hass, self.id, self._billing is not None, self.reset, self._datadis
         )
+        self.aggregate = aggregate
+        self._virtual_supply = async_get_virtual_supply(hass)
+        if aggregate:
+            self.statistics.virtual_supply = self._virtual_supply
         super().__init__(
             hass,
             _LOGGER,
@@ -107,6 +145,441 @@ class EdataCoordinator(DataUpdateCoordinator):
             update_interval=timedelta(minutes=60),
         )
 
+    @staticmethod
+    def _build_pricing_rules(billing: dict[str, float] | None) -> PricingRules | None:
+        """Build edata PricingRules from billing settings"""
+
+        if billing is None:
+            return None
+
+        if billing.get(const.CONF_PVPC, False):
+            return PricingRules(
+                p1_kw_year_eur=billing[const.PRICE_P1_KW_YEAR],
+                p2_kw_year_eur=billing[const.PRICE_P2_KW_YEAR],
+                meter_month_eur=billing[const.PRICE_METER_MONTH],
+                market_kw_year_eur=billing[const.PRICE_MARKET_KW_YEAR],
+                electricity_tax=billing[const.PRICE_ELECTRICITY_TAX],
+                iva_tax=billing[const.PRICE_IVA],
+                p1_kwh_eur=None,
+                p2_kwh_eur=None,
+                p3_kwh_eur=None,
+            )
+
+        return PricingRules(
+            p1_kw_year_eur=billing[const.PRICE_P1_KW_YEAR],
+            p2_kw_year_eur=billing[const.PRICE_P2_KW_YEAR],
+            p1_kwh_eur=billing[const.PRICE_P1_KWH],
+            p2_kwh_eur=billing[const.PRICE_P2_KWH],
+            p3_kwh_eur=billing[const.PRICE_P3_KWH],
+            meter_month_eur=billing[const.PRICE_METER_MONTH],
+            market_kw_year_eur=billing[const.PRICE_MARKET_KW_YEAR],
+            electricity_tax=billing[const.PRICE_ELECTRICITY_TAX],
+            iva_tax=billing[const.PRICE_IVA],
+        )
+
+    async def async_set_billing(self, billing: dict[str, float] | None) -> None:
+        """Swap pricing rules in place, recomputing only billing-derived data"""
+
+        pricing_rules = self._build_pricing_rules(billing)
+        if pricing_rules == self._billing:
+            # options saved for other settings, costs are still valid
+            return
+        self._billing = pricing_rules
+
+        # mimic EdataHelper init logic without building a new helper
+        self._datadis.pricing_rules = self._billing
+        self._datadis.enable_billing = self._billing is not None
+        self._datadis.is_pvpc = self._billing is not None and not all(
+            self._billing.get(x) is not None
+            for x in ("p1_kwh_eur", "p2_kwh_eur", "p3_kwh_eur")
+        )
+        self.statistics.set_billing(self._billing is not None)
+
+        if self._billing is None:
+            for key in ("cost_hourly_sum", "cost_daily_sum", "cost_monthly_sum"):
+                self._datadis.data[key] = []
+            for attr in BILLING_ATTRIBUTES:
+                self._datadis.attributes[attr] = None
+        else:
+            await self.hass.async_add_executor_job(
+                functools.partial(self._process, rebuild_costs=True)
+            )
+            await self.statistics.rebuild_cost_statistics()
+
+        self._load_data()
+        self.async_set_updated_data(self._data)
+
+    async def async_recompute_costs(self, since: date | None = None) -> None:
+        """Rebuild cost statistics from in-memory data, optionally since a date"""
+
+        await self.statistics.rebuild_cost_statistics(
+            datetime(since.year, since.month, since.day) if since is not None else None
+        )
+
+    async def async_load_stored_data(self) -> None:
+        """Derive attributes from stored data, off the event loop"""
+
+        # prices stored by older versions move to the shared cache
+        await self._prices.async_add(self._datadis.data.get("pvpc", []))
+        self._datadis.data["pvpc"] = []
+        if self.reset:
+            return
+        await self.hass.async_add_executor_job(self._process)
+        self._load_data()
+
+    def _data_to_save(self) -> dict[str, Any]:
+        """Serialize this supply's data, once its delayed save is due"""
+        # pylint: disable=import-outside-toplevel
+        from edata.processors import utils as edata_utils
+
+        return {
+            **edata_utils.serialize_dict(expand_data(self._datadis.data)),
+            # months whose aggregates are still to be processed again
+            DIRTY_MONTHS_KEY: [
+                x.isoformat() for x in sorted(self._aggregator.dirty.copy())
+            ],
+        }
+
+    def _read_recent_queries(self) -> dict[str, str] | None:
+        """Read the connector's recent queries file (in the executor)"""
+        # pylint: disable=import-outside-toplevel
+        from edata.connectors.datadis import RECENT_QUERIES_FILE
+
+        if not os.path.isfile(RECENT_QUERIES_FILE):
+            return None
+        with open(RECENT_QUERIES_FILE, "r", encoding="utf8") as recent_queries_content:
+            return json.load(recent_queries_content)
+
+    @staticmethod
+    def _window() -> tuple[datetime, datetime]:
+        """Return the datetime range kept in memory"""
+        # pylint: disable=import-outside-toplevel
+        from dateutil.relativedelta import relativedelta
+
+        return (
+            datetime.today().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            - relativedelta(months=12),  # since: 1 year ago
+            datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+            - timedelta(minutes=1),  # to: yesterday midnight
+        )
+
+    async def async_apply_retention(self, force: bool = False) -> None:
+        """Downsample stored history beyond the retention horizon, once a month"""
+        # pylint: disable=import-outside-toplevel
+        from dateutil.relativedelta import relativedelta
+
+        horizon = datetime.today().replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        ) - relativedelta(months=self.retention_months)
+        if not force and self._retention_checked == horizon:
+            return
+        self._retention_checked = horizon
+        await self.history.async_apply_retention(horizon)
+        await self.quarters.async_apply_retention(horizon)
+
+    async def async_get_diagnostics(self) -> dict[str, Any]:
+        """Report data sizes and freshness of this supply"""
+
+        def _file_sizes(paths):
+            return {
+                os.path.basename(x): os.path.getsize(x) if os.path.isfile(x) else None
+                for x in paths
+            }
+
+        data = self._datadis.data
+        series = await self.hass.async_add_executor_job(
+            lambda: {
+                x: {"rows": len(y), "bytes": estimate_nbytes(y)}
+                for x, y in data.items()
+            }
+        )
+        paths = [
+            self._store.path,
+            self.statistics.checkpoints_path,
+        ]
+        paths += [self.history.path(x) for x in await self.history.async_years()]
+        paths += [self.quarters.path(x) for x in await self.quarters.async_years()]
+        if self.aggregate:
+            paths.append(self._virtual_supply.path)
+
+        return {
+            "series": series,
+            "memory_bytes": sum(x["bytes"] for x in series.values()),
+            "storage_bytes": await self.hass.async_add_executor_job(_file_sizes, paths),
+            "statistics_rows": await self.statistics.async_count_statistics(),
+            "last_fetch": {
+                x: y.isoformat() for x, y in self._datadis.last_update.items()
+            },
+            "breaker": self._fetcher.breaker.as_dict(),
+            "last_import": self.statistics.last_import.isoformat()
+            if self.statistics.last_import is not None
+            else None,
+            "last_update_profile": self.profiles.last.as_dict()
+            if self.profiles.last is not None
+            else None,
+        }
+
+    async def async_backfill(self, years: int) -> None:
+        """Fetch history older than the in-memory window, resuming previous runs"""
+        # pylint: disable=import-outside-toplevel
+        from dateutil.relativedelta import relativedelta
+
+        window_start = self._window()[0]
+        date_from = window_start - relativedelta(years=years)
+        periods = self._fetcher.valid_periods(date_from)
+        if len(periods) == 0:
+            _LOGGER.warning(
+                "Backfill for %s needs its supply and contracts, try again later",
+                self.id,
+            )
+            return
+
+        completed = await self.history.async_completed_months()
+        # newest months first, so that a stop leaves the most useful ones stored
+        pending = sorted(
+            (
+                x
+                for x in chunks_within(
+                    [{"from": date_from, "to": window_start - timedelta(minutes=1)}],
+                    periods,
+                )
+                if month_key(x["from"]) not in completed
+            ),
+            key=lambda x: x["from"],
+            reverse=True,
+        )
+        _LOGGER.info("Backfilling %s months of history for %s", len(pending), self.id)
+
+        import_from = None
+        for i in range(0, len(pending), MAX_CONCURRENT_REQUESTS):
+            batch = pending[i : i + MAX_CONCURRENT_REQUESTS]
+            results = await self._fetcher.async_fetch_months(batch)
+            for chunk, result in zip(batch, results):
+                if result is None:
+                    continue
+                # months without a real reply (e.g., skipped queries) are retried
+                complete = all(
+                    x in (OUTCOME_OK, OUTCOME_EMPTY)
+                    for x in result["outcomes"].values()
+                )
+                found = len(result["consumptions"]) > 0
+                if complete or found or len(result["maximeter"]) > 0:
+                    # each month goes straight to storage
+                    await self.history.async_add_month(
+                        chunk["from"], result, complete=complete
+                    )
+                if found and (import_from is None or chunk["from"] < import_from):
+                    import_from = chunk["from"]
+            if not self._fetcher.breaker.allow_request():
+                # quota exceeded or repeated failures, months left are for later
+                _LOGGER.warning(
+                    "Backfill for %s paused before %s, it will resume from there",
+                    self.id,
+                    month_key(batch[-1]["from"]),
+                )
+                break
+
+        if import_from is not None:
+            await self._async_import_history(import_from)
+
+    async def async_import_file(self, path: str) -> None:
+        """Import a Datadis CSV/XLSX export, streaming it month by month"""
+
+        extension = os.path.splitext(path)[1][1:]
+        module = missing_module(extension)
+        if module is not None:
+            raise HomeAssistantError(
+                f"{extension.upper()} files need {module}, which is not installed"
+            )
+
+        window_start = self._window()[0]
+        chunks = iter_datadis_file(path)
+        import_from = None
+        recent = {"consumptions": [], "maximeter": []}
+        while True:
+            try:
+                chunk = await self.hass.async_add_executor_job(next, chunks, None)
+            except (OSError, ValueError) as err:
+                raise HomeAssistantError(f"Could not read {path}: {err}") from err
+            if chunk is None:
+                break
+
+            month, cups, data = chunk
+            for found_cups in cups:
+                if (
+                    not utils.check_cups_integrity(found_cups)
+                    or found_cups[:20] != self.cups[:20]
+                ):
+                    raise HomeAssistantError(
+                        f"{path} holds data for an unexpected CUPS ({found_cups})"
+                    )
+
+            if month < window_start:
+                # only whole months are flagged so that backfill skips them
+                items = next(iter(data.values()))
+                next_month = (month + timedelta(days=32)).replace(day=1)
+                await self.history.async_add_month(
+                    month,
+                    data,
+                    complete=items[0]["datetime"].day == 1
+                    and (next_month - items[-1]["datetime"]) <= timedelta(days=1),
+                )
+            else:
+                for key, items in data.items():
+                    recent[key].extend(items)
+            import_from = month if import_from is None else min(import_from, month)
+
+        if import_from is None:
+            _LOGGER.warning("No data found in %s", path)
+            return
+
+        for key, items in recent.items():
+            if len(items) > 0:
+                self._datadis.data[key] = merge_by_datetime(
+                    self._datadis.data[key], items
+                )
+        await self.hass.async_add_executor_job(self._process, recent["consumptions"])
+        self._load_data()
+
+        _LOGGER.info("Imported %s data since %s", self.id, import_from)
+        await self._async_import_history(import_from)
+        self.async_set_updated_data(self._data)
+
+    async def async_export(
+        self, dataset: str, start: datetime, end: datetime, file_format: str
+    ) -> str:
+        """Export a dataset to a file under the config dir, streaming it by month"""
+
+        module = missing_module(file_format)
+        if module is not None:
+            raise HomeAssistantError(
+                f"{file_format} export needs {module}, which is not installed"
+            )
+
+        path = self.hass.config.path(
+            const.DOMAIN,
+            f"{self.id}_{dataset}_{start:%Y%m%d}_{end:%Y%m%d}.{file_format}",
+        )
+        await self.hass.async_add_executor_job(
+            functools.partial(os.makedirs, os.path.dirname(path), exist_ok=True)
+        )
+        writer = await self.hass.async_add_executor_job(
+            EdataFileWriter, path, EXPORT_COLUMNS[dataset], file_format
+        )
+
+        try:
+            async for rows in self._async_iter_dataset(dataset, start, end):
+                await self.hass.async_add_executor_job(writer.write, rows)
+        finally:
+            await self.hass.async_add_executor_job(writer.close)
+
+        _LOGGER.info("Exported %s %s rows to %s", writer.rows, dataset, path)
+        return path
+
+    async def _async_iter_dataset(
+        self, dataset: str, start: datetime, end: datetime
+    ) -> AsyncIterator[list[dict]]:
+        """Iterate a dataset in month chunks, from history shards to memory"""
+
+        def _months(rows):
+            month = []
+            for row in rows:
+                if not start <= row["datetime"] < end:
+                    continue
+                if len(month) > 0 and (
+                    (row["datetime"].year, row["datetime"].month)
+                    != (month[0]["datetime"].year, month[0]["datetime"].month)
+                ):
+                    yield month
+                    month = []
+                month.append(row)
+            if len(month) > 0:
+                yield month
+
+        key = "cost_hourly_sum" if dataset == "costs" else dataset
+        for year in await self.history.async_years():
+            if not start.year <= year <= end.year:
+                continue
+            data = await self.history.async_load_year(year)
+            if dataset == "costs":
+                if self._billing is None or self._datadis.is_pvpc:
+                    continue
+                data[key] = await self.hass.async_add_executor_job(
+                    self._process_history_costs, data["consumptions"]
+                )
+            for month in _months(data[key]):
+                yield month
+            del data
+
+        for month in _months(self._datadis.data.get(key, [])):
+            yield month
+
+    async def _async_import_history(self, import_from: datetime) -> None:
+        """Import stored history into statistics, one year shard at a time"""
+
+        # sums are cumulative, so everything after import_from is chained again
+        window_start = self._window()[0]
+        async with self._statistics_lock:
+            last_stats = None
+            years = await self.history.async_years()
+            for year in years if import_from < window_start else []:
+                if year < import_from.year:
+                    continue
+                if year > window_start.year:
+                    break
+                # in-memory data covers the window, and is rebuilt below
+                data = {
+                    x: y[: bisect_datetime(y, window_start)]
+                    for x, y in (await self.history.async_load_year(year)).items()
+                }
+                await self._async_restore_downsampled(data, import_from)
+                if self._billing is not None and not self._datadis.is_pvpc:
+                    data["cost_hourly_sum"] = await self.hass.async_add_executor_job(
+                        self._process_history_costs, data["consumptions"]
+                    )
+                last_stats = await self.statistics.import_history(
+                    data, import_from, last_stats
+                )
+            # chained sums end before the window, otherwise they are read again
+            await self.statistics.rebuild_statistics(
+                max(import_from, window_start), last_stats
+            )
+        await self.async_apply_retention(force=True)
+
+    async def _async_restore_downsampled(
+        self, data: dict[str, list], import_from: datetime
+    ) -> None:
+        """Read hourly consumptions of downsampled days back from statistics"""
+
+        hourly_days = {x["datetime"].date() for x in data["consumptions"]}
+        missing = [
+            x["datetime"]
+            for x in data["consumptions_daily_sum"]
+            if x["datetime"] >= import_from and x["datetime"].date() not in hourly_days
+        ]
+        if len(missing) == 0:
+            return
+        restored = await self.statistics.get_hourly_consumptions(
+            min(missing), max(missing) + timedelta(days=1)
+        )
+        data["consumptions"] = merge_by_datetime(restored, data["consumptions"])
+
+    def _process_history_costs(self, consumptions: list[dict]) -> list[dict]:
+        """Compute hourly costs for history consumptions"""
+        # pylint: disable=import-outside-toplevel
+        from edata.processors.billing import BillingInput, BillingProcessor
+
+        if len(consumptions) == 0:
+            return []
+        return BillingProcessor(
+            BillingInput(
+                contracts=self._datadis.data["contracts"],
+                consumptions=consumptions,
+                prices=None,
+                rules=self._billing,
+            )
+        ).output["hourly"]
+
     async def _async_update_data(self):
         """Update data via API."""
 
@@ -126,35 +599,55 @@ class EdataCoordinator(DataUpdateCoordinator):
         if self.reset:
             await self.statistics.clear_all_statistics()
 
+        profile = UpdateProfile()
+
         # fetch last 365 days
-        await self.hass.async_add_executor_job(
-            self._datadis.update,
-            datetime.today().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            - relativedelta(months=12),  # since: 1 year ago
-            datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
-            - timedelta(minutes=1),  # to: yesterday midnight
-        )
+        with profile.phase("fetch"):
+            new_data = await self._fetcher.async_update(*self._window())
+        new_data = new_data or {"consumptions": [], "maximeter": []}
+        profile.count("rows_fetched", sum(len(x) for x in new_data.values()))
 
-        await self.statistics.update_statistics()
+        with profile.phase("process"):
+            await self.hass.async_add_executor_job(
+                self._process, new_data["consumptions"]
+            )
 
-        self._load_data()
+        async with self._statistics_lock:
+            await self.statistics.update_statistics(profile)
+            with profile.phase("virtual_supply"):
+                await self._async_sync_virtual_supply()
+
+        with profile.phase("load"):
+            self._load_data()
+        with profile.phase("retention"):
+            await self.async_apply_retention()
+
+        # writes are delayed, so that updates close in time share them
+        self._store.async_delay_save(self._data_to_save, const.STORAGE_SAVE_DELAY)
+        # the write itself happens later, so its size is estimated from memory
+        data = self._datadis.data
+        profile.count(
+            "bytes_written",
+            await self.hass.async_add_executor_job(
+                lambda: sum(estimate_nbytes(x) for x in data.values())
+            ),
+        )
+        with profile.phase("recent_queries"):
+            recent_queries = await self.hass.async_add_executor_job(
+                self._read_recent_queries
+            )
+            if recent_queries is not None:
+                async_get_store(self.hass, "recent_queries").async_delay_save(
+                    lambda: recent_queries, const.STORAGE_SAVE_DELAY
+                )
 
-        await Store(
-            self.hass,
-            const.STORAGE_VERSION,
-            f"{const.STORAGE_KEY_PREAMBLE}_{self.id.upper()}",
-        ).async_save(utils.serialize_dict(self._datadis.data))
-
-        if os.path.isfile(RECENT_QUERIES_FILE):
-            with open(
-                RECENT_QUERIES_FILE, "r", encoding="utf8"
-            ) as recent_queries_content:
-                recent_queries = json.load(recent_queries_content)
-                await Store(
-                    self.hass,
-                    const.STORAGE_VERSION,
-                    f"{const.STORAGE_KEY_PREAMBLE}_recent_queries",
-                ).async_save(recent_queries)
+        profile.finish()
+        self.profiles.add(profile)
+        _LOGGER.debug("Update of %s profiled: %s", self.id, profile.as_dict())
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            self.hass.bus.async_fire(
+                const.EVENT_UPDATE_PROFILE, {"scups": self.id, **profile.as_dict()}
+            )
 
         # put reset flag down
         if self.reset:
@@ -162,13 +655,36 @@ class EdataCoordinator(DataUpdateCoordinator):
 
         return self._data
 
-    def _load_data(self, preprocess=False):
+    async def _async_sync_virtual_supply(self) -> None:
+        """Join or leave the virtual supply according to the aggregate option"""
+
+        is_member = await self._virtual_supply.async_has_member(self.id)
+        if not self.aggregate:
+            if is_member:
+                await self._virtual_supply.async_remove_member(self.id)
+            return
+        if is_member:
+            return
+
+        # statistics imported before joining are reported once, from memory
+        if not self.reset:
+            await self.statistics.rebuild_statistics(self._window()[0])
+        await self._virtual_supply.async_add_member(self.id)
+
+    def _process(
+        self, new_consumptions: Iterable[dict] = (), rebuild_costs: bool = False
+    ) -> None:
+        """Aggregate new consumptions and compact the series, in the executor"""
+
+        self._aggregator.process(new_consumptions, rebuild_costs=rebuild_costs)
+        # series are only read until the next update, so keep them compact
+        compact_data(self._datadis.data)
+
+    @watched("load data")
+    def _load_data(self):
         """Load data found in built-in statistics into state, attributes and websockets"""
 
         try:
-            if preprocess:
-                self._datadis.process_data()
-
             # reference to attributes shared storage
             attrs = self._data[const.DATA_ATTRIBUTES]
             attrs.update(self._datadis.attributes)
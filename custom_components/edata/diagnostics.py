@@ -0,0 +1,43 @@
+"""Diagnostics support for e-data"""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+
+from . import const
+from .prices import async_get_price_cache
+from .virtual_supply import async_get_virtual_supply
+from .watchdog import WATCHDOG
+
+TO_REDACT = {
+    CONF_USERNAME,
+    CONF_PASSWORD,
+    const.CONF_CUPS,
+    const.CONF_AUTHORIZEDNIF,
+    "unique_id",
+}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+
+    coordinator = (
+        hass.data.get(const.DOMAIN, {})
+        .get(entry.data.get(const.CONF_SCUPS, "").upper(), {})
+        .get(const.DATA_COORDINATOR)
+    )
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "supply": await coordinator.async_get_diagnostics()
+        if coordinator is not None
+        else None,
+        "loop_watchdog": WATCHDOG.as_dict(),
+        "virtual_supply": async_get_virtual_supply(hass).as_dict(),
+        "pvpc_prices": async_get_price_cache(hass).as_dict(),
+    }
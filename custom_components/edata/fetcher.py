@@ -0,0 +1,555 @@
+"""Concurrent Datadis fetching for e-data"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import threading
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+
+from . import const
+from .breaker import async_get_breaker
+from .prices import async_get_price_cache
+from .quarters import (
+    MEASUREMENT_TYPE_QUARTER_HOURLY,
+    EdataQuarters,
+    fill_hours,
+    hourly_from_quarters,
+    lacks_hours,
+    parse_quarters,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Datadis penalizes bursts, so requests in flight are bounded per account
+MAX_CONCURRENT_REQUESTS = 3
+
+# outcomes of a Datadis query
+OUTCOME_OK = "ok"
+OUTCOME_EMPTY = "empty"  # a real reply, without data
+OUTCOME_SKIPPED = "skipped"  # not sent, it was answered within the last day
+OUTCOME_PAUSED = "paused"  # not sent, the breaker is open
+OUTCOME_QUOTA = "quota"
+OUTCOME_FAILED = "failed"
+
+# every connector persists its recent queries to the same file
+_RECENT_QUERIES_LOCK = threading.Lock()
+
+CONSUMPTIONS_GAP = timedelta(hours=6)
+MAXIMETER_GAP = timedelta(days=60)
+
+
+def month_chunks(date_from: datetime, date_to: datetime) -> list[dict[str, datetime]]:
+    """Split a datetime range into non-overlapping calendar month chunks"""
+
+    chunks = []
+    start = date_from
+    while start < date_to:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        )
+        chunks.append(
+            {"from": start, "to": min(next_month - timedelta(minutes=1), date_to)}
+        )
+        start = next_month
+    return chunks
+
+
+def chunks_within(
+    missing: list[dict[str, datetime]],
+    periods: list[tuple[datetime, datetime]],
+) -> list[dict[str, datetime]]:
+    """Build one month chunk per month touched by a gap within valid periods"""
+
+    chunks = {}
+    for gap in missing:
+        for start, end in periods:
+            if gap["to"] < start or gap["from"] > end:
+                continue
+            for chunk in month_chunks(max(gap["from"], start), min(gap["to"], end)):
+                # identical queries are discarded by the connector, so gaps
+                # sharing a month are fetched as a single wider query
+                key = (chunk["from"].year, chunk["from"].month)
+                if key in chunks:
+                    chunks[key]["from"] = min(chunks[key]["from"], chunk["from"])
+                    chunks[key]["to"] = max(chunks[key]["to"], chunk["to"])
+                else:
+                    chunks[key] = chunk
+    return list(chunks.values())
+
+
+def merge_by_datetime(old_lst: list[dict], new_lst: list[dict]) -> list[dict]:
+    """Merge two lists of dicts by datetime, new elements taking precedence"""
+
+    merged = {x["datetime"]: x for x in old_lst}
+    merged.update({x["datetime"]: x for x in new_lst})
+    return sorted(merged.values(), key=lambda x: x["datetime"])
+
+
+def parse_consumptions(
+    response: Iterable[dict], date_from: datetime, date_to: datetime
+) -> list[dict]:
+    """Parse an hourly get_consumption_data payload, as the edata connector does"""
+
+    consumptions = []
+    for item in response:
+        if item.get("consumptionKWh", 0) <= 0:
+            continue
+        try:
+            # datadis times are the end of each hour, from 01:00 to 24:00
+            start = datetime.strptime(item["date"], "%Y/%m/%d") + timedelta(
+                hours=int(item["time"].split(":")[0]) - 1
+            )
+            value = item["consumptionKWh"]
+            real = item["obtainMethod"] == "Real"
+        except (KeyError, TypeError, ValueError):
+            _LOGGER.warning("Weird consumption data, got %s", item)
+            continue
+        if date_from <= start <= date_to:
+            consumptions.append(
+                {"datetime": start, "delta_h": 1, "value_kWh": value, "real": real}
+            )
+    return consumptions
+
+
+def parse_maximeter(response: Iterable[dict]) -> list[dict]:
+    """Parse a get_max_power payload, as the edata connector does"""
+
+    maximeter = []
+    for item in response:
+        try:
+            maximeter.append(
+                {
+                    "datetime": datetime.strptime(
+                        f"{item['date']} {item['time']}", "%Y/%m/%d %H:%M"
+                    ),
+                    "value_kW": item["maxPower"],
+                }
+            )
+        except (KeyError, TypeError, ValueError):
+            _LOGGER.warning("Weird maximeter data, got %s", item)
+    return maximeter
+
+
+@callback
+def async_get_account_semaphore(hass: HomeAssistant, key: str) -> asyncio.Semaphore:
+    """Get the semaphore bounding requests in flight of an account"""
+
+    semaphores = hass.data.setdefault(const.DATA_SEMAPHORES, {})
+    if key not in semaphores:
+        semaphores[key] = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    return semaphores[key]
+
+
+class EdataFetcher:
+    """Fetch independent Datadis datasets concurrently for an EdataHelper
+
+    Requests are sent through _send, which reports every outcome to the
+    account breaker and tells suppressed queries apart from empty replies.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        edata_helper,
+        username: str,
+        cups: str,
+        authorized_nif: str | None = None,
+        quarters: EdataQuarters | None = None,
+        base_url: str | None = None,
+    ) -> None:
+        self.hass = hass
+        self.cups = cups
+        self.authorized_nif = authorized_nif
+        self._edata = edata_helper
+        # another Datadis server (e.g., scripts/fake_datadis.py) may be used instead
+        self.base_url = base_url
+        if base_url is not None:
+            # pylint: disable=import-outside-toplevel,protected-access
+            from .connector import make_connector
+
+            edata_helper.datadis_api = make_connector(
+                username, edata_helper.datadis_api._pwd, base_url
+            )
+        self._api = edata_helper.datadis_api
+        self.breaker = async_get_breaker(hass, username)
+        # shared by every supply of the account, as Datadis limits accounts
+        self._semaphore = async_get_account_semaphore(hass, self.breaker.key)
+        self.prices = async_get_price_cache(hass)
+        # quarter-hour consumptions are fetched (and stored) only if given
+        self.quarters = quarters
+
+    def _send(
+        self, url: str, data: dict[str, Any], ignore_recent_queries: bool = False
+    ) -> tuple[str, list]:
+        """Send a Datadis query (in the executor), returning its outcome and payload
+
+        Mirrors the connector's _send_cmd, but failures are reported to the
+        breaker instead of being silenced for a day as recent queries.
+        """
+        # pylint: disable=import-outside-toplevel,protected-access
+        from edata.connectors import datadis
+
+        from .connector import redirect_url
+
+        api = self._api
+        params = "?" + "".join(f"{x}={y}&" for x, y in data.items()) if data else ""
+        query = redirect_url(url, self.base_url) + params
+        if not ignore_recent_queries and api._is_recent_query(query):
+            return OUTCOME_SKIPPED, []
+
+        for attempt in range(2):
+            try:
+                _LOGGER.info("GET %s", query)
+                reply = api._session.get(
+                    query,
+                    headers={"Accept-Encoding": "identity"},
+                    timeout=datadis.TIMEOUT,
+                )
+            except Exception as err:  # pylint: disable=broad-except
+                # timeouts and connection errors
+                _LOGGER.warning("%s at %s", err, query)
+                self.breaker.record_failure()
+                return OUTCOME_FAILED, []
+            if attempt > 0:
+                break
+            if reply.status_code == 401:
+                # the connector builds a new session along with the token
+                if not api._get_token():
+                    self.breaker.record_failure()
+                    return OUTCOME_FAILED, []
+            elif reply.status_code < 500:
+                break
+
+        if reply.status_code == 429:
+            _LOGGER.warning("%s %s at %s", reply.status_code, reply.text, query)
+            self.breaker.record_failure(quota=True)
+            return OUTCOME_QUOTA, []
+        if reply.status_code != 200:
+            _LOGGER.warning("%s %s at %s", reply.status_code, reply.text, query)
+            self.breaker.record_failure()
+            return OUTCOME_FAILED, []
+
+        self.breaker.record_success()
+        try:
+            payload = reply.json()
+        except ValueError:
+            payload = None
+        # every supply persists recent queries to the same file
+        with _RECENT_QUERIES_LOCK:
+            api._update_recent_queries(query)
+        if not payload:
+            return OUTCOME_EMPTY, []
+        return OUTCOME_OK, payload
+
+    async def _async_request(self, func, *args, **kwargs):
+        """Run a blocking request in the executor, within the concurrency limits"""
+        async with self._semaphore:
+            return await self.hass.async_add_executor_job(
+                functools.partial(func, *args, **kwargs)
+            )
+
+    async def _async_datadis_request(
+        self, url: str, data: dict[str, Any]
+    ) -> tuple[str, list]:
+        """Send a Datadis query, unless the breaker has opened meanwhile"""
+        async with self._semaphore:
+            if not self.breaker.allow_request():
+                return OUTCOME_PAUSED, []
+            return await self.hass.async_add_executor_job(self._send, url, data)
+
+    def _query(
+        self, distributor_code: str, chunk: dict[str, datetime], **extra: Any
+    ) -> dict[str, Any]:
+        """Build the parameters of a month query, in the connector's order"""
+
+        data = {
+            "cups": self.cups,
+            "distributorCode": distributor_code,
+            "startDate": chunk["from"].strftime("%Y/%m"),
+            "endDate": chunk["to"].strftime("%Y/%m"),
+            **extra,
+        }
+        if self.authorized_nif is not None:
+            data["authorizedNif"] = self.authorized_nif
+        return data
+
+    async def _async_check_breaker(self) -> bool:
+        """Return whether Datadis may be queried, probing it when the breaker allows"""
+
+        breaker = self.breaker
+        await breaker.async_load()
+        if breaker.allow_request():
+            return True
+        if not breaker.try_probe():
+            _LOGGER.info(
+                "Datadis requests for CUPS %s are paused until %s",
+                self.cups[-4:],
+                breaker.retry_at,
+            )
+            return False
+
+        # pylint: disable=import-outside-toplevel
+        from edata.connectors import datadis
+
+        _LOGGER.info("Probing Datadis before resuming requests")
+        data = {}
+        if self.authorized_nif is not None:
+            data["authorizedNif"] = self.authorized_nif
+        try:
+            await self._async_request(
+                self._send, datadis.URL_GET_SUPPLIES, data, ignore_recent_queries=True
+            )
+        finally:
+            breaker.end_probe()
+        return breaker.allow_request()
+
+    async def async_update(
+        self, date_from: datetime, date_to: datetime
+    ) -> dict[str, list] | None:
+        """Fetch Datadis (and REData if needed) data, returning new elements"""
+
+        tasks = [self._async_update_datadis(date_from, date_to)]
+        if self._edata.is_pvpc:
+            tasks.append(self._async_fetch_pvpc(date_from, date_to))
+        # Datadis rows are already merged, so they are returned whatever REData does
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results[1:]:
+            if isinstance(result, Exception):
+                _LOGGER.error(
+                    "Unhandled exception while updating from REData", exc_info=result
+                )
+        if isinstance(results[0], BaseException):
+            raise results[0]
+        return results[0]
+
+    async def _async_update_datadis(
+        self, date_from: datetime, date_to: datetime
+    ) -> dict[str, list] | None:
+        """Fetch Datadis data, querying months and datasets concurrently"""
+        # pylint: disable=import-outside-toplevel
+        from dateutil.relativedelta import relativedelta
+        from edata.processors import utils
+
+        edata = self._edata
+        cups = self.cups
+
+        _LOGGER.info(
+            "Update requested for CUPS %s from %s to %s",
+            cups[-4:],
+            date_from.isoformat(),
+            date_to.isoformat(),
+        )
+
+        if not await self._async_check_breaker():
+            return None
+
+        # supplies and contracts are needed to build the rest of the queries
+        await self.hass.async_add_executor_job(edata.update_supplies)
+        if len(edata.data["supplies"]) == 0:
+            _LOGGER.warning(
+                "Supplies query failed or no supplies found in the provided account"
+            )
+            return None
+
+        supply = utils.get_by_key(edata.data["supplies"], "cups", cups)
+        if supply is None:
+            _LOGGER.error(
+                "CUPS %s not found in %s, wrong CUPS?",
+                cups[-4:],
+                [x["cups"] for x in edata.data["supplies"]],
+            )
+            return None
+
+        distributor_code = supply["distributorCode"]
+        await self.hass.async_add_executor_job(
+            edata.update_contracts, cups, distributor_code
+        )
+        if len(edata.data["contracts"]) == 0:
+            _LOGGER.warning(
+                "Contracts query failed or no contracts found in the provided account"
+            )
+            return None
+
+        periods = self.valid_periods(date_from)
+        if len(periods) == 0:
+            return {"consumptions": [], "maximeter": []}
+        date_from = max(date_from, min(x[0] for x in periods))
+
+        edata.data["consumptions"], miss_cons = utils.extract_dt_ranges(
+            edata.data["consumptions"],
+            date_from,
+            date_to,
+            gap_interval=CONSUMPTIONS_GAP,
+        )
+        edata.data["maximeter"], miss_maxim = utils.extract_dt_ranges(
+            edata.data["maximeter"], date_from, date_to, gap_interval=MAXIMETER_GAP
+        )
+
+        tasks = []
+        now = datetime.now()
+        if (now - edata.last_update["consumptions"]) > edata.UPDATE_INTERVAL:
+            for chunk in chunks_within(miss_cons, periods):
+                tasks.append(
+                    self._async_fetch_consumptions(
+                        distributor_code, supply["pointType"], chunk
+                    )
+                )
+        if (now - edata.last_update["maximeter"]) > edata.UPDATE_INTERVAL:
+            # maximeter is not available during the first month of a contract
+            maxim_periods = [(x[0] + relativedelta(months=1), x[1]) for x in periods]
+            for chunk in chunks_within(miss_maxim, maxim_periods):
+                tasks.append(self._async_fetch_maximeter(distributor_code, chunk))
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        new_data = {"consumptions": [], "maximeter": []}
+        for result in results:
+            if isinstance(result, Exception):
+                _LOGGER.warning("Exception while fetching data: %s", result)
+            else:
+                new_data[result[0]].extend(result[1])
+
+        for key, new_lst in new_data.items():
+            if len(new_lst) > 0:
+                edata.data[key] = merge_by_datetime(edata.data[key], new_lst)
+                edata.last_update[key] = datetime.now()
+                _LOGGER.info(
+                    "%s data has been successfully updated (%s elements)",
+                    key.capitalize(),
+                    len(new_lst),
+                )
+
+        return new_data
+
+    def valid_periods(self, date_from: datetime) -> list[tuple[datetime, datetime]]:
+        """Return the periods data may exist for, since date_from
+
+        Those are the periods covered by contracts, plus the gap between the
+        supply start and the oldest registered contract, if any, all within the
+        supply validity.
+        """
+        # pylint: disable=import-outside-toplevel
+        from edata.processors import utils
+
+        supply = utils.get_by_key(self._edata.data["supplies"], "cups", self.cups)
+        contracts = self._edata.data["contracts"]
+        if supply is None or len(contracts) == 0:
+            return []
+        periods = [(x["date_start"], x["date_end"]) for x in contracts]
+        oldest_contract = min(x[0] for x in periods)
+        if oldest_contract > max(date_from, supply["date_start"]):
+            periods.append((max(date_from, supply["date_start"]), oldest_contract))
+        periods = [
+            (max(x[0], supply["date_start"]), min(x[1], supply["date_end"]))
+            for x in periods
+        ]
+        return [x for x in periods if x[0] < x[1]]
+
+    async def async_fetch_months(
+        self, chunks: list[dict[str, datetime]]
+    ) -> list[dict[str, Any] | None]:
+        """Fetch consumptions and maximeter for some month chunks concurrently
+
+        Each result also maps both datasets to the outcome of their query.
+        """
+        # pylint: disable=import-outside-toplevel
+        from edata.processors import utils
+
+        supply = utils.get_by_key(self._edata.data["supplies"], "cups", self.cups)
+        if supply is None:
+            _LOGGER.warning("Supply %s is not known yet", self.cups[-4:])
+            return [None for _ in chunks]
+        if not await self._async_check_breaker():
+            return [None for _ in chunks]
+
+        async def _async_fetch_month(chunk):
+            cons, maxim = await asyncio.gather(
+                self._async_fetch_consumptions(
+                    supply["distributorCode"], supply["pointType"], chunk
+                ),
+                self._async_fetch_maximeter(supply["distributorCode"], chunk),
+            )
+            return {
+                cons[0]: cons[1],
+                maxim[0]: maxim[1],
+                "outcomes": {cons[0]: cons[2], maxim[0]: maxim[2]},
+            }
+
+        results = await asyncio.gather(
+            *[_async_fetch_month(x) for x in chunks], return_exceptions=True
+        )
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                _LOGGER.warning(
+                    "Exception while fetching data since %s: %s", chunk["from"], result
+                )
+        return [None if isinstance(x, Exception) else x for x in results]
+
+    async def _async_fetch_consumptions(self, distributor_code, point_type, chunk):
+        """Fetch a month of consumptions"""
+        # pylint: disable=import-outside-toplevel
+        from edata.connectors import datadis
+
+        hours = []
+        if self.quarters is not None and not await self.quarters.async_is_unsupported():
+            # the connector would parse quarters as hours, so the raw reply is used
+            outcome, response = await self._async_datadis_request(
+                datadis.URL_GET_CONSUMPTION_DATA,
+                self._query(
+                    distributor_code,
+                    chunk,
+                    measurementType=MEASUREMENT_TYPE_QUARTER_HOURLY,
+                    pointType=point_type,
+                ),
+            )
+            if outcome not in (OUTCOME_OK, OUTCOME_EMPTY):
+                # not answered (e.g., skipped as recent), so it is asked again later
+                return ("consumptions", [], outcome)
+            quarters = parse_quarters(response, chunk["from"], chunk["to"])
+            await self.quarters.async_report(len(quarters) > 0)
+            if len(quarters) > 0:
+                await self.quarters.async_add(quarters)
+                hours = list(hourly_from_quarters(quarters))
+                if not lacks_hours(hours, chunk["from"]):
+                    return ("consumptions", hours, outcome)
+            # not every meter reports quarters (or it did not in the whole
+            # month, e.g., it was replaced), so hourly data fills the rest
+
+        outcome, response = await self._async_datadis_request(
+            datadis.URL_GET_CONSUMPTION_DATA,
+            self._query(
+                distributor_code, chunk, measurementType="0", pointType=point_type
+            ),
+        )
+        return (
+            "consumptions",
+            fill_hours(hours, parse_consumptions(response, chunk["from"], chunk["to"])),
+            outcome,
+        )
+
+    async def _async_fetch_maximeter(self, distributor_code, chunk):
+        """Fetch a month of maximeter"""
+        # pylint: disable=import-outside-toplevel
+        from edata.connectors import datadis
+
+        outcome, response = await self._async_datadis_request(
+            datadis.URL_GET_MAX_POWER, self._query(distributor_code, chunk)
+        )
+        return ("maximeter", parse_maximeter(response), outcome)
+
+    async def _async_fetch_pvpc(self, date_from, date_to):
+        """Fetch PVPC prices, which do not depend on Datadis, into the shared cache"""
+        # pylint: disable=import-outside-toplevel
+        import requests
+
+        try:
+            await self.prices.async_update(date_from, date_to)
+        except requests.exceptions.Timeout:
+            _LOGGER.error("Timeout exception while updating from REData")
+        except requests.exceptions.RequestException as err:
+            _LOGGER.error("Could not update prices from REData: %s", err)
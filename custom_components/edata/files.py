@@ -0,0 +1,220 @@
+"""Datadis files handling for e-data"""
+from __future__ import annotations
+
+import csv
+import importlib.util
+import logging
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+
+_LOGGER = logging.getLogger(__name__)
+
+DATE_FORMATS = ("%Y/%m/%d", "%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%Y-%m-%d %H:%M:%S")
+
+# file formats needing modules that are not requirements of the integration
+OPTIONAL_MODULES = {"parquet": "pyarrow", "xlsx": "openpyxl"}
+EXPORT_COLUMNS = {
+    "consumptions": ["datetime", "delta_h", "value_kWh", "real"],
+    "costs": ["datetime", "value_eur", "energy_term", "power_term", "others_term"],
+    "maximeter": ["datetime", "value_kW"],
+}
+
+
+def missing_module(file_format: str) -> str | None:
+    """Return the module a file format needs if it is not installed"""
+
+    module = OPTIONAL_MODULES.get(file_format.lower())
+    if module is not None and importlib.util.find_spec(module) is None:
+        return module
+    return None
+
+
+EXPORT_FORMATS = [x for x in ("csv", "parquet") if missing_module(x) is None]
+
+
+def _parse_date(value: str) -> datetime:
+    """Parse a date as found in Datadis exports"""
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format)
+        except ValueError:
+            continue
+    raise ValueError(f"Unknown date format: {value}")
+
+
+def _parse_float(value: str) -> float:
+    """Parse a float that may use a decimal comma"""
+    return float(value.strip().replace(",", ".")) if value.strip() else 0.0
+
+
+def _get_columns(header: list[str]) -> tuple[str | None, dict[str, int]]:
+    """Identify the kind of export and its columns from the header"""
+
+    kind = None
+    columns = {}
+    for idx, name in enumerate(x.strip().lower() for x in header):
+        if name == "cups":
+            columns["cups"] = idx
+        elif name.startswith("fecha"):
+            columns["date"] = idx
+        elif name.startswith("hora"):
+            columns["time"] = idx
+        elif "metodo" in name or "método" in name:
+            columns["method"] = idx
+        elif "value" not in columns and "kwh" in name:
+            kind = "consumptions"
+            columns["value"] = idx
+        elif "value" not in columns and ("potencia" in name or "kw" in name):
+            kind = "maximeter"
+            columns["value"] = idx
+
+    if not all(x in columns for x in ("cups", "date", "time", "value")):
+        return None, columns
+    return kind, columns
+
+
+def _iter_rows(path: str) -> Iterator[list[str]]:
+    """Iterate over the rows of a CSV or XLSX file without loading it whole"""
+
+    if path.lower().endswith(".xlsx"):
+        # pylint: disable=import-outside-toplevel
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield ["" if x is None else str(x) for x in row]
+        finally:
+            workbook.close()
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as file:
+            dialect = csv.Sniffer().sniff(file.readline(), delimiters=";,\t")
+            file.seek(0)
+            yield from csv.reader(file, dialect)
+
+
+def _parse_row(kind: str, columns: dict[str, int], row: list[str]) -> dict | None:
+    """Parse a single row into edata data structures"""
+
+    day = _parse_date(row[columns["date"]])
+    hour, minute = (int(x) for x in row[columns["time"]].strip().split(":")[:2])
+    value = _parse_float(row[columns["value"]])
+
+    if kind == "consumptions":
+        if value <= 0:
+            return None
+        # Datadis hours go from 01:00 to 24:00, referring to the hour ending then
+        return {
+            "datetime": day + timedelta(hours=hour - 1),
+            "delta_h": 1,
+            "value_kWh": value,
+            "real": "method" not in columns
+            or row[columns["method"]].strip().lower() == "real",
+        }
+    return {
+        "datetime": day.replace(hour=hour, minute=minute),
+        "value_kW": value,
+    }
+
+
+def iter_datadis_file(
+    path: str,
+) -> Iterator[tuple[datetime, set[str], dict[str, list]]]:
+    """Stream a Datadis export, yielding (month, cups, data) chunks"""
+
+    rows = _iter_rows(path)
+    kind, columns = _get_columns(next(rows, []))
+    if kind is None:
+        raise ValueError(f"Unrecognized Datadis file format: {path}")
+
+    month = None
+    cups = set()
+    items = []
+    for row in rows:
+        if len(row) <= max(columns.values()) or not row[columns["date"]].strip():
+            continue
+        try:
+            item = _parse_row(kind, columns, row)
+        except ValueError:
+            _LOGGER.warning("Skipping malformed row in %s: %s", path, row)
+            continue
+        if item is None:
+            continue
+        item_month = item["datetime"].replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        )
+        if month is not None and item_month != month:
+            yield month, cups, {kind: items}
+            cups = set()
+            items = []
+        month = item_month
+        cups.add(row[columns["cups"]].strip().upper())
+        items.append(item)
+
+    if month is not None:
+        yield month, cups, {kind: items}
+
+
+class EdataFileWriter:
+    """Write rows to CSV or Parquet files chunk by chunk"""
+
+    def __init__(self, path: str, columns: list[str], file_format: str) -> None:
+        self.path = path
+        self.columns = columns
+        self.rows = 0
+        self._format = file_format
+        self._file = None
+        self._writer = None
+
+        if self._format == "parquet":
+            # pylint: disable=import-outside-toplevel
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            self._pa = pa
+            self._schema = pa.schema(
+                [
+                    (x, pa.timestamp("s") if x == "datetime" else pa.float64())
+                    for x in columns
+                ]
+            )
+            self._writer = pq.ParquetWriter(path, self._schema)
+        else:
+            self._file = open(path, "w", encoding="utf8", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(columns)
+
+    def write(self, rows: list[dict]) -> None:
+        """Append a chunk of rows"""
+        if len(rows) == 0:
+            return
+        if self._format == "parquet":
+            # each chunk becomes a row group, so columns are built per chunk only
+            self._writer.write_table(
+                self._pa.table(
+                    {
+                        x: [
+                            row.get(x) if x == "datetime" else float(row.get(x) or 0)
+                            for row in rows
+                        ]
+                        for x in self.columns
+                    },
+                    schema=self._schema,
+                )
+            )
+        else:
+            self._writer.writerows(
+                [
+                    row[x].isoformat() if x == "datetime" else row.get(x)
+                    for x in self.columns
+                ]
+                for row in rows
+            )
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        """Flush and close the file"""
+        if self._format == "parquet":
+            self._writer.close()
+        else:
+            self._file.close()
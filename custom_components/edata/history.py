@@ -0,0 +1,135 @@
+"""Long term history storage for e-data"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from . import const
+from .aggregates import aggregate_consumptions, bisect_datetime, month_key
+from .fetcher import merge_by_datetime
+from .storage import async_get_store
+
+_LOGGER = logging.getLogger(__name__)
+
+HISTORY_ELEMENTS = ["consumptions", "maximeter"]
+HISTORY_AGGREGATES = ["consumptions_daily_sum", "consumptions_monthly_sum"]
+
+
+def downsample(
+    consumptions: list[dict], horizon: datetime
+) -> tuple[list[dict], list[dict], list[dict]]:
+    """Collapse hourly consumptions older than horizon into daily and monthly sums"""
+
+    idx = bisect_datetime(consumptions, horizon)
+    daily, monthly = aggregate_consumptions(consumptions[:idx])
+    return consumptions[idx:], daily, monthly
+
+
+class EdataHistory:
+    """Year-sharded storage for data older than the in-memory window"""
+
+    def __init__(self, hass: HomeAssistant, scups: str) -> None:
+        self.hass = hass
+        self.id = scups.upper()
+        self._index = None
+
+    def _store(self, year: int | None = None) -> Store:
+        """Get the Store for a year shard, or for the index if no year is given"""
+        key = f"{self.id}_history"
+        if year is not None:
+            key = f"{key}_{year}"
+        return async_get_store(self.hass, key)
+
+    def path(self, year: int | None = None) -> str:
+        """Get the file path of a year shard, or of the index if no year is given"""
+        return self._store(year).path
+
+    async def _async_index(self) -> dict:
+        """Load the history index (stored years and completed months)"""
+        if self._index is None:
+            self._index = await self._store().async_load() or {}
+            self._index.setdefault("years", [])
+            self._index.setdefault("completed", [])
+        return self._index
+
+    def _save_index(self) -> None:
+        """Schedule a save of the history index"""
+        self._store().async_delay_save(lambda: self._index, const.STORAGE_SAVE_DELAY)
+
+    async def async_years(self) -> list[int]:
+        """Return stored years, oldest first"""
+        return sorted((await self._async_index())["years"])
+
+    async def async_completed_months(self) -> set[str]:
+        """Return months already stored"""
+        return set((await self._async_index())["completed"])
+
+    async def async_load_year(self, year: int) -> dict[str, list]:
+        """Load a year shard"""
+        # pylint: disable=import-outside-toplevel
+        from edata.processors import utils
+
+        data = utils.deserialize_dict(await self._store(year).async_load() or {})
+        data = data or {}
+        return {x: data.get(x, []) for x in HISTORY_ELEMENTS + HISTORY_AGGREGATES}
+
+    async def async_save_year(self, year: int, data: dict[str, list]) -> None:
+        """Overwrite a year shard"""
+        # pylint: disable=import-outside-toplevel
+        from edata.processors import utils
+
+        index = await self._async_index()
+        if year not in index["years"]:
+            index["years"].append(year)
+            self._save_index()
+        self._store(year).async_delay_save(
+            lambda: utils.serialize_dict(
+                {x: data.get(x, []) for x in HISTORY_ELEMENTS + HISTORY_AGGREGATES}
+            ),
+            const.STORAGE_SAVE_DELAY,
+        )
+
+    async def async_add_month(
+        self, month: datetime, data: dict[str, list], complete: bool = True
+    ) -> None:
+        """Merge a month of data into its year shard, optionally marking it completed"""
+        shard = await self.async_load_year(month.year)
+        for key in HISTORY_ELEMENTS:
+            shard[key] = merge_by_datetime(shard[key], data.get(key, []))
+        await self.async_save_year(month.year, shard)
+
+        index = await self._async_index()
+        if complete and month_key(month) not in index["completed"]:
+            index["completed"].append(month_key(month))
+            self._save_index()
+        _LOGGER.debug("Stored %s history for %s", month_key(month), self.id)
+
+    async def async_apply_retention(self, horizon: datetime) -> None:
+        """Downsample hourly consumptions older than horizon in every shard"""
+
+        for year in await self.async_years():
+            if year > horizon.year:
+                continue
+            data = await self.async_load_year(year)
+            if not any(x["datetime"] < horizon for x in data["consumptions"]):
+                continue
+            kept, daily, monthly = await self.hass.async_add_executor_job(
+                downsample, data["consumptions"], horizon
+            )
+            _LOGGER.info(
+                "Downsampling %s hourly consumptions of %s for %s",
+                len(data["consumptions"]) - len(kept),
+                year,
+                self.id,
+            )
+            data["consumptions"] = kept
+            data["consumptions_daily_sum"] = merge_by_datetime(
+                data["consumptions_daily_sum"], daily
+            )
+            data["consumptions_monthly_sum"] = merge_by_datetime(
+                data["consumptions_monthly_sum"], monthly
+            )
+            await self.async_save_year(year, data)
@@ -0,0 +1,170 @@
+"""Persisted PVPC price cache for e-data"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+from array import array
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+
+from . import const
+from .storage import async_get_store
+
+_LOGGER = logging.getLogger(__name__)
+
+HOUR = timedelta(hours=1)
+# REData serves realtime prices of the last month only
+MAX_FETCH_AGE = timedelta(days=30)
+
+
+class EdataPriceCache:
+    """Hourly PVPC prices shared by every supply, fetched once and kept on disk
+
+    Prices live in a dense array indexed by hours since the first one (gaps
+    are NaN), so a month of prices is a slice instead of a scan. It is
+    append-only: known prices are never fetched or overwritten again.
+
+    The first datetime and the array are kept, and replaced, as one tuple:
+    prices are added in the executor while supplies read them.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._store = async_get_store(hass, "pvpc_prices")
+        self._lock = asyncio.Lock()
+        self._loaded = False
+        # naive local datetime of the first array position, and the array
+        self._prices: tuple[datetime | None, array] = (None, array("d"))
+
+    @property
+    def start(self) -> datetime | None:
+        """Return the datetime of the first known price"""
+        return self._prices[0]
+
+    @property
+    def end(self) -> datetime | None:
+        """Return the datetime following the last known price"""
+        start, values = self._prices
+        if start is None:
+            return None
+        return start + len(values) * HOUR
+
+    async def async_load(self) -> None:
+        """Restore stored prices, once"""
+
+        if self._loaded:
+            return
+        stored = await self._store.async_load()
+        self._loaded = True
+        if stored and stored.get("start") is not None:
+            self._prices = (
+                datetime.fromisoformat(stored["start"]),
+                array("d", (math.nan if x is None else x for x in stored["values"])),
+            )
+
+    def _data_to_save(self) -> dict[str, Any]:
+        """Build the data to be stored (NaN gaps become nulls)"""
+        start, values = self._prices
+        return {
+            "start": start.isoformat() if start is not None else None,
+            "values": values.tolist(),
+        }
+
+    def _add(self, prices: Iterable[dict]) -> int:
+        """Add prices of unknown hours, returning how many were added"""
+
+        added = 0
+        for item in prices:
+            hour = item["datetime"].replace(minute=0, second=0, microsecond=0)
+            start, values = self._prices
+            if start is None:
+                start = hour
+                self._prices = (start, values)
+            elif hour < start:
+                # prepending shifts every index, so readers get a new array
+                values = array("d", [math.nan]) * ((start - hour) // HOUR) + values
+                start = hour
+                self._prices = (start, values)
+            idx = (hour - start) // HOUR
+            # appending keeps the indices that readers may be using
+            if idx >= len(values):
+                values.extend([math.nan] * (idx + 1 - len(values)))
+            if math.isnan(values[idx]):
+                values[idx] = item["value_eur_kWh"]
+                added += 1
+        return added
+
+    async def async_add(self, prices: list[dict]) -> None:
+        """Add prices obtained elsewhere (e.g., those stored by a supply)"""
+
+        await self.async_load()
+        if len(prices) == 0:
+            return
+        async with self._lock:
+            if await self.hass.async_add_executor_job(self._add, prices) > 0:
+                self._store.async_delay_save(
+                    self._data_to_save, const.STORAGE_SAVE_DELAY
+                )
+
+    async def async_update(self, date_from: datetime, date_to: datetime) -> None:
+        """Fetch prices following the last known one, up to date_to"""
+        # pylint: disable=import-outside-toplevel
+        from edata.connectors.redata import REDataConnector
+
+        await self.async_load()
+        # supplies updating together wait here, and then find prices known
+        async with self._lock:
+            oldest = (datetime.today() - MAX_FETCH_AGE).replace(
+                hour=0, minute=0, second=0, microsecond=0
+            )
+            gap_from = max(date_from, oldest, self.end or oldest)
+            prices = []
+            api = REDataConnector()
+            while len(prices) == 0 and gap_from < date_to:
+                prices = await self.hass.async_add_executor_job(
+                    api.get_realtime_prices, gap_from, date_to
+                )
+                gap_from = gap_from + timedelta(days=1)
+            added = await self.hass.async_add_executor_job(self._add, prices)
+            if added > 0:
+                _LOGGER.debug("Cached %s PVPC prices until %s", added, self.end)
+                self._store.async_delay_save(
+                    self._data_to_save, const.STORAGE_SAVE_DELAY
+                )
+
+    def get(self, date_from: datetime, date_to: datetime) -> list[dict]:
+        """Return known prices within [date_from, date_to), as edata PricingData"""
+
+        start, values = self._prices
+        if start is None:
+            return []
+        first = max((date_from - start) // HOUR, 0)
+        last = min(-((start - date_to) // HOUR), len(values))
+        return [
+            {"datetime": start + idx * HOUR, "value_eur_kWh": x, "delta_h": 1}
+            for idx, x in enumerate(values[first:last], first)
+            if not math.isnan(x)
+        ]
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return a JSON friendly summary"""
+        start, values = self._prices
+        end = start + len(values) * HOUR if start is not None else None
+        return {
+            "start": start.isoformat() if start is not None else None,
+            "end": end.isoformat() if end is not None else None,
+            "prices": sum(1 for x in values if not math.isnan(x)),
+        }
+
+
+@callback
+def async_get_price_cache(hass: HomeAssistant) -> EdataPriceCache:
+    """Get the PVPC price cache, shared by every supply"""
+
+    if const.DATA_PRICES not in hass.data:
+        hass.data[const.DATA_PRICES] = EdataPriceCache(hass)
+    return hass.data[const.DATA_PRICES]
@@ -0,0 +1,78 @@
+"""Update cycle profiling for e-data"""
+from __future__ import annotations
+
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+PERCENTILES = (50, 90, 99)
+
+
+class UpdateProfile:
+    """Phase timings and counters of a single update cycle"""
+
+    def __init__(self) -> None:
+        self.phases: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self._start = time.perf_counter()
+        self.total = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a phase, accumulating if it runs more than once"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    def count(self, name: str, value: int) -> None:
+        """Add to a counter"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self) -> None:
+        """Close the profile"""
+        self.total = time.perf_counter() - self._start
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return a JSON friendly summary"""
+        return {
+            "total_s": round(self.total or 0, 3),
+            "phases_s": {x: round(y, 3) for x, y in self.phases.items()},
+            **self.counters,
+        }
+
+
+class UpdateProfiles:
+    """Rolling window of update profiles"""
+
+    def __init__(self, maxlen: int = 48) -> None:
+        self._profiles: deque[UpdateProfile] = deque(maxlen=maxlen)
+
+    @property
+    def last(self) -> UpdateProfile | None:
+        """Return the most recent profile"""
+        return self._profiles[-1] if len(self._profiles) > 0 else None
+
+    def add(self, profile: UpdateProfile) -> None:
+        """Add a finished profile"""
+        self._profiles.append(profile)
+
+    def percentiles(self) -> dict[str, dict[str, float]]:
+        """Return rolling percentiles of the total and every phase duration"""
+
+        series = {"total": [x.total for x in self._profiles]}
+        for profile in self._profiles:
+            for name, value in profile.phases.items():
+                series.setdefault(name, []).append(value)
+
+        result = {}
+        for name, values in series.items():
+            values = sorted(values)
+            result[name] = {
+                f"p{x}": round(values[min(len(values) - 1, len(values) * x // 100)], 3)
+                for x in PERCENTILES
+            }
+        return result
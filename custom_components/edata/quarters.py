@@ -0,0 +1,311 @@
+"""Quarter-hour consumptions for e-data"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from . import const
+from .aggregates import month_key, month_start, next_month
+from .storage import async_get_store
+
+_LOGGER = logging.getLogger(__name__)
+
+QUARTER = timedelta(minutes=15)
+MEASUREMENT_TYPE_QUARTER_HOURLY = "1"
+# meters found without quarters are asked again after a while (e.g., replaced)
+UNSUPPORTED_RECHECK = timedelta(days=30)
+
+
+def parse_quarters(
+    response: Iterable[dict], date_from: datetime, date_to: datetime
+) -> list[dict]:
+    """Parse a quarter-hour get_consumption_data payload, dropping rows out of range"""
+
+    quarters = []
+    for item in response:
+        try:
+            hours, minutes = (int(x) for x in item["time"].split(":"))
+            # datadis times are the end of each interval, as in hourly data
+            start = (
+                datetime.strptime(item["date"], "%Y/%m/%d")
+                + timedelta(hours=hours, minutes=minutes)
+                - QUARTER
+            )
+            value = item["consumptionKWh"]
+            real = item["obtainMethod"] == "Real"
+        except (KeyError, TypeError, ValueError):
+            _LOGGER.warning("Weird quarter-hour consumption data, got %s", item)
+            continue
+        if date_from <= start <= date_to:
+            quarters.append(
+                {"datetime": start, "delta_h": 0.25, "value_kWh": value, "real": real}
+            )
+    return sorted(quarters, key=lambda x: x["datetime"])
+
+
+def hourly_from_quarters(quarters: Iterable[dict]) -> Iterator[dict]:
+    """Sum sorted quarter-hour consumptions into hourly ones, as a stream"""
+
+    for hour, items in itertools.groupby(
+        quarters, key=lambda x: x["datetime"].replace(minute=0)
+    ):
+        delta_h = 0.0
+        value = 0
+        real = True
+        for item in items:
+            delta_h += item["delta_h"]
+            value += item["value_kWh"]
+            real = real and item["real"]
+        delta_h = round(delta_h, 2)
+        yield {
+            "datetime": hour,
+            # full hours look exactly like those of hourly data
+            "delta_h": int(delta_h) if delta_h.is_integer() else delta_h,
+            "value_kWh": round(value, 3),
+            "real": real,
+        }
+
+
+def lacks_hours(hours: Iterable[dict], date_from: datetime) -> bool:
+    """Return whether sorted hourly consumptions leave hours out since date_from
+
+    Only gaps of two or more hours count, so that the hour skipped by the
+    daylight saving time change does not.
+    """
+
+    expected = date_from.replace(minute=0, second=0, microsecond=0)
+    for item in hours:
+        if item["datetime"] - expected > timedelta(hours=1):
+            return True
+        expected = item["datetime"] + timedelta(hours=1)
+    return False
+
+
+def fill_hours(hours: list[dict], hourly: Iterable[dict]) -> list[dict]:
+    """Add hourly consumptions of the hours not built from quarters"""
+
+    known = {x["datetime"] for x in hours}
+    return sorted(
+        hours + [x for x in hourly if x["datetime"] not in known],
+        key=lambda x: x["datetime"],
+    )
+
+
+def _month_length(month: datetime) -> int:
+    """Number of quarters in a month"""
+    return (next_month(month) - month) // QUARTER
+
+
+def encode_month(month: datetime, quarters: Iterable[dict]) -> dict[str, list]:
+    """Encode the quarters of a month as a dense list of values
+
+    Values are positional (gaps are None) and estimated ones are listed apart,
+    so a stored row costs a number instead of a dict with a datetime.
+    """
+
+    values = [None] * _month_length(month)
+    estimated = []
+    for item in quarters:
+        idx = (item["datetime"] - month) // QUARTER
+        values[idx] = item["value_kWh"]
+        if not item["real"]:
+            estimated.append(idx)
+    return {"values": values, "estimated": estimated}
+
+
+def decode_month(month: datetime, encoded: dict[str, list]) -> list[dict]:
+    """Decode the quarters of a month encoded by encode_month"""
+
+    estimated = set(encoded["estimated"])
+    return [
+        {
+            "datetime": month + idx * QUARTER,
+            "delta_h": 0.25,
+            "value_kWh": value,
+            "real": idx not in estimated,
+        }
+        for idx, value in enumerate(encoded["values"])
+        if value is not None
+    ]
+
+
+def merge_month(
+    month: datetime, encoded: dict[str, list] | None, quarters: list[dict]
+) -> dict[str, list]:
+    """Merge new quarters into an encoded month, new values taking precedence"""
+
+    if encoded is None:
+        return encode_month(month, quarters)
+    values = list(encoded["values"])
+    estimated = set(encoded["estimated"])
+    for item in quarters:
+        idx = (item["datetime"] - month) // QUARTER
+        values[idx] = item["value_kWh"]
+        if item["real"]:
+            estimated.discard(idx)
+        else:
+            estimated.add(idx)
+    return {"values": values, "estimated": sorted(estimated)}
+
+
+class EdataQuarters:
+    """Year-sharded storage for raw quarter-hour consumptions
+
+    Quarters are not part of the in-memory data: they are written as they are
+    fetched and read back on demand, while the rest of the integration works on
+    the hourly consumptions derived from them. Each year shard is loaded once
+    and changed under its own lock, as months of a year are fetched
+    concurrently.
+    """
+
+    def __init__(self, hass: HomeAssistant, scups: str) -> None:
+        self.hass = hass
+        self.id = scups.upper()
+        self._index = None
+        self._shards: dict[int, dict] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+
+    def _store(self, year: int | None = None) -> Store:
+        """Get the Store for a year shard, or for the index if no year is given"""
+        key = f"{self.id}_quarters"
+        if year is not None:
+            key = f"{key}_{year}"
+        return async_get_store(self.hass, key)
+
+    def path(self, year: int | None = None) -> str:
+        """Get the file path of a year shard, or of the index if no year is given"""
+        return self._store(year).path
+
+    async def _async_index(self) -> dict:
+        """Load the index of stored years"""
+        if self._index is None:
+            self._index = await self._store().async_load() or {}
+            self._index.setdefault("years", [])
+        return self._index
+
+    def _save_index(self) -> None:
+        """Schedule a save of the index"""
+        self._store().async_delay_save(lambda: self._index, const.STORAGE_SAVE_DELAY)
+
+    def _lock(self, year: int) -> asyncio.Lock:
+        """Get the lock guarding a year shard"""
+        return self._locks.setdefault(year, asyncio.Lock())
+
+    async def _async_shard(self, year: int) -> dict:
+        """Get the in-memory year shard, loading it on first use"""
+        if year not in self._shards:
+            self._shards[year] = await self._store(year).async_load() or {}
+        return self._shards[year]
+
+    def _save_shard(self, year: int) -> None:
+        """Schedule a save of a year shard"""
+        self._store(year).async_delay_save(
+            lambda: self._shards.get(year, {}), const.STORAGE_SAVE_DELAY
+        )
+
+    async def async_years(self) -> list[int]:
+        """Return stored years, oldest first"""
+        return sorted((await self._async_index())["years"])
+
+    async def async_is_unsupported(self) -> bool:
+        """Return whether the supply recently answered that it has no quarters"""
+
+        since = (await self._async_index()).get("unsupported_since")
+        return (
+            since is not None
+            and datetime.now() - datetime.fromisoformat(since) < UNSUPPORTED_RECHECK
+        )
+
+    async def async_report(self, found: bool) -> None:
+        """Record whether a real reply to a quarter-hour query had any quarters"""
+
+        index = await self._async_index()
+        if found:
+            if not index.get("supported") or "unsupported_since" in index:
+                index["supported"] = True
+                index.pop("unsupported_since", None)
+                self._save_index()
+        elif not index.get("supported") and not await self.async_is_unsupported():
+            # a supply that ever had quarters may just lack those of a month
+            index["unsupported_since"] = datetime.now().isoformat()
+            self._save_index()
+            _LOGGER.info(
+                "No quarter-hour consumptions for %s, hourly ones are fetched instead",
+                self.id,
+            )
+
+    async def async_add(self, quarters: list[dict]) -> None:
+        """Merge sorted quarters into their year shards"""
+
+        index = await self._async_index()
+        for year, year_quarters in itertools.groupby(
+            quarters, key=lambda x: x["datetime"].year
+        ):
+            async with self._lock(year):
+                shard = await self._async_shard(year)
+                for month, month_quarters in itertools.groupby(
+                    year_quarters, key=lambda x: month_start(x["datetime"])
+                ):
+                    shard[month_key(month)] = await self.hass.async_add_executor_job(
+                        merge_month,
+                        month,
+                        shard.get(month_key(month)),
+                        list(month_quarters),
+                    )
+                self._save_shard(year)
+            if year not in index["years"]:
+                index["years"].append(year)
+                self._save_index()
+
+    async def async_get(self, date_from: datetime, date_to: datetime) -> list[dict]:
+        """Read the quarters within a datetime range"""
+
+        result = []
+        month = month_start(date_from)
+        shard = None
+        while month <= date_to:
+            if shard is None or shard[0] != month.year:
+                shard = (month.year, await self._async_shard(month.year))
+            encoded = shard[1].get(month_key(month))
+            if encoded is not None:
+                quarters = await self.hass.async_add_executor_job(
+                    decode_month, month, encoded
+                )
+                result.extend(
+                    x for x in quarters if date_from <= x["datetime"] <= date_to
+                )
+            month = next_month(month)
+        return result
+
+    async def async_apply_retention(self, horizon: datetime) -> None:
+        """Drop months of quarters older than horizon"""
+
+        index = await self._async_index()
+        for year in list(index["years"]):
+            if year > horizon.year:
+                continue
+            if year < horizon.year:
+                async with self._lock(year):
+                    self._shards.pop(year, None)
+                    await self._store(year).async_remove()
+                index["years"].remove(year)
+                self._save_index()
+                _LOGGER.info("Dropped %s quarter-hour data for %s", year, self.id)
+                continue
+            async with self._lock(year):
+                shard = await self._async_shard(year)
+                expired = [x for x in shard if x < month_key(horizon)]
+                if len(expired) == 0:
+                    continue
+                for key in expired:
+                    shard.pop(key)
+                self._save_shard(year)
+            _LOGGER.info(
+                "Dropped %s months of quarter-hour data for %s", len(expired), self.id
+            )
@@ -0,0 +1,266 @@
+"""Recorder access for e-data, resolving HA version differences once"""
+from __future__ import annotations
+
+import functools
+import logging
+from datetime import datetime, timedelta
+from typing import Any
+
+from homeassistant.const import MAJOR_VERSION, MINOR_VERSION
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def get_db_instance(hass):
+    """Workaround for older HA versions"""
+    # pylint: disable=import-outside-toplevel
+    import homeassistant.components.recorder.util as recorder_util
+
+    try:
+        return recorder_util.get_instance(hass)
+    except AttributeError:
+        return hass
+
+
+def _schema():
+    """Get the statistics tables, wherever this HA version declares them"""
+    # pylint: disable=import-outside-toplevel
+    try:
+        from homeassistant.components.recorder.db_schema import (
+            Statistics,
+            StatisticsMeta,
+        )
+    except ImportError:
+        from homeassistant.components.recorder.models import Statistics, StatisticsMeta
+
+    return Statistics, StatisticsMeta
+
+
+class EdataRecorder:
+    """Bulk access to recorder statistics, for HA 2023.3 onwards
+
+    Returned statistics always hold their start and end as UTC timestamps.
+    """
+
+    # statistics columns holding the start and last reset of each row
+    START_COLUMN = "start_ts"
+    LAST_RESET_COLUMN = "last_reset_ts"
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._instance = get_db_instance(hass)
+
+    @staticmethod
+    def _timestamp(value: Any) -> float:
+        """Convert a start/end value as returned by the recorder into a timestamp"""
+        return value
+
+    def _period_query(self, start, end, statistic_ids, period, types):
+        """Run statistics_during_period (in the executor)"""
+        # pylint: disable=import-outside-toplevel
+        from homeassistant.components.recorder.statistics import (
+            statistics_during_period,
+        )
+
+        return statistics_during_period(
+            self.hass, start, end, set(statistic_ids), period, None, types
+        )
+
+    @classmethod
+    def _last_statistics(
+        cls, session, statistic_ids: list[str], types: set[str]
+    ) -> dict[str, dict | None]:
+        """Read the last hourly statistic of many ids with a single grouped query"""
+        # pylint: disable=import-outside-toplevel
+        from sqlalchemy import and_, func
+
+        Statistics, StatisticsMeta = _schema()
+        start = getattr(Statistics, cls.START_COLUMN)
+        columns = {
+            x: getattr(Statistics, cls.LAST_RESET_COLUMN if x == "last_reset" else x)
+            for x in sorted(types)
+        }
+        latest = (
+            session.query(Statistics.metadata_id, func.max(start).label("start"))
+            .join(StatisticsMeta, Statistics.metadata_id == StatisticsMeta.id)
+            .filter(StatisticsMeta.statistic_id.in_(statistic_ids))
+            .group_by(Statistics.metadata_id)
+            .subquery()
+        )
+        rows = (
+            session.query(StatisticsMeta.statistic_id, start, *columns.values())
+            .join(Statistics, Statistics.metadata_id == StatisticsMeta.id)
+            .join(
+                latest,
+                and_(
+                    Statistics.metadata_id == latest.c.metadata_id,
+                    start == latest.c.start,
+                ),
+            )
+            .all()
+        )
+
+        result = {x: None for x in statistic_ids}
+        for statistic_id, row_start, *values in rows:
+            if isinstance(row_start, datetime):
+                # datetime columns hold naive UTC values
+                row_start = dt_util.as_utc(row_start)
+                row_end = row_start + timedelta(hours=1)
+            else:
+                row_end = row_start + 3600
+            result[statistic_id] = {
+                "start": cls._timestamp(row_start),
+                "end": cls._timestamp(row_end),
+                **dict(zip(columns, values)),
+            }
+        return result
+
+    @classmethod
+    def _normalize(cls, stats: list[dict]) -> list[dict]:
+        """Make start and end of statistics UTC timestamps"""
+        return [
+            {
+                **x,
+                **{
+                    key: cls._timestamp(x[key])
+                    for key in ("start", "end")
+                    if x.get(key) is not None
+                },
+            }
+            for x in stats
+        ]
+
+    async def async_get_last_statistics(
+        self, statistic_ids: list[str], types: set[str]
+    ) -> dict[str, dict | None]:
+        """Fetch the last statistic of many ids, in a single query"""
+        # pylint: disable=import-outside-toplevel
+        from homeassistant.components.recorder.util import session_scope
+
+        def _get_last_statistics():
+            with session_scope(hass=self.hass) as session:
+                return self._last_statistics(session, statistic_ids, types)
+
+        return await self._instance.async_add_executor_job(_get_last_statistics)
+
+    async def async_statistics_during_period(
+        self,
+        start: datetime,
+        end: datetime | None,
+        statistic_ids: list[str],
+        period: str,
+        types: set[str],
+    ) -> dict[str, list[dict]]:
+        """Fetch statistics of many ids within a period, in a single query"""
+
+        stats = await self._instance.async_add_executor_job(
+            self._period_query, start, end, statistic_ids, period, types
+        )
+        return {x: self._normalize(stats.get(x, [])) for x in statistic_ids}
+
+    def async_import(self, metadata, stats: list) -> None:
+        """Queue external statistics for import"""
+        # pylint: disable=import-outside-toplevel
+        from homeassistant.components.recorder.statistics import (
+            async_add_external_statistics,
+        )
+
+        async_add_external_statistics(self.hass, metadata, stats)
+
+    async def async_get_metadata(self, statistic_ids: list[str]) -> dict[str, Any]:
+        """Fetch the metadata of the given statistic ids, if they exist"""
+        # pylint: disable=import-outside-toplevel
+        from homeassistant.components.recorder.statistics import get_metadata
+
+        return await self._instance.async_add_executor_job(
+            functools.partial(get_metadata, self.hass, statistic_ids=set(statistic_ids))
+        )
+
+    async def async_count_statistics(self, statistic_ids: list[str]) -> dict[str, int]:
+        """Count long term statistic rows of many ids, in a single query"""
+        # pylint: disable=import-outside-toplevel
+        from homeassistant.components.recorder.util import session_scope
+        from sqlalchemy import func
+
+        Statistics, StatisticsMeta = _schema()
+
+        def _count_statistics():
+            with session_scope(hass=self.hass) as session:
+                rows = (
+                    session.query(
+                        StatisticsMeta.statistic_id, func.count(Statistics.id)
+                    )
+                    .join(Statistics, Statistics.metadata_id == StatisticsMeta.id)
+                    .filter(StatisticsMeta.statistic_id.in_(statistic_ids))
+                    .group_by(StatisticsMeta.statistic_id)
+                    .all()
+                )
+            return {**{x: 0 for x in statistic_ids}, **dict(rows)}
+
+        return await self._instance.async_add_executor_job(_count_statistics)
+
+    async def async_clear(self, statistic_ids: list[str]) -> None:
+        """Clear statistics of many ids, returning once they are gone"""
+
+        if hasattr(self._instance, "async_clear_statistics") and hasattr(
+            self._instance, "async_block_till_done"
+        ):
+            # queued into the recorder thread, like any other write, and waited
+            # for so that reads following it do not see the cleared rows
+            self._instance.async_clear_statistics(statistic_ids)
+            await self._instance.async_block_till_done()
+            return
+
+        # pylint: disable=import-outside-toplevel
+        from homeassistant.components.recorder.const import DATA_INSTANCE
+        from homeassistant.components.recorder.statistics import clear_statistics
+
+        await self._instance.async_add_executor_job(
+            clear_statistics, self.hass.data[DATA_INSTANCE], statistic_ids
+        )
+
+
+class _DatetimeRecorder(EdataRecorder):
+    """HA 2022.12 to 2023.2, where start and end are datetimes"""
+
+    START_COLUMN = "start"
+    LAST_RESET_COLUMN = "last_reset"
+
+    @staticmethod
+    def _timestamp(value: Any) -> float:
+        return value.timestamp()
+
+
+class _LegacyRecorder(EdataRecorder):
+    """HA before 2022.12, without types filter and with ISO formatted datetimes"""
+
+    START_COLUMN = "start"
+    LAST_RESET_COLUMN = "last_reset"
+
+    @staticmethod
+    def _timestamp(value: Any) -> float:
+        if isinstance(value, str):
+            value = dt_util.parse_datetime(value)
+        return value.timestamp()
+
+    def _period_query(self, start, end, statistic_ids, period, types):
+        # pylint: disable=import-outside-toplevel
+        from homeassistant.components.recorder.statistics import (
+            statistics_during_period,
+        )
+
+        return statistics_during_period(
+            self.hass, start, end, list(statistic_ids), period
+        )
+
+
+def get_recorder(hass: HomeAssistant) -> EdataRecorder:
+    """Choose the recorder access matching the running HA version"""
+
+    if MAJOR_VERSION < 2022 or (MAJOR_VERSION == 2022 and MINOR_VERSION < 12):
+        return _LegacyRecorder(hass)
+    if MAJOR_VERSION == 2023 and MINOR_VERSION < 3:
+        return _DatetimeRecorder(hass)
+    return EdataRecorder(hass)
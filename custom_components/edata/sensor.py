@@ -2,27 +2,42 @@
 
 import json
 import logging
+import os
+from datetime import datetime, timedelta
 
 import voluptuous as vol
-from edata.connectors.datadis import RECENT_QUERIES_FILE
-from edata.processors import utils as edata_utils
+from edata.definitions import ATTRIBUTES
 from homeassistant.components.sensor import PLATFORM_SCHEMA, SensorEntity
 from homeassistant.config_entries import SOURCE_IMPORT
 from homeassistant.const import CONF_PASSWORD, CONF_USERNAME, EVENT_HOMEASSISTANT_START
 from homeassistant.core import CoreState, callback
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers import entity_platform
-from homeassistant.helpers.storage import Store
+from homeassistant.helpers.entity import EntityCategory
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from . import const
 from . import utils
 from .coordinator import EdataCoordinator
+from .files import EXPORT_COLUMNS, EXPORT_FORMATS
+from .storage import async_get_store
+from .watchdog import WATCHDOG
 from .websockets import async_register_websockets
 
 # HA variables
 _LOGGER = logging.getLogger(__name__)
 
+# attributes that also get their own lightweight sensor (attribute: icon)
+ATTRIBUTE_SENSORS = {
+    "yesterday_kWh": "mdi:flash",
+    "month_kWh": "mdi:flash",
+    "last_month_kWh": "mdi:flash",
+    "month_€": "mdi:currency-eur",
+    "last_month_€": "mdi:currency-eur",
+    "max_power_kW": "mdi:gauge",
+}
+
 PLATFORM_SCHEMA = vol.All(
     cv.deprecated(CONF_USERNAME),
     cv.deprecated(CONF_PASSWORD),
@@ -95,6 +110,10 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Set up entry."""
+    # pylint: disable=import-outside-toplevel
+    from edata.connectors.datadis import RECENT_QUERIES_FILE
+    from edata.processors import utils as edata_utils
+
     hass.data.setdefault(const.DOMAIN, {})
 
     usr = config_entry.data[CONF_USERNAME]
@@ -109,51 +128,22 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     authorized_nif = config_entry.data.get(const.CONF_AUTHORIZEDNIF, None)
     scups = config_entry.data.get(const.CONF_SCUPS, cups[-4:].upper())
 
-    is_pvpc = config_entry.options.get(const.CONF_PVPC, False)
-
-    billing = (
-        {
-            const.PRICE_P1_KW_YEAR: config_entry.options.get(const.PRICE_P1_KW_YEAR),
-            const.PRICE_P2_KW_YEAR: config_entry.options.get(const.PRICE_P2_KW_YEAR),
-            const.PRICE_P1_KWH: config_entry.options.get(const.PRICE_P1_KWH)
-            if not is_pvpc
-            else None,
-            const.PRICE_P2_KWH: config_entry.options.get(const.PRICE_P2_KWH)
-            if not is_pvpc
-            else None,
-            const.PRICE_P3_KWH: config_entry.options.get(const.PRICE_P3_KWH)
-            if not is_pvpc
-            else None,
-            const.PRICE_METER_MONTH: config_entry.options.get(const.PRICE_METER_MONTH),
-            const.PRICE_MARKET_KW_YEAR: config_entry.options.get(
-                const.PRICE_MARKET_KW_YEAR
-            ),
-            const.PRICE_ELECTRICITY_TAX: config_entry.options.get(
-                const.PRICE_ELECTRICITY_TAX
-            ),
-            const.PRICE_IVA: config_entry.options.get(const.PRICE_IVA),
-        }
-        if config_entry.options.get(const.CONF_BILLING, False)
-        else None
-    )
+    billing = utils.get_billing_from_options(config_entry.options)
 
     # load old data if any
-    serialized_data = await Store(
-        hass,
-        const.STORAGE_VERSION,
-        f"{const.STORAGE_KEY_PREAMBLE}_{scups}",
-    ).async_load()
-    storage = edata_utils.deserialize_dict(serialized_data)
-
-    datadis_recent_queries = await Store(
-        hass,
-        const.STORAGE_VERSION,
-        f"{const.STORAGE_KEY_PREAMBLE}_recent_queries",
-    ).async_load()
+    serialized_data = await async_get_store(hass, scups.upper()).async_load()
+    with WATCHDOG.section("deserialize stored data"):
+        storage = edata_utils.deserialize_dict(serialized_data)
+
+    datadis_recent_queries = await async_get_store(hass, "recent_queries").async_load()
 
     if datadis_recent_queries:
-        with open(RECENT_QUERIES_FILE, "w", encoding="utf8") as queries_file:
-            json.dump(datadis_recent_queries, queries_file)
+
+        def _write_recent_queries():
+            with open(RECENT_QUERIES_FILE, "w", encoding="utf8") as queries_file:
+                json.dump(datadis_recent_queries, queries_file)
+
+        await hass.async_add_executor_job(_write_recent_queries)
 
     platform = entity_platform.async_get_current_platform()
 
@@ -161,19 +151,66 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
         "recreate_statistics",
         {},
         "service_recreate_statistics",
+        required_features=[const.FEATURE_SUPPLY_SERVICES],
+    )
+
+    platform.async_register_entity_service(
+        "recompute_costs",
+        {vol.Optional("since"): cv.date},
+        "service_recompute_costs",
+        required_features=[const.FEATURE_SUPPLY_SERVICES],
+    )
+
+    platform.async_register_entity_service(
+        "backfill_history",
+        {
+            vol.Optional(
+                "years", default=const.DEFAULT_BACKFILL_YEARS
+            ): cv.positive_int,
+        },
+        "service_backfill_history",
+        required_features=[const.FEATURE_SUPPLY_SERVICES],
+    )
+
+    platform.async_register_entity_service(
+        "import_file",
+        {vol.Required("filename"): cv.string},
+        "service_import_file",
+        required_features=[const.FEATURE_SUPPLY_SERVICES],
     )
 
-    coordinator = EdataCoordinator(
-        hass,
-        usr,
-        pwd,
-        cups,
-        scups,
-        authorized_nif,
-        billing,
-        prev_data=None if not storage else storage,
+    platform.async_register_entity_service(
+        "export_data",
+        {
+            vol.Required("dataset"): vol.In(list(EXPORT_COLUMNS)),
+            vol.Required("start"): cv.date,
+            vol.Required("end"): cv.date,
+            vol.Optional("format", default="csv"): vol.In(EXPORT_FORMATS),
+        },
+        "service_export_data",
+        required_features=[const.FEATURE_SUPPLY_SERVICES],
     )
 
+    with WATCHDOG.section("create coordinator"):
+        coordinator = EdataCoordinator(
+            hass,
+            usr,
+            pwd,
+            cups,
+            scups,
+            authorized_nif,
+            billing,
+            prev_data=None if not storage else storage,
+            retention_months=config_entry.options.get(
+                const.CONF_RETENTION, const.DEFAULT_RETENTION_MONTHS
+            ),
+            quarter_hourly=config_entry.options.get(const.CONF_QUARTER_HOURLY, False),
+            aggregate=config_entry.options.get(const.CONF_AGGREGATE, False),
+            datadis_url=utils.get_datadis_url(),
+        )
+    hass.data[const.DOMAIN][scups.upper()][const.DATA_COORDINATOR] = coordinator
+    await coordinator.async_load_stored_data()
+
     # postpone first refresh to speed up startup
     @callback
     async def async_first_refresh(*args):
@@ -186,7 +223,14 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
         hass.bus.async_listen_once(EVENT_HOMEASSISTANT_START, async_first_refresh)
 
     # add sensor entities
-    async_add_entities([EdataSensor(coordinator)])
+    async_add_entities(
+        [EdataSensor(coordinator)]
+        + [
+            EdataAttributeSensor(coordinator, attribute, icon)
+            for attribute, icon in ATTRIBUTE_SENSORS.items()
+        ]
+        + [EdataProfileSensor(coordinator)]
+    )
 
     # register websockets
     async_register_websockets(hass)
@@ -199,6 +243,15 @@ class EdataSensor(CoordinatorEntity, SensorEntity):
 
     _attr_icon = "hass:flash"
     _attr_native_unit_of_measurement = None
+    # entity services only target this sensor, not the per-attribute ones
+    _attr_supported_features = const.FEATURE_SUPPLY_SERVICES
+
+    # attributes that change on every update are kept out of the recorder
+    _unrecorded_attributes = frozenset(
+        x
+        for x in ATTRIBUTES
+        if x.startswith(("yesterday_", "last_registered_", "month_"))
+    )
 
     def __init__(self, coordinator):
         """Initialize the sensor."""
@@ -221,3 +274,96 @@ class EdataSensor(CoordinatorEntity, SensorEntity):
         """Recreates statistics"""
         await self._coordinator.statistics.clear_all_statistics()
         await self._coordinator.statistics.update_statistics()
+
+    async def service_recompute_costs(self, since=None):
+        """Recomputes cost statistics only"""
+        await self._coordinator.async_recompute_costs(since)
+
+    async def service_backfill_history(self, years):
+        """Fetches history older than a year"""
+        await self._coordinator.async_backfill(years)
+
+    async def service_import_file(self, filename):
+        """Imports a Datadis CSV/XLSX export found under <config>/edata"""
+        folder = self.hass.config.path(const.DOMAIN)
+
+        def _resolve():
+            return os.path.realpath(folder), os.path.realpath(
+                os.path.join(folder, filename)
+            )
+
+        # files are read from the same folder exports are written to
+        folder, path = await self.hass.async_add_executor_job(_resolve)
+        if os.path.commonpath([folder, path]) != folder:
+            raise HomeAssistantError(f"{filename} is not a file under {folder}")
+        await self._coordinator.async_import_file(path)
+
+    async def service_export_data(self, dataset, start, end, **kwargs):
+        """Exports a dataset to a file under the config directory"""
+        await self._coordinator.async_export(
+            dataset,
+            datetime(start.year, start.month, start.day),
+            datetime(end.year, end.month, end.day) + timedelta(days=1),
+            kwargs.get("format", "csv"),
+        )
+
+
+class EdataAttributeSensor(CoordinatorEntity, SensorEntity):
+    """A lightweight sensor exposing a single e-data attribute"""
+
+    def __init__(self, coordinator, attribute, icon):
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+        self._attribute = attribute
+        self._attr_name = f"{coordinator.name}_{attribute.replace('€', 'eur')}"
+        self._attr_unique_id = f"{coordinator.id}_{attribute}"
+        self._attr_icon = icon
+        self._attr_native_unit_of_measurement = ATTRIBUTES[attribute]
+        self._data = coordinator.hass.data[const.DOMAIN][coordinator.id.upper()]
+        self._attr_native_value = self._get_value()
+
+    def _get_value(self):
+        """Get the attribute value from the shared storage"""
+        return self._data.get(const.DATA_ATTRIBUTES, {}).get(self._attribute)
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write the state only when the value changes."""
+        value = self._get_value()
+        if value == self._attr_native_value:
+            return
+        self._attr_native_value = value
+        self.async_write_ha_state()
+
+
+class EdataProfileSensor(CoordinatorEntity, SensorEntity):
+    """A diagnostic sensor with the duration of e-data updates"""
+
+    _attr_icon = "mdi:timer-outline"
+    _attr_native_unit_of_measurement = "s"
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _unrecorded_attributes = frozenset({"last", "percentiles"})
+
+    def __init__(self, coordinator):
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+        self._attr_name = f"{coordinator.name}_update_duration"
+        self._attr_unique_id = f"{coordinator.id}_update_duration"
+        self._coordinator = coordinator
+
+    @property
+    def native_value(self):
+        """Return the duration of the last update."""
+        last = self._coordinator.profiles.last
+        return round(last.total, 3) if last is not None else None
+
+    @property
+    def extra_state_attributes(self):
+        """Return the last profile and rolling percentiles."""
+        last = self._coordinator.profiles.last
+        if last is None:
+            return {}
+        return {
+            "last": last.as_dict(),
+            "percentiles": self._coordinator.profiles.percentiles(),
+        }
@@ -0,0 +1,165 @@
+"""Compact in-memory series for e-data"""
+from __future__ import annotations
+
+import math
+import sys
+from array import array
+from collections.abc import Iterator, Sequence
+from datetime import datetime, timedelta
+from typing import Any
+
+# series that are only read between updates, so they can be kept compact
+COMPACT_SERIES = [
+    "consumptions",
+    "maximeter",
+    "consumptions_daily_sum",
+    "consumptions_monthly_sum",
+    "cost_hourly_sum",
+    "cost_daily_sum",
+    "cost_monthly_sum",
+]
+
+EPOCH = datetime(1970, 1, 1)
+
+TYPE_BOOL = "b"
+TYPE_INT = "q"
+TYPE_FLOAT = "d"
+TYPE_DATETIME = "t"
+
+
+def _column_type(values: list[Any]) -> str | None:
+    """Find the array type able to hold a column, None if there is none"""
+
+    if all(isinstance(x, bool) for x in values):
+        return TYPE_BOOL
+    if all(isinstance(x, datetime) and x.tzinfo is None for x in values):
+        return TYPE_DATETIME
+    if all(isinstance(x, int) and not isinstance(x, bool) for x in values):
+        return TYPE_INT
+    if all(
+        x is None or (isinstance(x, (int, float)) and not isinstance(x, bool))
+        for x in values
+    ):
+        return TYPE_FLOAT
+    return None
+
+
+class CompactSeries(Sequence):
+    """Read-only, column-oriented list of dicts sharing the same keys
+
+    Values are kept in typed arrays (datetimes as seconds since epoch), and
+    dicts are only built when items are accessed.
+    """
+
+    __slots__ = ("_keys", "_types", "_columns", "_len")
+
+    def __init__(
+        self, keys: list[str], types: list[str], columns: list[array], length: int
+    ) -> None:
+        self._keys = keys
+        self._types = types
+        self._columns = columns
+        self._len = length
+
+    @classmethod
+    def from_dicts(cls, rows: Sequence[dict]) -> CompactSeries | None:
+        """Build a compact series from a list of dicts, None if not suitable"""
+
+        if len(rows) == 0:
+            return None
+        keys = list(rows[0])
+        if any(len(x) != len(keys) or any(k not in x for k in keys) for x in rows):
+            return None
+
+        types = []
+        columns = []
+        for key in keys:
+            values = [x[key] for x in rows]
+            _type = _column_type(values)
+            if _type is None:
+                return None
+            if _type == TYPE_DATETIME:
+                column = array(
+                    TYPE_INT, ((x - EPOCH) // timedelta(seconds=1) for x in values)
+                )
+            elif _type == TYPE_FLOAT:
+                column = array(
+                    TYPE_FLOAT, (math.nan if x is None else x for x in values)
+                )
+            else:
+                column = array(_type, values)
+            types.append(_type)
+            columns.append(column)
+        return cls(keys, types, columns, len(rows))
+
+    @staticmethod
+    def _decode(_type: str, value: Any) -> Any:
+        """Decode a stored value"""
+        if _type == TYPE_DATETIME:
+            return EPOCH + timedelta(seconds=value)
+        if _type == TYPE_BOOL:
+            return bool(value)
+        if _type == TYPE_FLOAT and math.isnan(value):
+            return None
+        return value
+
+    def _row(self, idx: int) -> dict[str, Any]:
+        """Build the dict view of a row"""
+        return {
+            key: self._decode(_type, column[idx])
+            for key, _type, column in zip(self._keys, self._types, self._columns)
+        }
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._row(i) for i in range(*idx.indices(self._len))]
+        if idx < 0:
+            idx += self._len
+        if not 0 <= idx < self._len:
+            raise IndexError("CompactSeries index out of range")
+        return self._row(idx)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        for idx in range(self._len):
+            yield self._row(idx)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the stored values"""
+        return sum(x.itemsize * len(x) for x in self._columns)
+
+
+def compact_data(data: dict[str, Any]) -> None:
+    """Replace suitable series of an EdataData dict by compact ones, in place"""
+
+    for key in COMPACT_SERIES:
+        if isinstance(data.get(key), list):
+            series = CompactSeries.from_dicts(data[key])
+            if series is not None:
+                data[key] = series
+
+
+def expand_data(data: dict[str, Any]) -> dict[str, Any]:
+    """Return a shallow copy of an EdataData dict with plain lists, for serialization"""
+
+    return {
+        key: list(value) if isinstance(value, CompactSeries) else value
+        for key, value in data.items()
+    }
+
+
+def estimate_nbytes(series: Any) -> int:
+    """Estimate the memory used by a series (or any other EdataData value)"""
+
+    if isinstance(series, CompactSeries):
+        return sys.getsizeof(series) + sum(sys.getsizeof(x) for x in series._columns)
+    if isinstance(series, list):
+        return sys.getsizeof(series) + sum(
+            sys.getsizeof(x)
+            + (sum(sys.getsizeof(y) for y in x.values()) if isinstance(x, dict) else 0)
+            for x in series
+        )
+    return sys.getsizeof(series)
@@ -1,31 +1,22 @@
 """HA Long Term Statistics for e-data"""
 from __future__ import annotations
 
+import heapq
 import logging
-from datetime import datetime
+import math
+from collections.abc import Iterator
+from contextlib import nullcontext
+from datetime import datetime, timedelta
 from typing import Any
 
-import homeassistant.components.recorder.util as recorder_util
-from edata.processors import utils
-from homeassistant.components.recorder.const import DATA_INSTANCE
-from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
-from homeassistant.components.recorder.statistics import (
-    async_add_external_statistics,
-    clear_statistics,
-    get_last_statistics,
-    list_statistic_ids,
-    statistics_during_period,
-)
-from homeassistant.const import (
-    CURRENCY_EURO,
-    ENERGY_KILO_WATT_HOUR,
-    MAJOR_VERSION,
-    MINOR_VERSION,
-    POWER_KILO_WATT,
-)
+from homeassistant.const import CURRENCY_EURO, ENERGY_KILO_WATT_HOUR, POWER_KILO_WATT
 from homeassistant.util import dt as dt_util
 
 from . import const
+from .aggregates import bisect_datetime
+from .profiling import UpdateProfile
+from .recorder import get_recorder
+from .storage import async_get_store
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -47,26 +38,19 @@ ALIAS_ENERGY_P2_EUR = "p2_energy_eur"
 ALIAS_ENERGY_P3_EUR = "p3_energy_eur"
 
 
-def get_db_instance(hass):
-    """Workaround for older HA versions"""
-    try:
-        return recorder_util.get_instance(hass)
-    except AttributeError:
-        return hass
-
-
 class EdataStatistics:
     """A helper for long term statistics in edata"""
 
     def __init__(self, hass, sensor_id, enable_billing, do_reset, edata_helper):
         self.id = sensor_id
         self.hass = hass
-        self._billing = enable_billing
+        self._billing = None
         self._reset = do_reset
         self._edata = edata_helper
+        self._recorder = get_recorder(hass)
 
-        # stat id aliases
-        self.sid = {
+        # every stat id this supply may have created, billing or not
+        self.statistic_ids = {
             ALIAS_KWH: const.STAT_ID_KWH(self.id),
             ALIAS_P1_KWH: const.STAT_ID_P1_KWH(self.id),
             ALIAS_P2_KWH: const.STAT_ID_P2_KWH(self.id),
@@ -74,21 +58,25 @@ class EdataStatistics:
             ALIAS_KW: const.STAT_ID_KW(self.id),
             ALIAS_P1_KW: const.STAT_ID_P1_KW(self.id),
             ALIAS_P2_KW: const.STAT_ID_P2_KW(self.id),
+            ALIAS_EUR: const.STAT_ID_EUR(self.id),
+            ALIAS_P1_EUR: const.STAT_ID_P1_EUR(self.id),
+            ALIAS_P2_EUR: const.STAT_ID_P2_EUR(self.id),
+            ALIAS_P3_EUR: const.STAT_ID_P3_EUR(self.id),
+            ALIAS_POWER_EUR: const.STAT_ID_POWER_EUR(self.id),
+            ALIAS_ENERGY_EUR: const.STAT_ID_ENERGY_EUR(self.id),
+            ALIAS_ENERGY_P1_EUR: const.STAT_ID_P1_ENERGY_EUR(self.id),
+            ALIAS_ENERGY_P2_EUR: const.STAT_ID_P2_ENERGY_EUR(self.id),
+            ALIAS_ENERGY_P3_EUR: const.STAT_ID_P3_ENERGY_EUR(self.id),
         }
-        if self._billing:
-            self.sid.update(
-                {
-                    ALIAS_EUR: const.STAT_ID_EUR(self.id),
-                    ALIAS_P1_EUR: const.STAT_ID_P1_EUR(self.id),
-                    ALIAS_P2_EUR: const.STAT_ID_P2_EUR(self.id),
-                    ALIAS_P3_EUR: const.STAT_ID_P3_EUR(self.id),
-                    ALIAS_POWER_EUR: const.STAT_ID_POWER_EUR(self.id),
-                    ALIAS_ENERGY_EUR: const.STAT_ID_ENERGY_EUR(self.id),
-                    ALIAS_ENERGY_P1_EUR: const.STAT_ID_P1_ENERGY_EUR(self.id),
-                    ALIAS_ENERGY_P2_EUR: const.STAT_ID_P2_ENERGY_EUR(self.id),
-                    ALIAS_ENERGY_P3_EUR: const.STAT_ID_P3_ENERGY_EUR(self.id),
-                }
-            )
+
+        # stat id aliases
+        self.sid = {}
+        self._metadata = {}
+        self._checkpoints = None
+        self.last_import = None
+        # set when this supply is combined into the virtual supply
+        self.virtual_supply = None
+        self._store = async_get_store(hass, f"{sensor_id.upper()}_checkpoints")
 
         # stats id grouping
         self.consumption_stats = [ALIAS_P1_KWH, ALIAS_P2_KWH, ALIAS_P3_KWH, ALIAS_KWH]
@@ -104,32 +92,43 @@ class EdataStatistics:
             ALIAS_P2_EUR,
             ALIAS_P3_EUR,
         ]
+        self.set_billing(enable_billing)
+
+    def set_billing(self, enable_billing: bool) -> None:
+        """Enable or disable cost statistics"""
+
+        self._billing = enable_billing
+        self._metadata = {}
+        self._checkpoints = None
+        self.sid = {
+            x: y
+            for x, y in self.statistic_ids.items()
+            if self._billing or x not in self.cost_stats
+        }
+
+    @property
+    def checkpoints_path(self) -> str:
+        """Get the file path of the persisted checkpoints"""
+        return self._store.path
+
+    async def async_count_statistics(self) -> dict[str, int]:
+        """Count recorder statistic rows per alias"""
+
+        counts = await self._recorder.async_count_statistics(list(self.sid.values()))
+        return {x: counts[y] for x, y in self.sid.items()}
 
     async def test_statistics_integrity(self):
         """Test statistics integrity"""
 
         for aggr in ("month", "day"):
             # for each aggregation method (month/day)
-            if MAJOR_VERSION < 2022 or (MAJOR_VERSION == 2022 and MINOR_VERSION < 12):
-                _stats = await get_db_instance(self.hass).async_add_executor_job(
-                    statistics_during_period,
-                    self.hass,
-                    dt_util.as_local(datetime(1970, 1, 1)),
-                    None,
-                    [self.sid[x] for x in self.consumption_stats],
-                    aggr,
-                )
-            else:
-                _stats = await get_db_instance(self.hass).async_add_executor_job(
-                    statistics_during_period,
-                    self.hass,
-                    dt_util.as_local(datetime(1970, 1, 1)),
-                    None,
-                    [self.sid[x] for x in self.consumption_stats],
-                    aggr,
-                    None,
-                    set(["sum"]),
-                )
+            _stats = await self._recorder.async_statistics_during_period(
+                dt_util.as_local(datetime(1970, 1, 1)),
+                None,
+                [self.sid[x] for x in self.consumption_stats],
+                aggr,
+                {"sum"},
+            )
             for key in _stats:
                 # for each stat key (p1, p2, p3...)
                 _sum = 0
@@ -144,101 +143,217 @@ class EdataStatistics:
     async def clear_all_statistics(self):
         """Clear edata long term statistics"""
 
-        # get all ids starting with edata:xxxx
-        all_ids = await get_db_instance(self.hass).async_add_executor_job(
-            list_statistic_ids, self.hass
+        # look up only the ids this supply may have created
+        to_clear = list(
+            await self._recorder.async_get_metadata(list(self.statistic_ids.values()))
         )
-        to_clear = [
-            x["statistic_id"]
-            for x in all_ids
-            if x["statistic_id"].startswith(f"{const.DOMAIN}:{self.id}")
-        ]
+        self._checkpoints = None
         if len(to_clear) > 0:
             # wipe them
             _LOGGER.warning(
                 const.WARN_STATISTICS_CLEAR,
                 to_clear,
             )
-            await get_db_instance(self.hass).async_add_executor_job(
-                clear_statistics,
-                self.hass.data[DATA_INSTANCE],
-                to_clear,
-            )
+            await self._recorder.async_clear(to_clear)
+        if self.virtual_supply is not None:
+            await self.virtual_supply.async_remove_member(self.id)
 
-    async def update_statistics(self):
+    async def update_statistics(self, profile: UpdateProfile | None = None):
         """Update Long Term Statistics with newly found data"""
-        # fetch last stats
-        if MAJOR_VERSION < 2022 or (MAJOR_VERSION == 2022 and MINOR_VERSION < 12):
-            last_stats = {
-                x: await get_db_instance(self.hass).async_add_executor_job(
-                    get_last_statistics, self.hass, 1, self.sid[x], True
-                )
-                for x in self.sid
-            }
-        else:
-            last_stats = {
-                x: await get_db_instance(self.hass).async_add_executor_job(
-                    get_last_statistics,
-                    self.hass,
-                    1,
-                    self.sid[x],
-                    True,
-                    set(["max", "sum"]),
-                )
-                for x in self.sid
-            }
+
+        with profile.phase("statistics_read") if profile else nullcontext():
+            checkpoints = await self._async_get_checkpoints()
+        last_stats = {
+            x: {self.sid[x]: [{"sum": checkpoints[x]["sum"]}]}
+            if checkpoints[x]["end"] is not None
+            else {}
+            for x in self.sid
+        }
 
         # get last record local datetime and eval if any stat is missing
         last_record_dt = {}
-        try:
-            if MAJOR_VERSION < 2022 or (MAJOR_VERSION == 2022 and MINOR_VERSION < 12):
-                last_record_dt = {
-                    x: dt_util.parse_datetime(last_stats[x][self.sid[x]][0]["end"])
-                    for x in self.sid
-                }
-            elif MAJOR_VERSION == 2023 and MINOR_VERSION < 3:
-                last_record_dt = {
-                    x: dt_util.as_local(last_stats[x][self.sid[x]][0]["end"])
-                    for x in self.sid
-                }
-            else:
-                last_record_dt = {
-                    x: dt_util.as_local(
-                        dt_util.utc_from_timestamp(last_stats[x][self.sid[x]][0]["end"])
-                    )
-                    for x in self.sid
-                }
-        except KeyError:
+        if any(checkpoints[x]["end"] is None for x in self.sid):
             if not self._reset:
                 _LOGGER.warning(const.WARN_MISSING_STATS, self.id)
+        else:
+            last_record_dt = {
+                x: dt_util.as_local(dt_util.utc_from_timestamp(checkpoints[x]["end"]))
+                for x in self.sid
+            }
+
+        dt_from = {
+            "consumptions": last_record_dt.get(ALIAS_KWH, None),
+            "maximeter": last_record_dt.get(ALIAS_KW, None),
+        }
+        if self._billing:
+            dt_from["cost_hourly_sum"] = last_record_dt.get(ALIAS_EUR, None)
+
+        with profile.phase("statistics_import") if profile else nullcontext():
+            last = await self._async_run_pipeline(dt_from, last_stats, profile=profile)
+
+        # statistics are hourly, so each one ends an hour after it starts
+        for scope, stat in last.items():
+            checkpoints[scope] = {
+                "end": stat["start"].timestamp() + 3600,
+                "sum": stat.get("sum"),
+            }
+        self._store.async_delay_save(lambda: checkpoints, const.STORAGE_SAVE_DELAY)
+
+    async def _async_get_checkpoints_from_recorder(
+        self, scopes: list[str]
+    ) -> dict[str, dict]:
+        """Read checkpoints (end timestamp and sum) of some scopes from the recorder"""
 
-        new_stats = {x: [] for x in self.sid}
+        last_stats = await self._recorder.async_get_last_statistics(
+            [self.sid[x] for x in scopes], {"max", "sum"}
+        )
+        return {
+            x: {"end": None, "sum": None}
+            if last_stats[self.sid[x]] is None
+            else {
+                "end": last_stats[self.sid[x]]["end"],
+                "sum": last_stats[self.sid[x]].get("sum"),
+            }
+            for x in scopes
+        }
 
-        new_stats.update(
-            self._build_consumption_stats(
-                dt_from=last_record_dt.get(ALIAS_KWH, None),
-                last_stats=last_stats,
+    async def _async_get_checkpoints(self) -> dict[str, dict]:
+        """Get every statistic's last end and sum, from the recorder only if needed"""
+
+        if self._checkpoints is not None and all(
+            x in self._checkpoints for x in self.sid
+        ):
+            return self._checkpoints
+
+        # stored checkpoints are trusted if the main series match the recorder
+        stored = await self._store.async_load() or {}
+        probes = [x for x in (ALIAS_KWH, ALIAS_EUR) if x in self.sid]
+        recorded = await self._async_get_checkpoints_from_recorder(probes)
+        if all(x in stored for x in self.sid) and all(
+            stored[x]["end"] == recorded[x]["end"]
+            and math.isclose(stored[x]["sum"] or 0, recorded[x]["sum"] or 0)
+            for x in probes
+        ):
+            _LOGGER.debug("Using stored statistics checkpoints for %s", self.id)
+            self._checkpoints = {x: stored[x] for x in self.sid}
+        else:
+            _LOGGER.debug(
+                "Reading statistics checkpoints for %s from recorder", self.id
             )
+            self._checkpoints = await self._async_get_checkpoints_from_recorder(
+                list(self.sid)
+            )
+        return self._checkpoints
+
+    async def rebuild_cost_statistics(self, dt_from: datetime | None = None):
+        """Rebuild cost statistics from in-memory data, leaving kWh and kW untouched"""
+
+        if self._billing:
+            await self.rebuild_statistics(dt_from, cost_only=True)
+
+    async def rebuild_statistics(
+        self,
+        dt_from: datetime | None = None,
+        last_stats: dict[str, Any] | None = None,
+        cost_only: bool = False,
+    ):
+        """Rebuild summable statistics from in-memory data, continuing previous sums"""
+
+        consumptions = self._edata.data.get("consumptions", [])
+        if len(consumptions) == 0:
+            return
+
+        # in-memory data is the only source, so older stats are kept as they are
+        first_dt = dt_util.as_local(consumptions[0]["datetime"])
+        dt_from = (
+            first_dt if dt_from is None else max(dt_util.as_local(dt_from), first_dt)
         )
 
+        scopes = list(self.cost_stats) if self._billing else []
+        if not cost_only:
+            scopes.extend(self.consumption_stats)
+
+        _LOGGER.info("Rebuilding %s statistics since %s: %s", self.id, dt_from, scopes)
+        self._checkpoints = None
+        if last_stats is None:
+            last_stats = await self._get_statistics_before(dt_from, scopes)
+
+        series = [] if cost_only else ["consumptions"]
         if self._billing:
-            new_stats.update(
-                self._build_cost_stats(
-                    dt_from=last_record_dt.get(ALIAS_EUR, None),
-                    last_stats=last_stats,
-                )
-            )
+            series.append("cost_hourly_sum")
+        await self._async_run_pipeline({x: dt_from for x in series}, last_stats)
+
+    async def import_history(
+        self,
+        data: dict[str, list],
+        dt_from: datetime,
+        last_stats: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        """Import statistics for data out of memory, returning the updated sums"""
+
+        dt_from = dt_util.as_local(dt_from)
+        scopes = list(self.consumption_stats)
+        if self._billing:
+            scopes.extend(self.cost_stats)
+        if last_stats is None:
+            last_stats = await self._get_statistics_before(dt_from, scopes)
+        self._checkpoints = None
 
-        new_stats.update(
-            self._build_maximeter_stats(dt_from=last_record_dt.get(ALIAS_KW, None))
+        series = ["consumptions", "maximeter"]
+        if self._billing:
+            series.append("cost_hourly_sum")
+        last = await self._async_run_pipeline(
+            {x: dt_from for x in series}, last_stats, data
         )
 
-        await self._add_statistics(new_stats)
+        # chain sums so that the next import can continue them
+        for scope in scopes:
+            if scope in last:
+                last_stats[scope] = {self.sid[scope]: [last[scope]]}
+        return last_stats
 
-    async def _add_statistics(self, new_stats):
-        """Add new statistics"""
+    async def get_hourly_consumptions(
+        self, dt_from: datetime, dt_to: datetime
+    ) -> list[dict[str, Any]]:
+        """Read hourly consumptions back from statistics (e.g., of downsampled days)"""
+
+        sid = self.sid[ALIAS_KWH]
+        _stats = await self._recorder.async_statistics_during_period(
+            dt_util.as_local(dt_from), dt_util.as_local(dt_to), [sid], "hour", {"state"}
+        )
+        return [
+            {
+                "datetime": dt_util.as_local(
+                    dt_util.utc_from_timestamp(stat["start"])
+                ).replace(tzinfo=None),
+                "delta_h": 1,
+                "value_kWh": stat["state"],
+                "real": True,
+            }
+            for stat in _stats[sid]
+        ]
+
+    async def _get_statistics_before(self, dt_to: datetime, scopes: list[str]):
+        """Fetch the last statistic before a datetime, as get_last_statistics does"""
+
+        ids = [self.sid[x] for x in scopes]
+        # a month margin is enough to skip any usual gap
+        _stats = await self._recorder.async_statistics_during_period(
+            dt_to - timedelta(days=31), dt_to, ids, "hour", {"sum"}
+        )
+        return {
+            x: {self.sid[x]: _stats[self.sid[x]][-1:]}
+            if len(_stats[self.sid[x]]) > 0
+            else {}
+            for x in scopes
+        }
+
+    def _get_metadata(self, scope: str):
+        """Get the (fixed) metadata of a statistic, building it on first use"""
+        # pylint: disable=import-outside-toplevel
+        from homeassistant.components.recorder.models import StatisticMetaData
 
-        for scope in new_stats:
+        if scope not in self._metadata:
             if scope in self.consumption_stats:
                 metadata = StatisticMetaData(
                     has_mean=False,
@@ -267,156 +382,128 @@ class EdataStatistics:
                     unit_of_measurement=POWER_KILO_WATT,
                 )
             else:
-                continue
-            async_add_external_statistics(self.hass, metadata, new_stats[scope])
-
-    def _build_consumption_stats(
-        self, dt_from: datetime | None, last_stats: list[dict[str, Any]]
-    ):
-        """Build long-term statistics for consumptions"""
-        dt_from = (
-            dt_util.as_local(datetime(1970, 1, 1))
-            if dt_from is None
-            else dt_util.as_local(dt_from)
-        )
-
-        # retrieve sum for summable stats (consumptions)
-        _significant_stats = []
-        _significant_stats.extend(self.consumption_stats)
+                return None
+            self._metadata[scope] = metadata
+        return self._metadata[scope]
 
-        _sum = {
-            x: last_stats[x][self.sid[x]][0].get("sum", 0) if last_stats[x] else 0
-            for x in _significant_stats
-        }
-
-        new_stats = {x: [] for x in _significant_stats}
+    async def _add_statistics(self, new_stats):
+        """Add new statistics"""
 
+        for scope, stats in new_stats.items():
+            metadata = self._get_metadata(scope)
+            if metadata is None or len(stats) == 0:
+                continue
+            self._recorder.async_import(metadata, stats)
+            if self.virtual_supply is not None:
+                self.virtual_supply.record(self.id, scope, stats)
+
+    async def _async_run_pipeline(
+        self,
+        dt_from: dict[str, datetime | None],
+        last_stats: dict[str, Any],
+        data: dict[str, list] | None = None,
+        profile: UpdateProfile | None = None,
+    ) -> dict[str, Any]:
+        """Add statistics batch by batch, returning the last statistic per scope"""
+
+        last = {}
+        for batch in self._iter_statistics(dt_from, last_stats, data):
+            await self._add_statistics(batch)
+            self.last_import = dt_util.utcnow()
+            for scope, stats in batch.items():
+                last[scope] = stats[-1]
+                if profile is not None:
+                    profile.count("rows_imported", len(stats))
+        if self.virtual_supply is not None:
+            await self.virtual_supply.async_flush()
+        return last
+
+    def _iter_statistics(
+        self,
+        dt_from: dict[str, datetime | None],
+        last_stats: dict[str, Any],
+        data: dict[str, list] | None = None,
+    ) -> Iterator[dict[str, list]]:
+        """Build statistics for several series in a single pass, one month per batch
+
+        dt_from maps the series to process (consumptions, cost_hourly_sum and/or
+        maximeter) to the datetime their statistics start from.
+        """
+        # pylint: disable=import-outside-toplevel
+        from edata.processors import utils
+        from homeassistant.components.recorder.models import StatisticData
+
+        source = self._edata.data if data is None else data
         if len(self._edata.data[const.DATA_CONTRACTS]) == 0:
-            return {}
-
-        _label = "value_kWh"
-        for data in self._edata.data.get("consumptions", {}):
-            dt_found = dt_util.as_local(data["datetime"])
-            if dt_found >= dt_from:
-                _p = utils.get_pvpc_tariff(data["datetime"])
-                _sum[ALIAS_KWH] += data[_label]
-                new_stats[ALIAS_KWH].append(
-                    StatisticData(
-                        start=dt_found,
-                        state=data[_label],
-                        sum=_sum[ALIAS_KWH],
-                    )
-                )
-                _sum[_p + "_kWh"] += data[_label]
-                new_stats[_p + "_kWh"].append(
-                    StatisticData(
-                        start=dt_found,
-                        state=data[_label],
-                        sum=_sum[_p + "_kWh"],
-                    )
-                )
-        return new_stats
-
-    def _build_cost_stats(
-        self, dt_from: datetime | None, last_stats: list[dict[str, Any]]
-    ):
-        """Build long-term statistics for cost"""
-        dt_from = (
-            dt_util.as_local(datetime(1970, 1, 1))
-            if dt_from is None
-            else dt_util.as_local(dt_from)
-        )
-
-        # retrieve sum for summable stats (costs)
-        _significant_stats = []
-        _significant_stats.extend(self.cost_stats)
-
+            dt_from.pop("consumptions", None)
+
+        # retrieve sum for summable stats
+        summable = []
+        if "consumptions" in dt_from:
+            summable.extend(self.consumption_stats)
+        if "cost_hourly_sum" in dt_from:
+            summable.extend(self.cost_stats)
         _sum = {
-            x: last_stats[x][self.sid[x]][0].get("sum", 0) if last_stats[x] else 0
-            for x in _significant_stats
+            x: last_stats[x][self.sid[x]][0].get("sum", 0) if last_stats.get(x) else 0
+            for x in summable
         }
 
-        new_stats = {x: [] for x in _significant_stats}
-
-        for data in self._edata.data.get("cost_hourly_sum", {}):
-            dt_found = dt_util.as_local(data["datetime"])
-            if dt_found >= dt_from:
-                _p = utils.get_pvpc_tariff(data["datetime"])
-
-                _sum[ALIAS_POWER_EUR] += data["power_term"]
-                _sum[ALIAS_ENERGY_EUR] += data["energy_term"]
-                _sum[ALIAS_EUR] += data["value_eur"]
-
-                new_stats[ALIAS_POWER_EUR].append(
-                    StatisticData(
-                        start=dt_found,
-                        state=data["power_term"],
-                        sum=_sum[ALIAS_POWER_EUR],
-                    )
-                )
-
-                new_stats[ALIAS_ENERGY_EUR].append(
-                    StatisticData(
-                        start=dt_found,
-                        state=data["energy_term"],
-                        sum=_sum[ALIAS_ENERGY_EUR],
-                    )
-                )
-                _sum[_p + "_" + ALIAS_ENERGY_EUR] += data["energy_term"]
-                new_stats[_p + "_" + ALIAS_ENERGY_EUR].append(
-                    StatisticData(
-                        start=dt_found,
-                        state=data["energy_term"],
-                        sum=_sum[_p + "_" + ALIAS_ENERGY_EUR],
-                    )
-                )
-
-                new_stats[ALIAS_EUR].append(
-                    StatisticData(
-                        start=dt_found,
-                        state=data["value_eur"],
-                        sum=_sum[ALIAS_EUR],
-                    )
-                )
-
-                _sum[_p + "_" + ALIAS_EUR] += data["value_eur"]
-                new_stats[_p + "_" + ALIAS_EUR].append(
-                    StatisticData(
-                        start=dt_found,
-                        state=data["value_eur"],
-                        sum=_sum[_p + "_" + ALIAS_EUR],
-                    )
+        def _stream(key, since):
+            series = source.get(key, [])
+            start = (
+                0
+                if since is None
+                else bisect_datetime(
+                    series, dt_util.as_local(since).replace(tzinfo=None)
                 )
+            )
+            for idx in range(start, len(series)):
+                yield series[idx]["datetime"], key, series[idx]
 
-        return new_stats
+        batch = {}
 
-    def _build_maximeter_stats(self, dt_from: datetime | None):
-        """Build long-term statistics for maximeter"""
+        def _add_sum(scope, start, value):
+            _sum[scope] += value
+            batch.setdefault(scope, []).append(
+                StatisticData(start=start, state=value, sum=_sum[scope])
+            )
 
-        _label = "value_kW"
-        new_stats = {x: [] for x in self.maximeter_stats}
-        dt_from = (
-            dt_util.as_local(datetime(1970, 1, 1))
-            if dt_from is None
-            else dt_util.as_local(dt_from)
-        )
-        for data in self._edata.data.get("maximeter", {}):
-            dt_found = dt_util.as_local(data["datetime"])
-            if dt_found >= dt_from:
-                _p = "p1" if utils.get_pvpc_tariff(data["datetime"]) == "p1" else "p2"
-                new_stats[ALIAS_KW].append(
-                    StatisticData(
-                        start=dt_found.replace(minute=0),
-                        state=data[_label],
-                        max=data[_label],
-                    )
-                )
-                new_stats[_p + "_kW"].append(
-                    StatisticData(
-                        start=dt_found.replace(minute=0),
-                        state=data[_label],
-                        max=data[_label],
+        # consumptions and costs share timestamps, so local time and tariff
+        # are only computed once per timestamp
+        last_dt = None
+        for dt_naive, key, item in heapq.merge(
+            *[_stream(k, v) for k, v in dt_from.items()], key=lambda x: x[0]
+        ):
+            if dt_naive != last_dt:
+                if (
+                    last_dt is not None
+                    and (dt_naive.year, dt_naive.month) != (last_dt.year, last_dt.month)
+                    and len(batch) > 0
+                ):
+                    yield batch
+                    batch = {}
+                last_dt = dt_naive
+                dt_found = dt_util.as_local(dt_naive)
+                _p = utils.get_pvpc_tariff(dt_naive)
+
+            if key == "consumptions":
+                _add_sum(ALIAS_KWH, dt_found, item["value_kWh"])
+                _add_sum(_p + "_kWh", dt_found, item["value_kWh"])
+            elif key == "cost_hourly_sum":
+                _add_sum(ALIAS_POWER_EUR, dt_found, item["power_term"])
+                _add_sum(ALIAS_ENERGY_EUR, dt_found, item["energy_term"])
+                _add_sum(_p + "_" + ALIAS_ENERGY_EUR, dt_found, item["energy_term"])
+                _add_sum(ALIAS_EUR, dt_found, item["value_eur"])
+                _add_sum(_p + "_" + ALIAS_EUR, dt_found, item["value_eur"])
+            else:
+                for scope in (ALIAS_KW, ("p1" if _p == "p1" else "p2") + "_kW"):
+                    batch.setdefault(scope, []).append(
+                        StatisticData(
+                            start=dt_found.replace(minute=0),
+                            state=item["value_kW"],
+                            max=item["value_kW"],
+                        )
                     )
-                )
 
-        return new_stats
+        if len(batch) > 0:
+            yield batch
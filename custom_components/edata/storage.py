@@ -0,0 +1,24 @@
+"""Long-lived stores for e-data"""
+from __future__ import annotations
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from . import const
+
+
+@callback
+def async_get_store(hass: HomeAssistant, key: str) -> Store:
+    """Get the Store of a key, shared by every user of the key
+
+    Sharing a single Store per key lets delayed saves coalesce and makes loads
+    return data pending to be written. Pending saves are flushed by the Store
+    itself when Home Assistant stops.
+    """
+
+    stores = hass.data.setdefault(const.DATA_STORES, {})
+    if key not in stores:
+        stores[key] = Store(
+            hass, const.STORAGE_VERSION, f"{const.STORAGE_KEY_PREAMBLE}_{key}"
+        )
+    return stores[key]
@@ -1,7 +1,26 @@
 """Declarations of some package utilities"""
+from __future__ import annotations
+
+import importlib
+import os
+import sys
+from collections.abc import Iterable
+from typing import Any
+
+from homeassistant.core import HomeAssistant
 
 from . import const
 
+# heavy modules imported where first used (edata.helpers pulls pandas)
+DEFERRED_MODULES = (
+    "dateutil.relativedelta",
+    "edata.connectors.datadis",
+    "edata.connectors.redata",
+    "edata.helpers",
+    "edata.processors",
+    "edata.processors.billing",
+)
+
 
 def check_cups_integrity(cups: str):
     """Returns false if cups is not valid, true otherwise"""
@@ -27,3 +46,54 @@ def check_cups_integrity(cups: str):
         return False
 
     return True
+
+
+def get_billing_from_options(options: dict[str, Any]) -> dict[str, float] | None:
+    """Returns billing settings from config entry options, None if disabled"""
+
+    if not options.get(const.CONF_BILLING, False):
+        return None
+
+    is_pvpc = options.get(const.CONF_PVPC, False)
+    return {
+        const.CONF_PVPC: is_pvpc,
+        const.PRICE_P1_KW_YEAR: options.get(const.PRICE_P1_KW_YEAR),
+        const.PRICE_P2_KW_YEAR: options.get(const.PRICE_P2_KW_YEAR),
+        const.PRICE_P1_KWH: options.get(const.PRICE_P1_KWH) if not is_pvpc else None,
+        const.PRICE_P2_KWH: options.get(const.PRICE_P2_KWH) if not is_pvpc else None,
+        const.PRICE_P3_KWH: options.get(const.PRICE_P3_KWH) if not is_pvpc else None,
+        const.PRICE_METER_MONTH: options.get(const.PRICE_METER_MONTH),
+        const.PRICE_MARKET_KW_YEAR: options.get(const.PRICE_MARKET_KW_YEAR),
+        const.PRICE_ELECTRICITY_TAX: options.get(const.PRICE_ELECTRICITY_TAX),
+        const.PRICE_IVA: options.get(const.PRICE_IVA),
+    }
+
+
+def get_datadis_url() -> str | None:
+    """Return the Datadis server set in the environment, if any"""
+    return os.environ.get(const.ENV_DATADIS_URL) or None
+
+
+def _import_modules(modules: Iterable[str]) -> None:
+    """Import some modules (in the executor)"""
+    for module in modules:
+        importlib.import_module(module)
+
+
+async def async_import_deferred(
+    hass: HomeAssistant, modules: Iterable[str] = DEFERRED_MODULES
+) -> None:
+    """Import deferred modules in the executor, so that importing them later is free
+
+    Deferred imports run in the event loop where first used, and a module that
+    is not loaded yet would block it (HA warns about those imports).
+    """
+
+    missing = [x for x in modules if x not in sys.modules]
+    if len(missing) == 0:
+        return
+    # HA 2024.5 added an executor dedicated to imports
+    add_job = getattr(
+        hass, "async_add_import_executor_job", hass.async_add_executor_job
+    )
+    await add_job(_import_modules, missing)
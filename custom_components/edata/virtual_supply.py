@@ -0,0 +1,319 @@
+"""Aggregate virtual supply combining the statistics of several supplies"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+from array import array
+from typing import Any
+
+from homeassistant.const import CURRENCY_EURO, ENERGY_KILO_WATT_HOUR, POWER_KILO_WATT
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.util import dt as dt_util
+
+from . import const
+from .recorder import get_recorder
+from .storage import async_get_store
+
+_LOGGER = logging.getLogger(__name__)
+
+# member scopes that are combined (summed, but for maximeter), see stats.py aliases
+SUM_SCOPES = {
+    "kWh": (const.STAT_ID_KWH, const.STAT_TITLE_KWH, ENERGY_KILO_WATT_HOUR),
+    "p1_kWh": (const.STAT_ID_P1_KWH, const.STAT_TITLE_KWH, ENERGY_KILO_WATT_HOUR),
+    "p2_kWh": (const.STAT_ID_P2_KWH, const.STAT_TITLE_KWH, ENERGY_KILO_WATT_HOUR),
+    "p3_kWh": (const.STAT_ID_P3_KWH, const.STAT_TITLE_KWH, ENERGY_KILO_WATT_HOUR),
+    "eur": (const.STAT_ID_EUR, const.STAT_TITLE_EUR, CURRENCY_EURO),
+}
+MAX_SCOPES = {
+    "kW": (const.STAT_ID_KW, const.STAT_TITLE_KW, POWER_KILO_WATT),
+}
+
+# hours kept per member, older ones are folded into a base sum
+MAX_LEDGER_HOURS = 3 * 366 * 24
+
+
+def _combine(
+    arrays: list[array], since: int, until: int, use_max: bool
+) -> list[float | None]:
+    """Combine aligned member arrays hour by hour, None where no member has data"""
+
+    combined = []
+    for idx in range(since, until):
+        values = [x[idx] for x in arrays if idx < len(x) and not math.isnan(x[idx])]
+        if len(values) == 0:
+            combined.append(None)
+        else:
+            combined.append(max(values) if use_max else math.fsum(values))
+    return combined
+
+
+class EdataVirtualSupply:
+    """Combined kWh, EUR and maximeter statistics of the supplies opted in
+
+    Members report the statistic rows they import, which are kept in a ledger
+    of hourly values per member. The combined statistics are then imported
+    again only from the earliest hour that changed, so member histories are
+    never read back from the recorder.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self.id = const.VIRTUAL_SUPPLY_ID
+        self._recorder = get_recorder(hass)
+        self._store = async_get_store(hass, "virtual_supply")
+        self._lock = asyncio.Lock()
+        self._loaded = False
+        self._pending: list[tuple[str, str, list[tuple[int, float]]]] = []
+        self._metadata = {}
+
+        # hour index (hours since epoch) of the first ledger position
+        self.start: int | None = None
+        self.members: list[str] = []
+        self._base = {x: 0.0 for x in SUM_SCOPES}
+        self._values: dict[str, dict[str, array]] = {
+            x: {} for x in (*SUM_SCOPES, *MAX_SCOPES)
+        }
+        # running sums of combined values per position, not persisted
+        self._sums: dict[str, array] = {x: array("d") for x in SUM_SCOPES}
+
+    @property
+    def path(self) -> str:
+        """Get the file path of the persisted ledger"""
+        return self._store.path
+
+    async def _async_load(self) -> None:
+        """Restore the stored ledger, once"""
+
+        if self._loaded:
+            return
+        stored = await self._store.async_load()
+        self._loaded = True
+        if not stored:
+            return
+
+        def _restore():
+            self.start = stored["start"]
+            self.members = stored["members"]
+            self._base.update(stored["base"])
+            for scope, members in stored["values"].items():
+                if scope in self._values:
+                    self._values[scope] = {
+                        x: array("d", (math.nan if v is None else v for v in y))
+                        for x, y in members.items()
+                    }
+
+        await self.hass.async_add_executor_job(_restore)
+
+    def _data_to_save(self) -> dict[str, Any]:
+        """Build the data to be stored (NaN gaps become nulls)"""
+        return {
+            "start": self.start,
+            "members": self.members,
+            "base": self._base,
+            "values": {
+                x: {m: v.tolist() for m, v in y.items()}
+                for x, y in self._values.items()
+            },
+        }
+
+    def _save(self) -> None:
+        """Schedule a save of the ledger"""
+        self._store.async_delay_save(self._data_to_save, const.STORAGE_SAVE_DELAY)
+
+    async def async_has_member(self, member: str) -> bool:
+        """Return whether a supply has joined (and seeded) the virtual supply"""
+        await self._async_load()
+        return member in self.members
+
+    async def async_add_member(self, member: str) -> None:
+        """Mark a supply as joined, once its history has been reported"""
+
+        await self._async_load()
+        if member not in self.members:
+            self.members.append(member)
+            self._save()
+            _LOGGER.info("%s joined the %s virtual supply", member.upper(), self.id)
+
+    async def async_remove_member(self, member: str) -> None:
+        """Drop a supply from the virtual supply, importing it again from scratch"""
+
+        await self._async_load()
+        async with self._lock:
+            if member in self.members:
+                self.members.remove(member)
+            for values in self._values.values():
+                values.pop(member, None)
+            self._pending = [x for x in self._pending if x[0] != member]
+            # hours only that member had would remain, so statistics are wiped
+            await self._recorder.async_clear(
+                [x[0](self.id) for x in (*SUM_SCOPES.values(), *MAX_SCOPES.values())]
+            )
+            self._base = {x: 0.0 for x in SUM_SCOPES}
+            self._sums = {x: array("d") for x in SUM_SCOPES}
+            if all(len(x) == 0 for x in self._values.values()):
+                self.start = None
+            dirty = {x: 0 for x in self._values} if self.start is not None else {}
+            await self._async_import(dirty)
+        _LOGGER.info("%s left the %s virtual supply", member.upper(), self.id)
+
+    @callback
+    def record(self, member: str, scope: str, stats: list) -> None:
+        """Record statistic rows imported by a member, to be combined on flush"""
+
+        if scope not in self._values or len(stats) == 0:
+            return
+        self._pending.append(
+            (
+                member,
+                scope,
+                [(int(x["start"].timestamp()) // 3600, x["state"]) for x in stats],
+            )
+        )
+
+    async def async_flush(self) -> None:
+        """Combine recorded rows and import the statistics that changed"""
+
+        if len(self._pending) == 0:
+            return
+        await self._async_load()
+        async with self._lock:
+            pending, self._pending = self._pending, []
+            dirty = await self.hass.async_add_executor_job(self._apply, pending)
+            await self._async_import(dirty)
+
+    def _apply(self, pending: list) -> dict[str, int]:
+        """Write recorded rows into the ledger, returning the first change per scope"""
+
+        dirty = {}
+        for member, scope, rows in pending:
+            first, last = rows[0][0], rows[-1][0]
+            if self.start is None:
+                self.start = first
+            elif first < self.start:
+                # older rows (e.g., a backfill), every array grows at the front
+                pad = array("d", [math.nan]) * (self.start - first)
+                for values in self._values.values():
+                    for key, arr in values.items():
+                        values[key] = pad + arr
+                dirty = {x: y + self.start - first for x, y in dirty.items()}
+                self._sums = {x: array("d") for x in SUM_SCOPES}
+                self.start = first
+            arr = self._values[scope].setdefault(member, array("d"))
+            if len(arr) <= last - self.start:
+                arr.extend([math.nan] * (last - self.start + 1 - len(arr)))
+            for hour, value in rows:
+                arr[hour - self.start] = value
+            dirty[scope] = min(dirty.get(scope, first - self.start), first - self.start)
+
+        length = max(
+            (len(x) for y in self._values.values() for x in y.values()), default=0
+        )
+        if length > MAX_LEDGER_HOURS:
+            drop = length - MAX_LEDGER_HOURS
+            for scope, values in self._values.items():
+                if scope in SUM_SCOPES:
+                    self._base[scope] += math.fsum(
+                        x
+                        for x in _combine(list(values.values()), 0, drop, False)
+                        if x is not None
+                    )
+                for key, arr in values.items():
+                    values[key] = arr[drop:]
+            self.start += drop
+            self._sums = {x: array("d") for x in SUM_SCOPES}
+            dirty = {x: max(y - drop, 0) for x, y in dirty.items()}
+        return dirty
+
+    def _get_metadata(self, scope: str):
+        """Get the (fixed) metadata of a combined statistic"""
+        # pylint: disable=import-outside-toplevel
+        from homeassistant.components.recorder.models import StatisticMetaData
+
+        if scope not in self._metadata:
+            stat_id, title, unit = {**SUM_SCOPES, **MAX_SCOPES}[scope]
+            self._metadata[scope] = StatisticMetaData(
+                has_mean=scope in MAX_SCOPES,
+                has_sum=scope in SUM_SCOPES,
+                name=title(self.id, scope),
+                source=const.DOMAIN,
+                statistic_id=stat_id(self.id),
+                unit_of_measurement=unit,
+            )
+        return self._metadata[scope]
+
+    def _build(self, scope: str, since: int) -> list[tuple[int, float, float | None]]:
+        """Build combined rows (hour, state, sum) from a ledger position onwards"""
+
+        arrays = list(self._values[scope].values())
+        length = max((len(x) for x in arrays), default=0)
+        if scope in MAX_SCOPES:
+            combined = _combine(arrays, since, length, True)
+            return [
+                (self.start + idx, x, None)
+                for idx, x in enumerate(combined, since)
+                if x is not None
+            ]
+
+        # running sums before the first change are still valid
+        sums = self._sums[scope]
+        del sums[since:]
+        _sum = sums[-1] if len(sums) > 0 else 0.0
+        rows = []
+        for idx, value in enumerate(
+            _combine(arrays, len(sums), length, False), len(sums)
+        ):
+            if value is not None:
+                _sum += value
+            sums.append(_sum)
+            if idx >= since and value is not None:
+                rows.append((self.start + idx, value, self._base[scope] + _sum))
+        return rows
+
+    async def _async_import(self, dirty: dict[str, int]) -> None:
+        """Import combined statistics of the changed scopes"""
+        # pylint: disable=import-outside-toplevel
+        from homeassistant.components.recorder.models import StatisticData
+
+        for scope, since in dirty.items():
+            rows = await self.hass.async_add_executor_job(self._build, scope, since)
+            if len(rows) == 0:
+                continue
+            stats = [
+                StatisticData(
+                    start=dt_util.utc_from_timestamp(hour * 3600),
+                    state=state,
+                    max=state,
+                )
+                if _sum is None
+                else StatisticData(
+                    start=dt_util.utc_from_timestamp(hour * 3600), state=state, sum=_sum
+                )
+                for hour, state, _sum in rows
+            ]
+            self._recorder.async_import(self._get_metadata(scope), stats)
+            _LOGGER.debug(
+                "Imported %s combined %s statistics of %s", len(stats), scope, self.id
+            )
+        self._save()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return a JSON friendly summary"""
+        return {
+            "members": list(self.members),
+            "start": dt_util.utc_from_timestamp(self.start * 3600).isoformat()
+            if self.start is not None
+            else None,
+            "hours": max(
+                (len(x) for y in self._values.values() for x in y.values()), default=0
+            ),
+        }
+
+
+@callback
+def async_get_virtual_supply(hass: HomeAssistant) -> EdataVirtualSupply:
+    """Get the virtual supply, shared by every supply that opted in"""
+
+    if const.DATA_VIRTUAL_SUPPLY not in hass.data:
+        hass.data[const.DATA_VIRTUAL_SUPPLY] = EdataVirtualSupply(hass)
+    return hass.data[const.DATA_VIRTUAL_SUPPLY]
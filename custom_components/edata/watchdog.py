@@ -0,0 +1,145 @@
+"""Event loop blocking watchdog for e-data"""
+from __future__ import annotations
+
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+_LOGGER = logging.getLogger(__name__)
+
+MAX_SAMPLES = 5
+STACK_DEPTH = 12
+MIN_INTERVAL_S = 0.005
+
+
+class LoopWatchdog:
+    """Time synchronous sections run in the event loop, sampling stacks of slow ones
+
+    A sampler thread watches the section in progress and, once it runs longer
+    than the threshold, takes stack samples of the loop thread. Disabled (and
+    costless besides a function call) until a threshold is configured.
+    """
+
+    def __init__(self) -> None:
+        self._thresholds: dict[str, float] = {}
+        self.threshold: float | None = None
+        self.stats: dict[str, dict[str, float]] = {}
+        self._active: tuple[str, float, int, list[str]] | None = None
+        self._stop: threading.Event | None = None
+
+    def configure(self, owner: str, threshold_ms: int) -> None:
+        """Set the threshold requested by an owner (e.g., an entry), 0 to drop it"""
+
+        if threshold_ms > 0:
+            self._thresholds[owner] = threshold_ms / 1000
+        else:
+            self._thresholds.pop(owner, None)
+
+        # the most demanding owner wins
+        threshold = min(self._thresholds.values(), default=None)
+        if threshold == self.threshold:
+            return
+        self.threshold = threshold
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+        if threshold is not None:
+            self._stop = threading.Event()
+            threading.Thread(
+                target=self._sample,
+                args=(self._stop, max(threshold / 2, MIN_INTERVAL_S)),
+                name="edata_loop_watchdog",
+                daemon=True,
+            ).start()
+            _LOGGER.info("Watching event loop sections slower than %s s", threshold)
+
+    def _sample(self, stop: threading.Event, interval: float) -> None:
+        """Take stack samples of sections running past the threshold (sampler thread)"""
+
+        while not stop.wait(interval):
+            active = self._active
+            threshold = self.threshold
+            if active is None or threshold is None:
+                continue
+            _, start, thread_id, samples = active
+            if time.perf_counter() - start < threshold or len(samples) >= MAX_SAMPLES:
+                continue
+            frame = sys._current_frames().get(  # pylint: disable=protected-access
+                thread_id
+            )
+            if frame is not None:
+                samples.append(
+                    "".join(traceback.format_stack(frame, limit=STACK_DEPTH))
+                )
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        """Time a synchronous section run in the event loop (it must not await)"""
+
+        if self.threshold is None or self._active is not None:
+            # disabled, or nested within a section already being watched
+            yield
+            return
+
+        start = time.perf_counter()
+        samples: list[str] = []
+        self._active = (name, start, threading.get_ident(), samples)
+        try:
+            yield
+        finally:
+            self._active = None
+            self._account(name, time.perf_counter() - start, samples)
+
+    def _account(self, name: str, elapsed: float, samples: list[str]) -> None:
+        """Count a finished section, logging it if slow"""
+
+        stats = self.stats.setdefault(
+            name, {"calls": 0, "slow": 0, "max_s": 0, "total_s": 0}
+        )
+        stats["calls"] += 1
+        stats["total_s"] += elapsed
+        stats["max_s"] = max(stats["max_s"], elapsed)
+        if self.threshold is None or elapsed < self.threshold:
+            return
+
+        stats["slow"] += 1
+        _LOGGER.warning(
+            "%s blocked the event loop for %.3f s (%s slow out of %s)%s",
+            name,
+            elapsed,
+            stats["slow"],
+            stats["calls"],
+            "".join(f"\nStack sample {i + 1}:\n{x}" for i, x in enumerate(samples)),
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return a JSON friendly summary"""
+        return {
+            "threshold_s": self.threshold,
+            "sections": {
+                x: {k: round(v, 3) for k, v in y.items()} for x, y in self.stats.items()
+            },
+        }
+
+
+WATCHDOG = LoopWatchdog()
+
+
+def watched(name: str):
+    """Decorate a function run in the event loop so that it is watched"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with WATCHDOG.section(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
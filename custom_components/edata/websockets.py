@@ -1,24 +1,28 @@
 """Websockets related definitions"""
 
 import logging
+from datetime import datetime, timedelta
 
 import voluptuous as vol
 from homeassistant.components import websocket_api
 from homeassistant.core import callback
+from homeassistant.helpers import config_validation as cv
 
-from .const import DOMAIN
+from .const import DATA_COORDINATOR, DOMAIN, WS_QUARTERS_MAX_DAYS
+from .watchdog import watched
 
 _LOGGER = logging.getLogger(__name__)
 
 
 @callback
+@watched("websocket consumptions/daily")
 def websocket_get_daily_data(hass, connection, msg):
     """Publish daily consumptions list data."""
     try:
         data = hass.data[DOMAIN][msg["scups"].upper()].get("ws_consumptions_day", [])
         # served data is filtered so only last 'records' records are represented
-        connection.send_result(msg["id"], data[-msg.get("records", 30) :])
-    except KeyError as _:
+        connection.send_result(msg["id"], list(data[-msg.get("records", 30) :]))
+    except KeyError:
         _LOGGER.error(
             "The provided scups parameter is not correct: %s", msg["scups"].upper()
         )
@@ -28,14 +32,17 @@ def websocket_get_daily_data(hass, connection, msg):
 
 
 @callback
+@watched("websocket consumptions/monthly")
 def websocket_get_monthly_data(hass, connection, msg):
     """Publish monthly consumptions list data."""
     try:
         connection.send_result(
             msg["id"],
-            hass.data[DOMAIN][msg["scups"].upper()].get("ws_consumptions_month", []),
+            list(
+                hass.data[DOMAIN][msg["scups"].upper()].get("ws_consumptions_month", [])
+            ),
         )
-    except KeyError as _:
+    except KeyError:
         _LOGGER.error(
             "The provided scups parameter is not correct: %s", msg["scups"].upper()
         )
@@ -45,14 +52,39 @@ def websocket_get_monthly_data(hass, connection, msg):
 
 
 @callback
+@watched("websocket maximeter")
 def websocket_get_maximeter(hass, connection, msg):
     """Publish maximeter list data."""
     try:
         data = hass.data[DOMAIN][msg["scups"].upper()].get("ws_maximeter", [])
         if "tariff" in msg:
             data = [x for x in data if x[f"value_p{msg['tariff']}_kW"] > 0]
-        connection.send_result(msg["id"], data)
-    except KeyError as _:
+        connection.send_result(msg["id"], list(data))
+    except KeyError:
+        _LOGGER.error(
+            "The provided scups parameter is not correct: %s", msg["scups"].upper()
+        )
+    except Exception as _:
+        _LOGGER.exception("Unhandled exception when processing websockets: %s", _)
+        connection.send_result(msg["id"], [])
+
+
+@websocket_api.async_response
+async def websocket_get_quarter_hourly_data(hass, connection, msg):
+    """Publish quarter-hour consumptions of some days, read from storage."""
+    try:
+        coordinator = hass.data[DOMAIN][msg["scups"].upper()][DATA_COORDINATOR]
+        start = datetime.combine(msg["start"], datetime.min.time())
+        end = (
+            datetime.combine(msg.get("end", msg["start"]), datetime.min.time())
+            + timedelta(days=1)
+            - timedelta(minutes=1)
+        )
+        end = min(end, start + timedelta(days=WS_QUARTERS_MAX_DAYS))
+        connection.send_result(
+            msg["id"], await coordinator.quarters.async_get(start, end)
+        )
+    except KeyError:
         _LOGGER.error(
             "The provided scups parameter is not correct: %s", msg["scups"].upper()
         )
@@ -101,3 +133,17 @@ def async_register_websockets(hass):
             }
         ),
     )
+
+    # for quarter-hour consumptions, only kept in storage
+    hass.components.websocket_api.async_register_command(
+        f"{DOMAIN}/consumptions/quarter_hourly",
+        websocket_get_quarter_hourly_data,
+        websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+            {
+                vol.Required("type"): f"{DOMAIN}/consumptions/quarter_hourly",
+                vol.Required("scups"): str,
+                vol.Required("start"): cv.date,
+                vol.Optional("end"): cv.date,
+            }
+        ),
+    )
@@ -0,0 +1,356 @@
+"""Offline benchmarks for e-data data handling
+
+Runs the data handling stages of the integration over synthetic hourly data
+and reports wall time, peak memory and allocated blocks per stage. Needs the
+integration requirements (homeassistant, with the recorder ones, and e-data)
+but no network access nor a running instance: statistics are built for a
+recorder that drops them, and websocket replies are sent nowhere.
+
+    python scripts/benchmark.py --years 1 3 10 --supplies 1 10 50
+    python scripts/benchmark.py --save baseline
+    python scripts/benchmark.py --compare baseline
+
+Every round of a stage runs on its own shallow copy of the generated data, so
+stages (e.g., compaction) do not leak their output into the next ones.
+Baselines are stored under .benchmarks, out of git: timings only compare
+between runs on the same machine, so save one before a change and compare
+with it afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+# pylint: disable=wrong-import-position
+from custom_components.edata import const, stats, websockets  # noqa: E402
+from custom_components.edata.aggregates import EdataAggregator  # noqa: E402
+from custom_components.edata.coordinator import EdataCoordinator  # noqa: E402
+from custom_components.edata.series import (  # noqa: E402
+    CompactSeries,
+    compact_data,
+    estimate_nbytes,
+    expand_data,
+)
+from edata.processors import utils  # noqa: E402
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, ".benchmarks")
+ROUNDS = 3
+# larger cases (supplies times years) are skipped unless --all is given
+MAX_SUPPLY_YEARS = 150
+
+
+def generate_data(years: int, seed: int = 0) -> dict[str, list]:
+    """Generate EdataHelper-like data for some years of hourly readings"""
+
+    rand = random.Random(seed)
+    end = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end.replace(year=end.year - years)
+    hours = int((end - start) / timedelta(hours=1))
+
+    consumptions = []
+    costs = []
+    for i in range(hours):
+        dt = start + timedelta(hours=i)
+        value = round(rand.uniform(0.05, 2.5), 3)
+        consumptions.append(
+            {"datetime": dt, "delta_h": 1, "value_kWh": value, "real": True}
+        )
+        energy = round(value * 0.15, 3)
+        costs.append(
+            {
+                "datetime": dt,
+                "value_eur": round(energy + 0.01, 3),
+                "energy_term": energy,
+                "power_term": 0.009,
+                "others_term": 0.001,
+            }
+        )
+
+    return {
+        "supplies": [],
+        "contracts": [
+            {
+                "date_start": start,
+                "date_end": end,
+                "marketer": "",
+                "distributorCode": "2",
+                "power_p1": 4.6,
+                "power_p2": 4.6,
+            }
+        ],
+        "consumptions": consumptions,
+        "maximeter": [
+            {
+                "datetime": start + timedelta(days=i, hours=rand.randint(0, 23)),
+                "value_kW": round(rand.uniform(1, 4.6), 3),
+            }
+            for i in range(hours // 24)
+        ],
+        "pvpc": [],
+        "consumptions_daily_sum": [],
+        "consumptions_monthly_sum": [],
+        "cost_hourly_sum": costs,
+        "cost_daily_sum": [],
+        "cost_monthly_sum": [],
+    }
+
+
+def fake_helper(data: dict[str, list]) -> SimpleNamespace:
+    """Build the subset of EdataHelper used by the aggregator (billing disabled)"""
+
+    return SimpleNamespace(
+        data=data,
+        attributes={},
+        enable_billing=False,
+        is_pvpc=False,
+        process_supplies=lambda: None,
+        process_contracts=lambda: None,
+        process_maximeter=lambda: None,
+    )
+
+
+class StubRecorder:
+    """Recorder access dropping every import"""
+
+    def async_import(self, metadata, statistics) -> None:
+        """Drop statistics"""
+
+
+class StubConnection:
+    """Websocket connection counting the rows sent"""
+
+    def __init__(self) -> None:
+        self.rows = 0
+
+    def send_result(self, msg_id: int, result: list) -> None:
+        """Count the rows of a reply"""
+        self.rows += len(result)
+
+
+@contextmanager
+def stub_recorder():
+    """Make statistics helpers use the stub recorder, and no stores, meanwhile"""
+
+    with patch.multiple(
+        stats,
+        get_recorder=lambda hass: StubRecorder(),
+        async_get_store=lambda hass, key: None,
+    ):
+        yield
+
+
+def coordinator_for(data: dict) -> EdataCoordinator:
+    """Build the part of a coordinator used to process and load data"""
+
+    # pylint: disable=protected-access
+    coordinator = EdataCoordinator.__new__(EdataCoordinator)
+    coordinator._datadis = fake_helper(data)
+    coordinator._aggregator = EdataAggregator(coordinator._datadis, None)
+    coordinator._data = {const.DATA_ATTRIBUTES: {}}
+    return coordinator
+
+
+def copy_supplies(supplies: list[dict]) -> list[dict]:
+    """Copy supplies so that stages replacing series leave the originals alone"""
+    return [dict(data) for data in supplies]
+
+
+def stage_storage(supplies: list[dict]) -> None:
+    """Store round-trip: serialize, dump, load and deserialize"""
+    for data in supplies:
+        utils.deserialize_dict(
+            json.loads(json.dumps(utils.serialize_dict(expand_data(data))))
+        )
+
+
+def stage_compact(supplies: list[dict]) -> None:
+    """Compact every series, then expand it back"""
+    for data in supplies:
+        compact_data(data)
+        expand_data(data)
+
+
+def stage_aggregates_full(supplies: list[dict]) -> None:
+    """Compute aggregates from scratch"""
+    for data in supplies:
+        data["consumptions_daily_sum"] = []
+        data["consumptions_monthly_sum"] = []
+        EdataAggregator(fake_helper(data), None).process()
+
+
+def stage_aggregates_update(supplies: list[dict]) -> None:
+    """Update aggregates with a day of new consumptions"""
+    for data in supplies:
+        EdataAggregator(fake_helper(data), None).process(data["consumptions"][-24:])
+
+
+def stage_load_data(supplies: list[dict]) -> None:
+    """Process a day of new consumptions and load the result, as updates do"""
+    for data in supplies:
+        coordinator = coordinator_for(data)
+        # pylint: disable=protected-access
+        coordinator._process(data["consumptions"][-24:])
+        coordinator._load_data()
+
+
+def stage_statistics(supplies: list[dict]) -> None:
+    """Build every statistic (kWh, EUR and kW) from scratch"""
+    hass = SimpleNamespace(data={})
+    with stub_recorder():
+        for idx, data in enumerate(supplies):
+            helper = stats.EdataStatistics(
+                hass, f"x{idx:03d}", True, False, fake_helper(data)
+            )
+            # pylint: disable=protected-access
+            for _ in helper._iter_statistics(
+                {"consumptions": None, "cost_hourly_sum": None, "maximeter": None},
+                {},
+            ):
+                pass
+
+
+def stage_websockets(supplies: list[dict]) -> None:
+    """Serve a year of daily, and all monthly and maximeter data, per supply"""
+
+    hass = SimpleNamespace(data={const.DOMAIN: {}})
+    connection = StubConnection()
+    for idx, data in enumerate(supplies):
+        scups = f"X{idx:03d}"
+        hass.data[const.DOMAIN][scups] = {
+            const.WS_CONSUMPTIONS_DAY: data["consumptions_daily_sum"],
+            const.WS_CONSUMPTIONS_MONTH: data["consumptions_monthly_sum"],
+            const.WS_MAXIMETER: data["maximeter"],
+        }
+        for handler, msg in (
+            (websockets.websocket_get_daily_data, {"records": 365}),
+            (websockets.websocket_get_monthly_data, {}),
+            (websockets.websocket_get_maximeter, {}),
+        ):
+            handler(hass, connection, {"id": 1, "scups": scups, **msg})
+
+
+def print_series_sizes(data: dict[str, list]) -> None:
+    """Print the memory used per row by the largest series, as lists and compact"""
+
+    for key in ("consumptions", "cost_hourly_sum"):
+        rows = data[key]
+        series = CompactSeries.from_dicts(rows)
+        if not rows or series is None:
+            continue
+        print(
+            f"{key}: {estimate_nbytes(rows) / len(rows):.0f} -> "
+            f"{estimate_nbytes(series) / len(rows):.0f} bytes/row"
+        )
+
+
+STAGES = [
+    ("storage", stage_storage),
+    ("compact", stage_compact),
+    ("aggregates_full", stage_aggregates_full),
+    ("aggregates_update", stage_aggregates_update),
+    ("load_data", stage_load_data),
+    ("statistics", stage_statistics),
+    ("websockets", stage_websockets),
+]
+
+
+def measure(func, supplies: list[dict]) -> dict[str, float]:
+    """Measure the best wall time, and peak memory and allocations of a run"""
+
+    timings = []
+    for _ in range(ROUNDS):
+        copies = copy_supplies(supplies)
+        gc.collect()
+        start = time.perf_counter()
+        func(copies)
+        timings.append(time.perf_counter() - start)
+        del copies
+
+    copies = copy_supplies(supplies)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    func(copies)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(max(x.count_diff, 0) for x in after.compare_to(before, "lineno"))
+
+    return {
+        "min_s": min(timings),
+        "mean_s": sum(timings) / len(timings),
+        "peak_mib": peak / 2**20,
+        "blocks": blocks,
+    }
+
+
+def main() -> None:
+    """Run the benchmarks"""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 3, 10])
+    parser.add_argument("--supplies", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help=f"run cases above {MAX_SUPPLY_YEARS} supply-years too (several GiB)",
+    )
+    parser.add_argument("--save", help="store results as a named baseline")
+    parser.add_argument("--compare", help="compare results with a named baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(
+            os.path.join(BENCHMARKS_DIR, f"{args.compare}.json"), encoding="utf8"
+        ) as file:
+            baseline = json.load(file)
+
+    results = {}
+    print(
+        f"{'name':<40}{'min (s)':>10}{'mean (s)':>10}{'peak (MiB)':>12}"
+        f"{'blocks':>10}{'vs base':>10}"
+    )
+    for years in args.years:
+        for n_supplies in args.supplies:
+            if years * n_supplies > MAX_SUPPLY_YEARS and not args.all:
+                print(f"{years}y-{n_supplies}s skipped, use --all to run it")
+                continue
+            supplies = [generate_data(years, seed) for seed in range(n_supplies)]
+            print_series_sizes(supplies[0])
+            for stage, func in STAGES:
+                name = f"{stage}[{years}y-{n_supplies}s]"
+                result = results[name] = measure(func, supplies)
+                ratio = (
+                    f"{result['min_s'] / baseline[name]['min_s']:.2f}x"
+                    if name in baseline
+                    else "-"
+                )
+                print(
+                    f"{name:<40}{result['min_s']:>10.4f}{result['mean_s']:>10.4f}"
+                    f"{result['peak_mib']:>12.1f}{result['blocks']:>10}{ratio:>10}"
+                )
+            del supplies
+
+    if args.save:
+        os.makedirs(BENCHMARKS_DIR, exist_ok=True)
+        with open(
+            os.path.join(BENCHMARKS_DIR, f"{args.save}.json"), "w", encoding="utf8"
+        ) as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+"""Local stand-in for the Datadis API, for load testing e-data
+
+Serves the endpoints used by edata's DatadisConnector with synthetic, but
+deterministic, payloads for any number of supplies. Latency, errors and query
+quotas can be injected, and sessions can be recorded (either the synthetic
+responses or those of the real API, proxied) and replayed later.
+
+    python scripts/fake_datadis.py --supplies 200 --latency 0.5 --error-rate 0.05
+    python scripts/fake_datadis.py --upstream https://datadis.es --record session.jsonl
+    python scripts/fake_datadis.py --replay session.jsonl
+
+Home Assistant is pointed to it through the environment before starting:
+
+    EDATA_DATADIS_URL=http://127.0.0.1:8080 hass -c config
+
+Any username and password are accepted unless --username/--password are given.
+Note that the connector remembers recent queries in a file under /tmp and
+will not repeat them within 24h, remove it to start a fresh session.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PATH_TOKEN = "/nikola-auth/tokens/login"
+PATH_SUPPLIES = "/api-private/api/get-supplies"
+PATH_CONTRACTS = "/api-private/api/get-contract-detail"
+PATH_CONSUMPTIONS = "/api-private/api/get-consumption-data"
+PATH_MAXIMETER = "/api-private/api/get-max-power"
+
+CUPS_CONTROL_DIGITS = "TRWAGMYFPDXBNJZSQVHLCKE"
+DISTRIBUTORS = {"2": "E-DISTRIBUCIÓN", "3": "I-DE", "4": "UFD", "8": "VIESGO"}
+
+
+def make_cups(index: int) -> str:
+    """Build a valid CUPS for a supply index"""
+
+    digits = f"0031{index:012d}"
+    base = int(digits) % 529
+    return (
+        f"ES{digits}"
+        f"{CUPS_CONTROL_DIGITS[base // 23]}{CUPS_CONTROL_DIGITS[base % 23]}0F"
+    )
+
+
+def parse_month(value: str) -> date:
+    """Parse a YYYY/MM query value"""
+    return datetime.strptime(value, "%Y/%m").date()
+
+
+def next_month(a_date: date) -> date:
+    """Return the first day of the month after a date's month"""
+    return (a_date.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+class SyntheticData:
+    """Deterministic payloads for a set of simulated supplies"""
+
+    def __init__(self, n_supplies: int, years: int) -> None:
+        self.supplies = {make_cups(i): i for i in range(n_supplies)}
+        today = date.today()
+        self.date_from = today.replace(year=today.year - years, day=1)
+
+    def _rand(self, cups: str, *key) -> random.Random:
+        """Seed a random generator from a supply and a key"""
+        return random.Random(f"{cups}{key}")
+
+    def get_supplies(self) -> list[dict]:
+        """Payload of get-supplies"""
+
+        result = []
+        for cups, idx in self.supplies.items():
+            code = list(DISTRIBUTORS)[idx % len(DISTRIBUTORS)]
+            result.append(
+                {
+                    "address": f"CALLE FALSA {idx}",
+                    "cups": cups,
+                    "postalCode": f"{28000 + idx % 1000:05d}",
+                    "province": "MADRID",
+                    "municipality": "MADRID",
+                    "distributor": DISTRIBUTORS[code],
+                    "validDateFrom": self.date_from.strftime("%Y/%m/%d"),
+                    "validDateTo": "",
+                    "pointType": 5,
+                    "distributorCode": code,
+                }
+            )
+        return result
+
+    def get_contracts(self, cups: str) -> list[dict]:
+        """Payload of get-contract-detail"""
+
+        power = round(self._rand(cups).choice((3.3, 3.45, 4.6, 5.75, 6.9)), 2)
+        return [
+            {
+                "startDate": self.date_from.strftime("%Y/%m/%d"),
+                "endDate": "",
+                "marketer": "COMERCIALIZADORA FALSA",
+                "contractedPowerkW": [power, power],
+            }
+        ]
+
+    def get_consumptions(
+        self, cups: str, start: date, end: date, quarter_hourly: bool = False
+    ) -> list[dict]:
+        """Payload of get-consumption-data, hourly (or quarter-hourly) by month"""
+
+        result = []
+        last = min(next_month(end), date.today())
+        month = start
+        while month < last:
+            rand = self._rand(cups, month)
+            base = rand.uniform(0.1, 0.4)
+            day = month
+            while day < min(next_month(month), last):
+                for hour in range(24):
+                    # daily profile with peaks at noon and evening
+                    value = base * (
+                        1
+                        + math.sin(math.pi * hour / 24) ** 2
+                        + (1.5 if 19 <= hour <= 22 else 0)
+                    ) + rand.uniform(0, 0.3)
+                    method = "Real" if rand.random() > 0.01 else "Estimada"
+                    # times are the end of each interval
+                    steps = (
+                        [(hour, 15), (hour, 30), (hour, 45), (hour + 1, 0)]
+                        if quarter_hourly
+                        else [(hour + 1, 0)]
+                    )
+                    for step_hour, step_minute in steps:
+                        result.append(
+                            {
+                                "cups": cups,
+                                "date": day.strftime("%Y/%m/%d"),
+                                "time": f"{step_hour:02d}:{step_minute:02d}",
+                                "consumptionKWh": round(value / len(steps), 3),
+                                "obtainMethod": method,
+                            }
+                        )
+                day += timedelta(days=1)
+            month = next_month(month)
+        return result
+
+    def get_maximeter(self, cups: str, start: date, end: date) -> list[dict]:
+        """Payload of get-max-power, daily from start to end months"""
+
+        power = self.get_contracts(cups)[0]["contractedPowerkW"][0]
+        result = []
+        last = min(next_month(end), date.today())
+        day = start
+        while day < last:
+            rand = self._rand(cups, "max", day)
+            hour, minute = rand.randint(0, 23), rand.choice((0, 15, 30, 45))
+            result.append(
+                {
+                    "cups": cups,
+                    "date": day.strftime("%Y/%m/%d"),
+                    "time": f"{hour:02d}:{minute:02d}",
+                    "maxPower": round(rand.uniform(0.3, 1.1) * power, 3),
+                }
+            )
+            day += timedelta(days=1)
+        return result
+
+
+class Session:
+    """Recorded responses, keyed by request"""
+
+    def __init__(self, replay: str | None, record: str | None) -> None:
+        self._responses: dict[str, tuple[int, str]] = {}
+        self._lock = threading.Lock()
+        self._file = open(record, "a", encoding="utf8") if record else None
+        if replay:
+            with open(replay, encoding="utf8") as file:
+                for line in file:
+                    item = json.loads(line)
+                    self._responses[item["key"]] = (item["status"], item["body"])
+
+    @staticmethod
+    def key(method: str, path: str, query: dict) -> str:
+        """Identify a request, ignoring credentials"""
+        return f"{method} {path}?{urllib.parse.urlencode(sorted(query.items()))}"
+
+    def get(self, key: str) -> tuple[int, str] | None:
+        """Get a recorded response"""
+        return self._responses.get(key)
+
+    def record(self, key: str, status: int, body: str) -> None:
+        """Append a response to the record file"""
+
+        if self._file is None:
+            return
+        with self._lock:
+            self._file.write(
+                json.dumps({"key": key, "status": status, "body": body}) + "\n"
+            )
+            self._file.flush()
+
+
+class FakeDatadisServer(ThreadingHTTPServer):
+    """HTTP server holding the fake service state"""
+
+    daemon_threads = True
+
+    def __init__(self, address, args: argparse.Namespace) -> None:
+        super().__init__(address, FakeDatadisHandler)
+        self.args = args
+        self.data = SyntheticData(args.supplies, args.years)
+        self.session = Session(args.replay, args.record)
+        self.tokens: set[str] = set()
+        self.queries: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.rand = random.Random(args.seed)
+
+
+class FakeDatadisHandler(BaseHTTPRequestHandler):
+    """Request handler mimicking the Datadis API"""
+
+    server: FakeDatadisServer
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        if self.server.args.verbose:
+            super().log_message(format, *args)
+
+    def _reply(self, status: int, body: str) -> None:
+        payload = body.encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _inject(self) -> int | None:
+        """Apply the configured latency and random errors"""
+
+        args = self.server.args
+        if args.latency > 0:
+            time.sleep(self.server.rand.uniform(0.5, 1.5) * args.latency)
+        if self.server.rand.random() < args.error_rate:
+            return self.server.rand.choice((500, 502, 504))
+        return None
+
+    def _proxy(self, method: str, path: str, body: bytes | None) -> tuple[int, str]:
+        """Forward a request to the upstream API"""
+
+        request = urllib.request.Request(
+            self.server.args.upstream.rstrip("/") + path,
+            data=body,
+            method=method,
+            headers={
+                x: self.headers[x]
+                for x in ("Authorization", "Content-Type")
+                if x in self.headers
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, response.read().decode("utf8")
+        except urllib.error.HTTPError as ex:
+            return ex.code, ex.read().decode("utf8")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Login"""
+
+        url = urllib.parse.urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if url.path != PATH_TOKEN:
+            self._reply(404, "")
+            return
+
+        args = self.server.args
+        if args.upstream:
+            # tokens are never recorded, replays accept any credentials
+            self._reply(*self._proxy("POST", self.path, body))
+            return
+
+        form = dict(urllib.parse.parse_qsl(body.decode("utf8")))
+        if (args.username and form.get("username") != args.username) or (
+            args.password and form.get("password") != args.password
+        ):
+            self._reply(401, "")
+            return
+
+        token = secrets.token_hex(16)
+        with self.server.lock:
+            self.server.tokens.add(token)
+        self._reply(200, token)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Data queries"""
+
+        server = self.server
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        key = Session.key("GET", url.path, query)
+
+        if not server.args.upstream:
+            token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+            if token not in server.tokens:
+                self._reply(401, "")
+                return
+
+        error = self._inject()
+        if error is not None:
+            self._reply(error, "")
+            return
+
+        if server.args.quota > 0:
+            # datadis limits identical queries per day, here they are limited per run
+            with server.lock:
+                server.queries[key] = server.queries.get(key, 0) + 1
+                exceeded = server.queries[key] > server.args.quota
+            if exceeded:
+                self._reply(429, "")
+                return
+
+        recorded = server.session.get(key)
+        if recorded is not None:
+            self._reply(*recorded)
+            return
+
+        if server.args.upstream:
+            status, body = self._proxy("GET", self.path, None)
+        else:
+            status, body = self._synthetic(url.path, query)
+        if status == 200:
+            server.session.record(key, status, body)
+        self._reply(status, body)
+
+    def _synthetic(self, path: str, query: dict) -> tuple[int, str]:
+        """Build a synthetic response"""
+
+        data = self.server.data
+        if path == PATH_SUPPLIES:
+            return 200, json.dumps(data.get_supplies())
+
+        cups = query.get("cups", "").upper()
+        if cups not in data.supplies:
+            return 200, ""
+        if path == PATH_CONTRACTS:
+            return 200, json.dumps(data.get_contracts(cups))
+        if path not in (PATH_CONSUMPTIONS, PATH_MAXIMETER):
+            return 404, ""
+
+        try:
+            start = max(parse_month(query["startDate"]), data.date_from)
+            end = parse_month(query["endDate"])
+        except (KeyError, ValueError):
+            return 400, ""
+        if path == PATH_CONSUMPTIONS:
+            return 200, json.dumps(
+                data.get_consumptions(
+                    cups, start, end, query.get("measurementType") == "1"
+                )
+            )
+        return 200, json.dumps(data.get_maximeter(cups, start, end))
+
+
+def main() -> None:
+    """Run the server"""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--supplies", type=int, default=1, help="simulated supplies")
+    parser.add_argument("--years", type=int, default=2, help="years of history")
+    parser.add_argument("--username", help="only accept this username")
+    parser.add_argument("--password", help="only accept this password")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="mean response delay (s)"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="ratio of 5xx responses"
+    )
+    parser.add_argument(
+        "--quota", type=int, default=0, help="identical queries before a 429"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="seed of the injections")
+    parser.add_argument("--upstream", help="proxy to this API instead of faking it")
+    parser.add_argument("--record", help="append successful responses to a file")
+    parser.add_argument("--replay", help="serve the responses of a recorded file")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    server = FakeDatadisServer((args.host, args.port), args)
+    print(f"Fake datadis listening on http://{args.host}:{args.port}")
+    for cups in list(server.data.supplies)[:5]:
+        print(f"  {cups}")
+    if len(server.data.supplies) > 5:
+        print(f"  ... and {len(server.data.supplies) - 5} more")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Tests for the e-data integration"""
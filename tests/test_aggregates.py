@@ -0,0 +1,131 @@
+"""Incremental aggregates"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("edata")
+
+# pylint: disable=wrong-import-position
+from custom_components.edata.aggregates import EdataAggregator  # noqa: E402
+
+JANUARY = datetime(2023, 1, 1)
+FEBRUARY = datetime(2023, 2, 1)
+
+
+def _helper(hours: int):
+    """An EdataHelper look-alike holding some hourly consumptions"""
+
+    def _noop():
+        pass
+
+    return SimpleNamespace(
+        data={
+            "consumptions": [
+                {"datetime": JANUARY + timedelta(hours=x), "delta_h": 1, "value_kWh": 1}
+                for x in range(hours)
+            ],
+            "consumptions_daily_sum": [],
+            "consumptions_monthly_sum": [],
+            "cost_hourly_sum": [],
+            "cost_daily_sum": [],
+            "cost_monthly_sum": [],
+        },
+        attributes={},
+        enable_billing=False,
+        process_supplies=_noop,
+        process_contracts=_noop,
+        process_maximeter=_noop,
+    )
+
+
+def test_dirty_months_survive_failures(monkeypatch):
+    """Months stay dirty until they are processed without errors"""
+
+    helper = _helper(24 * 40)
+    aggregator = EdataAggregator(helper, prices=None)
+    aggregator.process()
+    assert aggregator.dirty == set()
+
+    process = EdataAggregator._process_consumptions  # pylint: disable=protected-access
+
+    def _failing(self, month):
+        if month == FEBRUARY:
+            raise ValueError
+        process(self, month)
+
+    monkeypatch.setattr(EdataAggregator, "_process_consumptions", _failing)
+    aggregator.process(helper.data["consumptions"][-24:])
+    assert aggregator.dirty == {FEBRUARY}
+
+    # restored, e.g., from storage after a restart
+    monkeypatch.setattr(EdataAggregator, "_process_consumptions", process)
+    aggregator = EdataAggregator(helper, None, aggregator.dirty)
+    aggregator.process()
+    assert aggregator.dirty == set()
+    assert [x["value_kWh"] for x in helper.data["consumptions_monthly_sum"]] == [
+        24 * 31,
+        24 * 9,
+    ]
+
+
+def test_dirty_months_out_of_window():
+    """Dirty months older than the oldest consumption are dropped"""
+
+    aggregator = EdataAggregator(_helper(24), None, {datetime(2022, 6, 1)})
+    aggregator.process()
+    assert aggregator.dirty == set()
+
+
+class _Prices:
+    """EdataPriceCache look-alike knowing prices until a given datetime"""
+
+    def __init__(self) -> None:
+        self.until = JANUARY
+
+    def get(self, date_from: datetime, date_to: datetime) -> list[dict]:
+        return [
+            {"datetime": x, "value_eur_kWh": 0.1, "delta_h": 1}
+            for x in (date_from + timedelta(hours=h) for h in range(24 * 31))
+            if x < min(date_to, self.until)
+        ]
+
+
+def test_dirty_months_lacking_prices(monkeypatch):
+    """PVPC months are billed once their prices are known"""
+
+    # pylint: disable=import-outside-toplevel
+    from edata.processors import billing
+
+    billed = []
+
+    class _Billing:
+        def __init__(self, billing_input) -> None:
+            billed.append(billing_input["consumptions"][0]["datetime"])
+            self.output = {"hourly": [], "daily": [], "monthly": []}
+
+    monkeypatch.setattr(billing, "BillingProcessor", _Billing)
+    helper = _helper(24 * 40)
+    helper.enable_billing = True
+    helper.is_pvpc = True
+    helper.pricing_rules = None
+    helper.data["contracts"] = []
+    prices = _Prices()
+    aggregator = EdataAggregator(helper, prices)
+
+    aggregator.process()
+    assert aggregator.dirty == {JANUARY, FEBRUARY}
+    assert not billed
+
+    prices.until = FEBRUARY
+    aggregator.process()
+    assert aggregator.dirty == {FEBRUARY}
+    assert billed == [JANUARY]
+
+    prices.until = FEBRUARY + timedelta(days=9)
+    aggregator.process()
+    assert aggregator.dirty == set()
+    # the oldest month is processed on every update
+    assert billed[1:] == [JANUARY, FEBRUARY]
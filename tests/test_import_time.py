@@ -0,0 +1,90 @@
+"""Import-time budget of the integration modules"""
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("homeassistant")
+pytest.importorskip("edata")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cumulative import time allowed for each entry point, once HA is loaded
+IMPORT_BUDGET_MS = 150
+
+# modules the integration must load only on first use
+DEFERRED = (
+    "pandas",
+    "edata.helpers",
+    "edata.connectors.datadis",
+    "dateutil.relativedelta",
+)
+
+# HA modules the integration builds on, loaded before it in a real instance
+PRELOADED = (
+    "homeassistant.core",
+    "homeassistant.config_entries",
+    "homeassistant.components.diagnostics",
+    "homeassistant.components.sensor",
+    "homeassistant.components.websocket_api",
+    "homeassistant.helpers.config_validation",
+    "homeassistant.helpers.entity_platform",
+    "homeassistant.helpers.storage",
+    "homeassistant.helpers.update_coordinator",
+)
+
+ENTRY_POINTS = (
+    "custom_components.edata",
+    "custom_components.edata.config_flow",
+    "custom_components.edata.sensor",
+)
+
+
+def _import_times(module: str) -> dict[str, int]:
+    """Import a module after HA in a new interpreter, returning times in us"""
+
+    preload = "; ".join(f"import {x}" for x in PRELOADED)
+    # modules HA already pulled in are not reported again
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"{preload}; import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name] = int(cumulative)
+    return times
+
+
+@pytest.fixture(scope="module", params=ENTRY_POINTS)
+def import_times(request) -> tuple[str, dict[str, int]]:
+    """Import times of an entry point"""
+    return request.param, _import_times(request.param)
+
+
+def test_heavy_modules_are_deferred(import_times):
+    """Importing an entry point does not load modules meant for first use"""
+
+    _, times = import_times
+    loaded = {x.strip() for x in times}
+    assert [x for x in DEFERRED if x in loaded] == []
+
+
+def test_import_budget(import_times):
+    """Importing an entry point stays within the budget"""
+
+    module, times = import_times
+    # top level lines (a single leading space) hold cumulative times
+    spent_ms = (
+        sum(y for x, y in times.items() if x.startswith(" custom_components")) / 1000
+    )
+    assert spent_ms < IMPORT_BUDGET_MS, f"{module} took {spent_ms:.1f} ms to import"
@@ -0,0 +1,119 @@
+"""Quarter-hour consumptions"""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("homeassistant")
+pytest.importorskip("edata")
+
+# pylint: disable=wrong-import-position
+from custom_components.edata import fetcher  # noqa: E402
+from custom_components.edata.quarters import (  # noqa: E402
+    MEASUREMENT_TYPE_QUARTER_HOURLY,
+    fill_hours,
+    lacks_hours,
+)
+
+MONTH = datetime(2023, 3, 1)
+# the meter sends quarters from the 15th on
+SWITCH = datetime(2023, 3, 15)
+END = datetime(2023, 3, 31, 23, 59)
+
+
+def _hour(start: datetime) -> dict:
+    return {"datetime": start, "delta_h": 1, "value_kWh": 1.0, "real": True}
+
+
+def _reply(since: datetime, until: datetime, step: timedelta) -> list[dict]:
+    """A Datadis consumptions reply, whose times are the end of each interval"""
+    rows = []
+    start = since
+    while start < until:
+        end = start + step
+        day = start.replace(hour=0, minute=0)
+        rows.append(
+            {
+                "date": day.strftime("%Y/%m/%d"),
+                "time": f"{(end - day) // timedelta(hours=1):02d}:{end.minute:02d}",
+                "consumptionKWh": 1.0 if step == timedelta(hours=1) else 0.25,
+                "obtainMethod": "Real",
+            }
+        )
+        start = end
+    return rows
+
+
+def test_lacks_hours():
+    """Gaps count, but the hour skipped by daylight saving time does not"""
+
+    full = [_hour(MONTH + timedelta(hours=x)) for x in range(48)]
+    assert not lacks_hours(full, MONTH)
+    assert not lacks_hours(full[:2] + full[3:], MONTH)
+    assert lacks_hours(full[24:], MONTH)
+    assert lacks_hours(full[:10] + full[20:], MONTH)
+
+
+def test_fill_hours():
+    """Hours built from quarters take precedence over hourly ones"""
+
+    from_quarters = [
+        {**_hour(MONTH + timedelta(hours=x)), "value_kWh": 2.0} for x in (2, 3)
+    ]
+    hourly = [_hour(MONTH + timedelta(hours=x)) for x in range(4)]
+    assert [x["value_kWh"] for x in fill_hours(from_quarters, hourly)] == [
+        1.0,
+        1.0,
+        2.0,
+        2.0,
+    ]
+
+
+class _Quarters:
+    """EdataQuarters look-alike keeping quarters in memory"""
+
+    def __init__(self) -> None:
+        self.quarters = []
+
+    async def async_is_unsupported(self) -> bool:
+        return False
+
+    async def async_report(self, found: bool) -> None:
+        pass
+
+    async def async_add(self, quarters: list[dict]) -> None:
+        self.quarters.extend(quarters)
+
+
+def test_mixed_month():
+    """A month metered by hours and then by quarters has every hour"""
+
+    requests = []
+
+    async def _request(url, data):
+        requests.append(data["measurementType"])
+        if data["measurementType"] == MEASUREMENT_TYPE_QUARTER_HOURLY:
+            return fetcher.OUTCOME_OK, _reply(SWITCH, END, timedelta(minutes=15))
+        return fetcher.OUTCOME_OK, _reply(MONTH, SWITCH, timedelta(hours=1))
+
+    instance = fetcher.EdataFetcher.__new__(fetcher.EdataFetcher)
+    instance.cups = "ES0000000000000000XX"
+    instance.authorized_nif = None
+    instance.quarters = _Quarters()
+    instance._async_datadis_request = _request  # pylint: disable=protected-access
+
+    key, rows, outcome = asyncio.run(
+        instance._async_fetch_consumptions(  # pylint: disable=protected-access
+            "2", "5", {"from": MONTH, "to": END}
+        )
+    )
+    assert (key, outcome) == ("consumptions", fetcher.OUTCOME_OK)
+    assert requests == [MEASUREMENT_TYPE_QUARTER_HOURLY, "0"]
+    hours = [x["datetime"] for x in rows]
+    assert hours == sorted(set(hours))
+    # March 2023 has 31 days, in naive local time
+    assert len(hours) == 31 * 24
+    assert all(x["value_kWh"] == 1.0 for x in rows)
+    assert len(instance.quarters.quarters) == 17 * 24 * 4
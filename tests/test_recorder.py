@@ -0,0 +1,138 @@
+"""Recorder access layer, against a local SQLite database"""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("homeassistant.components.recorder.db_schema")
+
+# pylint: disable=wrong-import-position
+from homeassistant.components.recorder.db_schema import (  # noqa: E402
+    Base,
+    Statistics,
+    StatisticsMeta,
+)
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from custom_components.edata import recorder  # noqa: E402
+
+RECORDERS = (
+    recorder.EdataRecorder,
+    recorder._DatetimeRecorder,  # pylint: disable=protected-access
+    recorder._LegacyRecorder,  # pylint: disable=protected-access
+)
+
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+HOURS = {"edata:xxxx_consumption": 48, "edata:xxxx_cost": 24}
+
+
+@pytest.fixture(name="session")
+def fixture_session():
+    """Session of an in-memory recorder database holding hourly statistics"""
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        for statistic_id, hours in {**HOURS, "edata:xxxx_empty": 0}.items():
+            meta = StatisticsMeta(
+                statistic_id=statistic_id,
+                source="edata",
+                unit_of_measurement="kWh",
+                has_mean=False,
+                has_sum=True,
+                name=None,
+            )
+            session.add(meta)
+            session.flush()
+            for hour in range(hours):
+                start = START + timedelta(hours=hour)
+                session.add(
+                    Statistics(
+                        metadata_id=meta.id,
+                        # legacy schemas used the datetime column, naive UTC
+                        start=start.replace(tzinfo=None),
+                        start_ts=start.timestamp(),
+                        state=1.0,
+                        sum=hour + 1.0,
+                        max=float(hour),
+                    )
+                )
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+@pytest.mark.parametrize("cls", RECORDERS)
+def test_last_statistics(session, cls):
+    """The last row of every id is read, with UTC timestamps for start and end"""
+
+    ids = [*HOURS, "edata:xxxx_empty", "edata:xxxx_unknown"]
+    # pylint: disable=protected-access
+    last = cls._last_statistics(session, ids, {"max", "sum"})
+
+    assert last["edata:xxxx_empty"] is None
+    assert last["edata:xxxx_unknown"] is None
+    for statistic_id, hours in HOURS.items():
+        start = (START + timedelta(hours=hours - 1)).timestamp()
+        assert last[statistic_id] == {
+            "start": start,
+            "end": start + 3600,
+            "max": hours - 1.0,
+            "sum": float(hours),
+        }
+
+
+@pytest.mark.parametrize("cls", RECORDERS)
+def test_last_statistics_single_query(session, cls):
+    """Many ids cost a single statement"""
+    # pylint: disable=import-outside-toplevel
+    from sqlalchemy import event
+
+    statements = []
+    engine = session.get_bind()
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        cls._last_statistics(  # pylint: disable=protected-access
+            session, list(HOURS), {"sum"}
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len(statements) == 1
+
+
+@pytest.mark.parametrize(
+    "version, cls",
+    [
+        ((2022, 11), recorder._LegacyRecorder),  # pylint: disable=protected-access
+        ((2023, 2), recorder._DatetimeRecorder),  # pylint: disable=protected-access
+        ((2023, 3), recorder.EdataRecorder),
+    ],
+)
+def test_get_recorder(monkeypatch, version, cls):
+    """The access layer is chosen by HA version"""
+
+    monkeypatch.setattr(recorder, "MAJOR_VERSION", version[0])
+    monkeypatch.setattr(recorder, "MINOR_VERSION", version[1])
+    monkeypatch.setattr(recorder, "get_db_instance", lambda hass: hass)
+    assert type(recorder.get_recorder(object())) is cls  # noqa: E721
+
+
+def test_clear_waits_for_recorder(monkeypatch):
+    """Clearing returns only once the queued clear has run"""
+
+    calls = []
+
+    class _Instance:
+        def async_clear_statistics(self, statistic_ids):
+            calls.append(("clear", statistic_ids))
+
+        async def async_block_till_done(self):
+            calls.append(("done", None))
+
+    monkeypatch.setattr(recorder, "get_db_instance", lambda hass: _Instance())
+    asyncio.run(recorder.EdataRecorder(object()).async_clear(["edata:xxxx_cost"]))
+    assert calls == [("clear", ["edata:xxxx_cost"]), ("done", None)]